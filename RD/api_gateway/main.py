@@ -9,6 +9,18 @@ import jwt
 from fastapi.security import OAuth2PasswordBearer
 from httpx import AsyncClient
 import copy
+import logging
+
+from shared.utils.logging_util import setup_logging, parse_module_levels
+
+# 初始化日志（网关不加载数据库配置，直接读取环境变量）
+setup_logging(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    module_levels=parse_module_levels(os.getenv("LOG_MODULE_LEVELS", "")),
+    fmt_type=os.getenv("LOG_FORMAT", "text"),
+    debug_sample_every=int(os.getenv("LOG_DEBUG_SAMPLE_EVERY", "1"))
+)
+logger = logging.getLogger(__name__)
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -59,7 +71,7 @@ async def log_requests(request: Request, call_next):
     start_time = time.time()
     path = request.url.path
     method = request.method
-    print(f"[{request_id}] {method} {path} - 开始处理")
+    logger.debug("[%s] %s %s - 开始处理", request_id, method, path)
     
     # 处理请求
     try:
@@ -68,13 +80,13 @@ async def log_requests(request: Request, call_next):
         # 记录请求结束
         process_time = (time.time() - start_time) * 1000
         status_code = response.status_code
-        print(f"[{request_id}] {method} {path} - 完成 {status_code} ({process_time:.2f}ms)")
+        logger.info("[%s] %s %s - 完成 %s (%.2fms)", request_id, method, path, status_code, process_time)
         
         return response
     except Exception as e:
         # 记录请求异常
         process_time = (time.time() - start_time) * 1000
-        print(f"[{request_id}] {method} {path} - 异常 {str(e)} ({process_time:.2f}ms)")
+        logger.error("[%s] %s %s - 异常 %s (%.2fms)", request_id, method, path, e, process_time)
         
         return JSONResponse(
             status_code=500,
@@ -223,7 +235,7 @@ async def proxy_request(service: str, path: str, request: Request, token_data: O
         except httpx.RequestError as e:
             # 处理请求错误
             error_detail = f"服务 {service} 请求失败: {str(e)}"
-            print(error_detail)
+            logger.error(error_detail)
             raise HTTPException(status_code=503, detail=error_detail)
 
 # 动态加载各服务的OpenAPI文档
@@ -279,9 +291,9 @@ async def startup_event():
                                 service_schema["components"]["securitySchemes"]
                             )
                     
-                print(f"Loaded OpenAPI schema for {service_name}")
+                logger.info("Loaded OpenAPI schema for %s", service_name)
             except Exception as e:
-                print(f"Failed to load OpenAPI schema for {service_name}: {e}")
+                logger.warning("Failed to load OpenAPI schema for %s: %s", service_name, e)
     
     # 添加系统级API的文档
     system_paths = {
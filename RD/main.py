@@ -1,18 +1,23 @@
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, Body
 from fastapi.middleware.cors import CORSMiddleware
-from shared.middlewares.case_middleware import CamelCaseMiddleware
-from shared.middlewares.datetime_middleware import DatetimeMiddleware
+from shared.middlewares.response_transform_middleware import ResponseTransformMiddleware, TransformedJSONResponse
 from shared.middlewares.auth_middleware import AuthMiddleware
+from shared.middlewares.exception_middleware import ExceptionMiddleware
 
 from fastapi.exceptions import RequestValidationError
 from shared.exceptions import BusinessException
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from shared.utils.logging_util import setup_logging, shutdown_logging, get_module_levels, set_module_levels
+from shared.cache.redis_client import is_redis_connected, aclose_redis_connection, get_redis_stats
+from shared.services.password_hash_service import PasswordHashService
+from shared.services.login_audit_writer import LoginAuditWriter
 
 import os
 import time
 import asyncio
+import logging
 from contextlib import asynccontextmanager
+from typing import Dict
 
 
 # 设置时区为Asia/Shanghai
@@ -20,6 +25,10 @@ os.environ['TZ'] = 'Asia/Shanghai'
 if hasattr(time, 'tzset'):
     time.tzset()
 
+# 初始化日志（队列异步输出，级别见 LOG_LEVEL / LOG_MODULE_LEVELS）
+setup_logging()
+logger = logging.getLogger(__name__)
+
 # 导入认证服务的路由
 from services.auth_service.routers import auth # 认证服务
 # 导入虚拟订单服务的路由
@@ -34,7 +43,7 @@ from services.virtual_order_service.service.task_scheduler import start_backgrou
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 启动时执行
-    print("初始化系统配置...")
+    logger.info("初始化系统配置...")
     # 初始化自动确认配置
     from shared.database.session import SessionLocal
     from services.virtual_order_service.service.config_service import ConfigService
@@ -45,35 +54,46 @@ async def lifespan(app: FastAPI):
         config_service.init_auto_confirm_config()
         config_service.init_virtual_task_generation_config()
     except Exception as e:
-        print(f"初始化配置失败: {e}")
+        logger.exception("初始化配置失败: %s", e)
     finally:
         db.close()
 
-    print("启动虚拟订单定时任务调度器...")
+    # 创建Redis连接池并启动后台健康检查
+    if not is_redis_connected():
+        logger.warning("Redis不可用，相关缓存将暂时跳过")
+
+    logger.info("启动虚拟订单定时任务调度器...")
     # 在后台启动定时任务
     task = asyncio.create_task(start_background_tasks())
     try:
         yield
     finally:
         # 关闭时执行
-        print("停止虚拟订单定时任务调度器...")
+        logger.info("停止虚拟订单定时任务调度器...")
         stop_background_tasks()
         task.cancel()
         try:
             await task
         except asyncio.CancelledError:
             pass
+        await aclose_redis_connection()
+        PasswordHashService.shutdown()
+        LoginAuditWriter.stop()
+        shutdown_logging()
 
 app = FastAPI(
     title="虚拟订单管理系统API",
     description="虚拟订单管理系统 - 包含认证服务和虚拟订单服务",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # 路由返回值在序列化时直接完成驼峰转换和日期格式化
+    default_response_class=TransformedJSONResponse
 )
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    print(f"Global exception handler caught: {str(exc)}")
+    if not isinstance(exc, BusinessException):
+        logger.exception("Global exception handler caught: %s", exc)
     if isinstance(exc, BusinessException):
         return JSONResponse(
             status_code=200,
@@ -91,39 +111,6 @@ async def global_exception_handler(request: Request, exc: Exception):
             "data": None
         }
     )
-class ExceptionMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        try:
-            response = await call_next(request)
-            return response
-        except HTTPException as exc:
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "code": exc.status_code,
-                    "message": exc.detail,
-                    "data": None
-                }
-            )
-        except BusinessException as exc:
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "code": exc.code,
-                    "message": exc.message,
-                    "data": exc.data
-                }
-            )
-        except Exception as exc:
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "code": 500,
-                    "message": str(exc),
-                    "data": None
-                }
-            )
-
 # 注册异常处理器
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -148,9 +135,8 @@ app.add_middleware(ExceptionMiddleware)
 # 添加认证中间件
 app.add_middleware(AuthMiddleware)
 
-# 添加自定义中间件
-app.add_middleware(DatetimeMiddleware)
-app.add_middleware(CamelCaseMiddleware)
+# 添加响应转换中间件（驼峰转换 + 日期格式化，一次解析完成）
+app.add_middleware(ResponseTransformMiddleware)
 
 # 配置CORS（放在最后，这样会最先处理预检请求）
 app.add_middleware(
@@ -177,6 +163,28 @@ app.include_router(resource_routes.router, tags=["资源库管理"])
 async def root():
     return {"message": "虚拟订单管理系统API - 认证服务和虚拟订单服务"}
 
+@app.get("/api/system/logLevels")
+async def get_log_levels():
+    """查看当前日志级别"""
+    levels = get_module_levels()
+    return {"code": 200, "message": "获取成功", "data": [{"module": k, "level": v} for k, v in levels.items()]}
+
+@app.get("/api/system/redisStats")
+async def redis_stats():
+    """Redis连接状态、连接池使用情况和调用统计"""
+    stats = get_redis_stats()
+    stats["commands"] = [{"command": k, "calls": v} for k, v in sorted(stats["commands"].items())]
+    return {"code": 200, "message": "获取成功", "data": stats}
+
+@app.put("/api/system/logLevels")
+async def update_log_levels(levels: Dict[str, str] = Body(..., description="模块名 -> 日志级别，如 {\"shared.middlewares\": \"DEBUG\"}")):
+    """运行时调整模块日志级别（重启后恢复为配置值）"""
+    invalid = [level for level in levels.values() if not isinstance(logging.getLevelName(level.upper()), int)]
+    if invalid:
+        return {"code": 400, "message": f"无效的日志级别: {', '.join(invalid)}", "data": None}
+    levels = set_module_levels({("" if module == "root" else module): level for module, level in levels.items()})
+    return {"code": 200, "message": "设置成功", "data": [{"module": k, "level": v} for k, v in levels.items()]}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=9007)
\ No newline at end of file
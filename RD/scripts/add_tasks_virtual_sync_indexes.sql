@@ -0,0 +1,7 @@
+-- 已完成虚拟任务增量同步：按更新时间扫描有变动的虚拟任务
+ALTER TABLE `tasks`
+  ADD KEY `idx_virtual_updated_at` (`is_virtual`, `updated_at`);
+
+-- 按学生重算已完成虚拟任务金额
+ALTER TABLE `tasks`
+  ADD KEY `idx_target_student_status` (`target_student_id`, `status`);
@@ -0,0 +1,12 @@
+-- 虚拟订单统计报表改为每日汇总表：由定时任务增量刷新，每日任务关账
+-- student_id = 0 的行为当日全部虚拟任务（含奖金池任务）的汇总
+ALTER TABLE `virtual_order_reports`
+  ADD COLUMN `tasks_completed_on_day` int DEFAULT '0' COMMENT '当日完成（按完成时间）任务数' AFTER `remaining_subsidy`,
+  ADD COLUMN `amount_completed_on_day` decimal(10,2) DEFAULT '0.00' COMMENT '当日完成（按完成时间）任务总金额' AFTER `tasks_completed_on_day`,
+  ADD COLUMN `active_students` int DEFAULT '0' COMMENT '当日有任务活动的学生数' AFTER `amount_completed_on_day`,
+  ADD COLUMN `is_closed` tinyint(1) NOT NULL DEFAULT '0' COMMENT '是否已关账：关账后不再刷新' AFTER `active_students`,
+  ADD KEY `idx_date_closed` (`report_date`, `is_closed`);
+
+-- 按创建时间范围统计虚拟任务时使用
+ALTER TABLE `tasks`
+  ADD KEY `idx_virtual_created_at` (`is_virtual`, `created_at`);
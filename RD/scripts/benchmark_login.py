@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+登录密码校验吞吐量基准测试
+
+模拟多个请求线程（FastAPI同步路由的线程池）同时登录，对比：
+- 直接在请求线程中执行 bcrypt.checkpw（原 AuthService.compare_password）
+- 通过 PasswordHashService 在进程池中执行
+
+同时在后台线程中测量“心跳”延迟，反映密码校验对同进程其他请求的影响。
+不访问数据库，只测量密码校验部分。
+
+用法：
+    python scripts/benchmark_login.py --logins 200 --concurrency 40 --rounds 10 --workers 4
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct), len(values) - 1)]
+
+
+class HeartbeatMonitor:
+    """每 interval 秒唤醒一次，记录实际唤醒延迟（GIL/CPU 争用越严重延迟越大）"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.delays = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            time.sleep(self.interval)
+            self.delays.append(time.perf_counter() - start - self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run(name, verify, password, hashed, logins, concurrency):
+    latencies = []
+
+    def login_once(_):
+        start = time.perf_counter()
+        assert verify(password, hashed)
+        latencies.append(time.perf_counter() - start)
+
+    with HeartbeatMonitor() as monitor, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        list(pool.map(login_once, range(logins)))
+        elapsed = time.perf_counter() - start
+
+    print(
+        f"{name:>10}: {logins / elapsed:>8.1f} 次/秒 | "
+        f"延迟 p50 {percentile(latencies, 0.5) * 1000:>7.1f}ms p95 {percentile(latencies, 0.95) * 1000:>7.1f}ms | "
+        f"心跳延迟 p95 {percentile(monitor.delays, 0.95) * 1000:>6.2f}ms 平均 {statistics.mean(monitor.delays) * 1000:.2f}ms"
+    )
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="登录密码校验吞吐量基准测试")
+    parser.add_argument("--logins", type=int, default=200, help="登录次数")
+    parser.add_argument("--concurrency", type=int, default=40, help="并发请求线程数")
+    parser.add_argument("--rounds", type=int, default=10, help="bcrypt加密轮数")
+    parser.add_argument("--workers", type=int, default=-1, help="密码哈希进程数（-1 为默认值）")
+    args = parser.parse_args()
+
+    # 配置在导入前通过环境变量传入
+    os.environ["PASSWORD_HASH_ROUNDS"] = str(args.rounds)
+    os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+
+    import bcrypt
+    from shared.services.password_hash_service import PasswordHashService
+
+    password = "benchmark-password"
+    hashed = PasswordHashService.hash(password)  # 同时完成进程池预热
+    print(f"bcrypt轮数: {PasswordHashService.get_rounds(hashed)}, 并发: {args.concurrency}, 登录次数: {args.logins}")
+
+    def inline_verify(pwd, hashed_pwd):
+        return bcrypt.checkpw(pwd.encode("utf-8"), hashed_pwd.encode("utf-8"))
+
+    try:
+        inline = run("请求线程", inline_verify, password, hashed, args.logins, args.concurrency)
+        pooled = run("进程池", PasswordHashService.verify, password, hashed, args.logins, args.concurrency)
+        print(f"{'提升':>10}: {pooled / inline:.2f}x")
+    finally:
+        PasswordHashService.shutdown()
+
+
+if __name__ == "__main__":
+    main()
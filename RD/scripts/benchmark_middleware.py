@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+中间件栈性能基准测试
+
+在进程内直接调用ASGI应用（不经过网络），对同一个简单接口分别测量
+原 BaseHTTPMiddleware 中间件栈和当前纯ASGI中间件栈的每秒请求数。
+
+用法：
+    python scripts/benchmark_middleware.py --requests 5000 --rounds 3
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import contextlib
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, Response
+
+from shared.middlewares.auth_middleware import AuthMiddleware
+from shared.middlewares.case_middleware import convert_dict_keys
+from shared.middlewares.datetime_middleware import DatetimeMiddleware
+from shared.middlewares.exception_middleware import ExceptionMiddleware
+from shared.middlewares.response_transform_middleware import ResponseTransformMiddleware, TransformedJSONResponse
+from shared.utils.jwt import create_jwt_token, decode_jwt_token
+
+BENCH_PATH = "/bench/items"
+
+
+def build_payload():
+    """接口返回数据：带下划线key和时间字段的列表"""
+    now = datetime.now()
+    return {
+        "code": 200,
+        "message": "获取成功",
+        "data": {
+            "items": [
+                {"student_id": i, "student_name": f"学生{i}", "created_at": now, "total_subsidy": 100.0}
+                for i in range(20)
+            ],
+            "total_count": 20
+        }
+    }
+
+
+# ==================== 原 BaseHTTPMiddleware 中间件栈 ====================
+
+def legacy_format_datetime(data):
+    """原 DatetimeMiddleware 的日期格式化（正则匹配 + arrow 解析）"""
+    import arrow
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if isinstance(value, str) and DatetimeMiddleware.ISO_DATETIME_PATTERN.match(value):
+                data[key] = arrow.get(value).format('YYYY-MM-DD HH:mm:ss')
+            elif isinstance(value, (dict, list)):
+                legacy_format_datetime(value)
+    elif isinstance(data, list):
+        for item in data:
+            if isinstance(item, (dict, list)):
+                legacy_format_datetime(item)
+
+
+class LegacyExceptionMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        try:
+            return await call_next(request)
+        except Exception as exc:
+            return ExceptionMiddleware.build_error_response(exc)
+
+
+class LegacyAuthMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        auth_header = request.headers.get("Authorization")
+        if not auth_header or not auth_header.startswith("Bearer "):
+            return JSONResponse(status_code=200, content={"code": 401, "message": "未提供认证凭据", "data": None})
+        decode_jwt_token(auth_header.split(" ")[1])
+        return await call_next(request)
+
+
+class LegacyDatetimeMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        import json
+        response = await call_next(request)
+        if response.headers.get("content-type") != "application/json":
+            return response
+        body = b""
+        async for chunk in response.body_iterator:
+            body += chunk
+        data = json.loads(body.decode())
+        legacy_format_datetime(data)
+        modified_body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        headers = dict(response.headers)
+        headers["content-length"] = str(len(modified_body))
+        return Response(content=modified_body, status_code=response.status_code,
+                        headers=headers, media_type="application/json")
+
+
+class LegacyCamelCaseMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        import json
+        response = await call_next(request)
+        if response.headers.get("content-type") != "application/json":
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        headers = dict(response.headers)
+        headers.pop("content-length", None)
+        return JSONResponse(content=convert_dict_keys(json.loads(body)),
+                            status_code=response.status_code, headers=headers)
+
+
+def build_legacy_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get(BENCH_PATH)
+    async def items():
+        return build_payload()
+
+    app.add_middleware(LegacyExceptionMiddleware)
+    app.add_middleware(LegacyAuthMiddleware)
+    app.add_middleware(LegacyDatetimeMiddleware)
+    app.add_middleware(LegacyCamelCaseMiddleware)
+    return app
+
+
+# ==================== 当前纯ASGI中间件栈 ====================
+
+def build_current_app() -> FastAPI:
+    app = FastAPI(default_response_class=TransformedJSONResponse)
+
+    @app.get(BENCH_PATH)
+    async def items():
+        return build_payload()
+
+    app.add_middleware(ExceptionMiddleware)
+    app.add_middleware(AuthMiddleware)
+    app.add_middleware(ResponseTransformMiddleware)
+    return app
+
+
+# ==================== 测试驱动 ====================
+
+async def run_requests(app: FastAPI, token: str, count: int) -> float:
+    """顺序发送 count 个请求，返回每秒请求数"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": BENCH_PATH,
+        "raw_path": BENCH_PATH.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    statuses = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    start = time.perf_counter()
+    for _ in range(count):
+        await app(dict(scope), receive, send)
+    elapsed = time.perf_counter() - start
+
+    if any(status != 200 for status in statuses):
+        raise RuntimeError(f"存在非200响应: {set(statuses)}")
+    return count / elapsed
+
+
+async def benchmark(requests: int, rounds: int) -> None:
+    token = create_jwt_token({"user_id": 1, "account": "bench", "user_type": 1})
+    apps = {"BaseHTTPMiddleware": build_legacy_app(), "纯ASGI": build_current_app()}
+
+    results = {name: [] for name in apps}
+    # 中间件中的调试输出不计入结果展示
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for app in apps.values():
+            await run_requests(app, token, min(200, requests))  # 预热
+        for _ in range(rounds):
+            for name, app in apps.items():
+                results[name].append(await run_requests(app, token, requests))
+
+    best = {name: max(values) for name, values in results.items()}
+    for name, values in results.items():
+        print(f"{name:>20}: 最好 {best[name]:>9.1f} req/s  （各轮: {', '.join(f'{v:.1f}' for v in values)}）")
+    print(f"{'提升':>20}: {best['纯ASGI'] / best['BaseHTTPMiddleware']:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="中间件栈性能基准测试")
+    parser.add_argument("--requests", type=int, default=5000, help="每轮请求数")
+    parser.add_argument("--rounds", type=int, default=3, help="测试轮数")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    asyncio.run(benchmark(args.requests, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
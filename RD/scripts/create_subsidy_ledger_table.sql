@@ -0,0 +1,19 @@
+-- 创建学生补贴流水表（只追加，由定时任务增量汇总到 virtual_order_pool）
+CREATE TABLE `virtual_order_subsidy_ledger` (
+  `id` bigint NOT NULL AUTO_INCREMENT,
+  `pool_id` int NOT NULL COMMENT '补贴池ID，关联virtual_order_pool表的id',
+  `student_id` int NOT NULL COMMENT '学生ID，关联userinfo表的roleId',
+  `event_type` varchar(20) NOT NULL COMMENT '事件类型：allocate-分配, complete-完成, recycle-价值回收, expire-过期释放, adjust-调整',
+  `remaining_delta` decimal(10,2) NOT NULL DEFAULT '0.00' COMMENT '剩余金额变动',
+  `completed_delta` decimal(10,2) NOT NULL DEFAULT '0.00' COMMENT '已完成任务金额变动',
+  `consumed_delta` decimal(10,2) NOT NULL DEFAULT '0.00' COMMENT '实际消耗补贴变动',
+  `task_id` int DEFAULT NULL COMMENT '关联任务ID',
+  `remark` varchar(255) DEFAULT NULL COMMENT '备注',
+  `is_materialized` tinyint(1) NOT NULL DEFAULT '0' COMMENT '是否已汇总到补贴池',
+  `materialized_at` datetime DEFAULT NULL COMMENT '汇总时间',
+  `created_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+  PRIMARY KEY (`id`),
+  KEY `idx_student_id` (`student_id`),
+  KEY `idx_materialized_id` (`is_materialized`, `id`),
+  KEY `idx_pool_materialized` (`pool_id`, `is_materialized`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci COMMENT='学生补贴流水表';
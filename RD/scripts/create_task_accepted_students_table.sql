@@ -0,0 +1,56 @@
+-- 任务接取人映射表：将 tasks.accepted_by（逗号分隔的ID字符串）拆分为 (task_id, student_id) 记录，
+-- 按学生统计任务时走索引等值关联，替代 accepted_by LIKE '%id%'（无法使用索引，且 12 会匹配到 123）
+-- 依赖 MySQL 8.0 的 JSON_TABLE
+CREATE TABLE `task_accepted_students` (
+  `task_id` int NOT NULL COMMENT '任务ID，关联tasks表的id',
+  `student_id` int NOT NULL COMMENT '接取人ID，与tasks.accepted_by中保存的ID一致',
+  PRIMARY KEY (`task_id`, `student_id`),
+  KEY `idx_student_task` (`student_id`, `task_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci COMMENT='任务接取人映射表';
+
+-- 回填历史数据（只处理格式合法的 accepted_by，如 "12" 或 "12,15"）
+INSERT IGNORE INTO `task_accepted_students` (`task_id`, `student_id`)
+SELECT t.`id`, jt.`student_id`
+FROM `tasks` t
+JOIN JSON_TABLE(
+  CONCAT('[', t.`accepted_by`, ']'), '$[*]' COLUMNS (`student_id` int PATH '$')
+) jt
+WHERE t.`accepted_by` REGEXP '^ *[0-9]+( *, *[0-9]+)* *$';
+
+-- 触发器：无论由哪个系统修改 accepted_by，映射表都保持同步
+DROP TRIGGER IF EXISTS `trg_tasks_accepted_students_ai`;
+DROP TRIGGER IF EXISTS `trg_tasks_accepted_students_au`;
+DROP TRIGGER IF EXISTS `trg_tasks_accepted_students_ad`;
+
+DELIMITER $$
+
+CREATE TRIGGER `trg_tasks_accepted_students_ai` AFTER INSERT ON `tasks`
+FOR EACH ROW
+BEGIN
+  IF NEW.`accepted_by` REGEXP '^ *[0-9]+( *, *[0-9]+)* *$' THEN
+    INSERT IGNORE INTO `task_accepted_students` (`task_id`, `student_id`)
+    SELECT NEW.`id`, jt.`student_id`
+    FROM JSON_TABLE(CONCAT('[', NEW.`accepted_by`, ']'), '$[*]' COLUMNS (`student_id` int PATH '$')) jt;
+  END IF;
+END$$
+
+CREATE TRIGGER `trg_tasks_accepted_students_au` AFTER UPDATE ON `tasks`
+FOR EACH ROW
+BEGIN
+  IF NOT (OLD.`accepted_by` <=> NEW.`accepted_by`) THEN
+    DELETE FROM `task_accepted_students` WHERE `task_id` = NEW.`id`;
+    IF NEW.`accepted_by` REGEXP '^ *[0-9]+( *, *[0-9]+)* *$' THEN
+      INSERT IGNORE INTO `task_accepted_students` (`task_id`, `student_id`)
+      SELECT NEW.`id`, jt.`student_id`
+      FROM JSON_TABLE(CONCAT('[', NEW.`accepted_by`, ']'), '$[*]' COLUMNS (`student_id` int PATH '$')) jt;
+    END IF;
+  END IF;
+END$$
+
+CREATE TRIGGER `trg_tasks_accepted_students_ad` AFTER DELETE ON `tasks`
+FOR EACH ROW
+BEGIN
+  DELETE FROM `task_accepted_students` WHERE `task_id` = OLD.`id`;
+END$$
+
+DELIMITER ;
@@ -10,7 +10,6 @@ from shared.exceptions import BusinessException, ErrorCode
 def authenticate_user(db: Session, username: str, password: str) -> User:
     """验证用户"""
     user = db.query(User).filter(User.account == username).first()
-    print(user, username, password)
     if not user:
         raise BusinessException(
             code=ErrorCode.INVALID_PASSWORD,
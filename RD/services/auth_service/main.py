@@ -37,10 +37,11 @@ from shared.utils.security import (
 )
 from shared.utils.redis_util import RedisUtil
 from shared.exceptions import BusinessException, business_exception_handler, ErrorCode
+from shared.utils.logging_util import setup_logging
 from .routers import auth  # 使用相对导入
 
 # 配置日志
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
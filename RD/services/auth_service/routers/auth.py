@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Body, Depends, Request, File, UploadFile, status, HTTPException
+from fastapi import APIRouter, Body, Depends, Query, Request, File, UploadFile, status, HTTPException
 from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
@@ -16,6 +16,7 @@ from shared.schemas.common import ResponseSchema
 from shared.dependencies.auth import get_current_active_user
 from shared.schemas.user import UserResponse
 from shared.exceptions import BusinessException
+from shared.middlewares.response_transform_middleware import TransformedJSONRoute
 from ..api.api_docs import AuthApiDocs
 from ..schemas.auth_schemas import (
     LoginRequest,
@@ -29,7 +30,7 @@ from ..schemas.auth_schemas import (
 
 from ..service.auth_service import AuthService
 
-router = APIRouter()
+router = APIRouter(route_class=TransformedJSONRoute)
 
 
 
@@ -82,7 +83,7 @@ async def logout(
     if auth_header and auth_header.startswith("Bearer "):
         token = auth_header.replace("Bearer ", "")
         auth_service = AuthService(db)
-        auth_service.logout(current_user.id, token)
+        await auth_service.logout(current_user.id, token)
     
     return ResponseSchema(
         code=200,
@@ -202,8 +203,8 @@ def update_user_info(
     description="获取所有学员前一天的收入统计列表（管理员功能）"
 )
 async def get_all_students_daily_income_stats(
-    page: int = 1,
-    size: int = 10,
+    page: int = Query(1, ge=1, description="页码"),
+    size: int = Query(10, ge=1, le=100, description="每页数量"),
     stat_date: str = None,  # 新增日期参数，格式：YYYY-MM-DD
     current_user: OriginalUser = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -1,7 +1,10 @@
-from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import text, and_
-import bcrypt
+from datetime import date, datetime, timedelta
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy import event, func, inspect
+import copy
+import time
+import threading
+import logging
 from decimal import Decimal
 
 from shared.config import settings
@@ -13,9 +16,23 @@ from shared.models.tasks import Tasks
 from shared.utils.security import create_access_token
 from shared.exceptions import BusinessException
 from shared.utils.redis_util import RedisUtil
+from shared.cache.user_principal_cache import UserPrincipalCache
+from shared.services.token_blacklist_service import TokenBlacklistService
+from shared.services.password_hash_service import PasswordHashService
+from shared.services.login_audit_writer import LoginAuditWriter
+
+logger = logging.getLogger(__name__)
 
 
 class AuthService:
+    # 学员收入统计缓存：只缓存已结束日期的分页结果，{(date, page, size): (result, expire_at)}，所有实例共享
+    INCOME_STATS_CLOSED_DAY_OFFSET = 2
+    INCOME_STATS_CACHE_TTL = 600
+    INCOME_STATS_CACHE_MAX_ENTRIES = 512
+    INCOME_STATS_MAX_PAGE_SIZE = 100
+    _income_stats_cache = {}
+    _income_stats_cache_lock = threading.Lock()
+
     def __init__(self, db: Session):
         """初始化服务
 
@@ -23,7 +40,7 @@ class AuthService:
             db: 数据库会话
         """
         self.db = db
-        self.salt_rounds = 10  # bcrypt盐轮数
+        self.salt_rounds = PasswordHashService.rounds()  # bcrypt盐轮数（PASSWORD_HASH_ROUNDS）
 
         # 注：在认证模板中，我们移除了OSS文件上传功能
         # 实际项目中可以根据需要添加文件上传功能
@@ -32,13 +49,12 @@ class AuthService:
         self.redis_util = RedisUtil()
 
     def hash_password(self, password: str) -> str:
-        """生成哈希密码（加盐加密）"""
-        salt = bcrypt.gensalt(rounds=self.salt_rounds)
-        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        """生成哈希密码（加盐加密，在密码哈希进程池中计算）"""
+        return PasswordHashService.hash(password, self.salt_rounds)
 
     def compare_password(self, password: str, hash_password: str) -> bool:
-        """验证密码（比较输入的密码和哈希密码）"""
-        return bcrypt.checkpw(password.encode('utf-8'), hash_password.encode('utf-8'))
+        """验证密码（比较输入的密码和哈希密码，在密码哈希进程池中计算）"""
+        return PasswordHashService.verify(password, hash_password)
 
 
 
@@ -110,6 +126,10 @@ class AuthService:
         if user.lastLoginTime:
             last_login_time = user.lastLoginTime.strftime('%Y-%m-%d %H:%M:%S')
 
+        # 加密轮数与当前配置不一致时，用本次登录的明文密码重新加密（与登录时间一起提交）
+        if PasswordHashService.needs_rehash(user.password):
+            user.password = self.hash_password(password)
+
         # 更新最后登录时间
         user.lastLoginTime = datetime.now()
         self.db.commit()
@@ -188,11 +208,12 @@ class AuthService:
                 user_info.initial_password = hashed_password
                 self.db.commit()
 
+            UserPrincipalCache.invalidate(user.id)
             return True
         except BusinessException as e:
             raise e
         except Exception as e:
-            print(f"Reset password error: {str(e)}")
+            logger.exception("Reset password error: %s", e)
             raise BusinessException(
                 code=500,
                 message="重置密码失败",
@@ -248,11 +269,12 @@ class AuthService:
                 user_info.initial_password = hashed_new_password
                 self.db.commit()
 
+            UserPrincipalCache.invalidate(user.id)
             return True
         except BusinessException as e:
             raise e
         except Exception as e:
-            print(f"Change password error: {str(e)}")
+            logger.exception("Change password error: %s", e)
             raise BusinessException(
                 code=500,
                 message="修改密码失败",
@@ -317,39 +339,21 @@ class AuthService:
 
 
     def log_user_login(self, user_id: int, ip: str):
-        """记录登录日志"""
-        try:
-            login_log = {
-                "user_id": user_id,
-                "login_time": datetime.now(),
-                "ip": ip
-            }
-            self.db.execute(
-                text("""
-                INSERT INTO login_log (user_id, login_time, ip)
-                VALUES (:user_id, :login_time, :ip)
-                """),
-                login_log
-            )
-            self.db.commit()
-        except Exception as e:
-            print(f"写入登录日志失败: {str(e)}")
-            # 不影响主流程
+        """记录登录日志（放入队列，由 LoginAuditWriter 批量写入，不影响主流程）"""
+        LoginAuditWriter.enqueue(user_id, ip)
 
 
 
 
 
-    def logout(self, user_id: int, token: str):
+    async def logout(self, user_id: int, token: str):
         """退出登录，使当前token失效"""
-        # 将token加入黑名单，有效期设置为token的剩余有效期
+        # 将token加入黑名单，有效期为token的剩余有效期
         try:
-            # 默认先设置一个较长的过期时间，确保token失效
-            expiration = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60  # 转换为秒
-            RedisUtil.add_token_to_blacklist(token, expiration)
+            await TokenBlacklistService.add(token)
             return True
         except Exception as e:
-            print(f"退出登录时出错: {str(e)}")
+            logger.warning("退出登录时出错: %s", e)
             # 即使失败也返回成功，不影响用户体验
             return True
 
@@ -437,46 +441,28 @@ class AuthService:
 
         return user_info
 
-    def get_all_students_income_stats(self, page: int = 1, size: int = 10, stat_date: str = None) -> dict:
+    def get_all_students_income_stats(self, page: int = 1, size: int = 10, stat_date: str = None,
+                                      use_cache: bool = True) -> dict:
         """获取所有学员收入统计列表
 
+        按学员分组统计当日完成的虚拟任务，关联代理返佣比例，
+        排序和分页都在数据库中完成，只计算当前页的学员。
+        已结束日期（前天及更早）的分页结果会缓存一段时间。
+
         Args:
             page: 页码
             size: 每页大小
             stat_date: 统计日期，格式：YYYY-MM-DD，默认为昨天
+            use_cache: 是否使用已结束日期的缓存
 
         Returns:
             dict: 所有学员收入统计数据
         """
-        try:
-            print("[DEBUG] 开始获取所有学员收入统计...")
-
-            # 1. 获取所有学员信息
-            students = self.db.query(UserInfo).filter(
-                UserInfo.level == '3',  # 学员级别
-                UserInfo.isDeleted == False
-            ).all()
-
-            print(f"[DEBUG] 找到 {len(students)} 个学员")
-
-            if not students:
-                print("[DEBUG] 没有找到学员，返回空列表")
-                # 计算统计日期
-                if stat_date:
-                    try:
-                        target_date = datetime.strptime(stat_date, '%Y-%m-%d').date()
-                    except ValueError:
-                        target_date = datetime.now().date() - timedelta(days=1)
-                else:
-                    target_date = datetime.now().date() - timedelta(days=1)
-
-                return {
-                    "students": [],
-                    "total": 0,
-                    "stat_date": target_date.strftime('%Y-%m-%d')
-                }
+        page = max(page or 1, 1)
+        size = min(max(size or 1, 1), self.INCOME_STATS_MAX_PAGE_SIZE)
 
-            # 2. 计算统计日期范围
+        try:
+            # 1. 计算统计日期范围
             if stat_date:
                 # 使用指定日期
                 try:
@@ -491,128 +477,86 @@ class AuthService:
                 # 默认使用昨天
                 target_date = datetime.now().date() - timedelta(days=1)
 
+            # 跨天完成的任务仍会修改昨天的数据，前天及更早才视为已结束
+            cacheable = use_cache and target_date <= datetime.now().date() - timedelta(days=self.INCOME_STATS_CLOSED_DAY_OFFSET)
+            cache_key = (target_date, page, size)
+            if cacheable:
+                cached = self._get_cached_income_stats(cache_key)
+                if cached is not None:
+                    return cached
+
             start_time = datetime.combine(target_date, datetime.min.time())
             end_time = datetime.combine(target_date, datetime.max.time())
 
-            # 3. 查询前一天完成的任务（虚拟任务和普通任务分别查询）
-            # 查询虚拟任务：直接通过target_student_id查找
-            virtual_tasks = self.db.query(Tasks).filter(
-                and_(
-                    Tasks.is_virtual.is_(True),
-                    Tasks.status == '4',  # 任务状态为已完成
-                    Tasks.created_at >= start_time,
-                    Tasks.created_at <= end_time
-                )
-            ).all()
-
-            # 查询普通任务：通过accepted_by查找
-            normal_tasks = self.db.query(Tasks).filter(
-                and_(
-                    Tasks.is_virtual.is_(False),
-                    Tasks.status == '4',  # 任务状态为已完成
-                    Tasks.created_at >= start_time,
-                    Tasks.created_at <= end_time,
-                    Tasks.accepted_by.isnot(None)
-                )
-            ).all()
-
-            print(f"[DEBUG] 查询到 {len(virtual_tasks)} 个虚拟任务，{len(normal_tasks)} 个普通任务，时间范围: {start_time} - {end_time}")
+            # 2. 当日完成的虚拟任务按目标学员分组统计
+            task_stats = self.db.query(
+                Tasks.target_student_id.label('student_id'),
+                func.count(Tasks.id).label('completed_orders'),
+                func.sum(Tasks.commission).label('original_commission')
+            ).filter(
+                Tasks.is_virtual.is_(True),
+                Tasks.status == '4',  # 任务状态为已完成
+                Tasks.created_at >= start_time,
+                Tasks.created_at <= end_time,
+                Tasks.target_student_id.isnot(None),
+                Tasks.commission.isnot(None),
+                Tasks.commission != 0
+            ).group_by(Tasks.target_student_id).subquery()
+
+            completed_orders = func.coalesce(task_stats.c.completed_orders, 0)
+
+            # 3. 学员关联代理和任务统计，按完成订单数从大到小排序并分页
+            students_query = self.db.query(UserInfo.roleId).filter(
+                UserInfo.level == '3',  # 学员级别
+                UserInfo.isDeleted == False
+            )
+            total_students = students_query.count()
+
+            rows = self.db.query(
+                UserInfo.roleId,
+                UserInfo.name,
+                UserInfo.phone_number,
+                Agents.agent_rebate,
+                completed_orders.label('completed_orders'),
+                task_stats.c.original_commission
+            ).outerjoin(
+                Agents, Agents.id == UserInfo.agentId
+            ).outerjoin(
+                task_stats, task_stats.c.student_id == UserInfo.roleId
+            ).filter(
+                UserInfo.level == '3',
+                UserInfo.isDeleted == False
+            ).order_by(
+                completed_orders.desc(),
+                UserInfo.roleId
+            ).offset((page - 1) * size).limit(size).all()
 
-            # 4. 为每个学员计算收入统计
+            # 4. 计算当前页学员的收入
             students_stats = []
-
-            for i, student in enumerate(students):
-                print(f"[DEBUG] 处理学员 {i+1}/{len(students)}: {student.name} (ID: {student.roleId})")
-
-                # 获取学员的代理信息
-                agent_record = self.db.query(Agents).filter(
-                    Agents.id == student.agentId
-                ).first()
-
-                agent_rebate = "0.00"
-                if agent_record and agent_record.agent_rebate:
-                    # 处理百分比格式，如 "15%" -> "0.15" 或 "60" -> "0.60"
-                    rebate_str = agent_record.agent_rebate.replace('%', '') if '%' in agent_record.agent_rebate else agent_record.agent_rebate
-                    rebate_value = float(rebate_str)
-                    # 如果值大于1，说明是百分比形式（如60），需要除以100
-                    if rebate_value > 1:
-                        agent_rebate = str(rebate_value / 100)
-                    else:
-                        agent_rebate = str(rebate_value)
-
-                print(f"[DEBUG] 学员 {student.name} 的代理返佣比例: {agent_rebate}")
-
-                # 计算该学员的收入统计
-                total_commission = Decimal('0.00')
-                completed_orders = 0
-                agent_rebate_decimal = Decimal(agent_rebate) if agent_rebate else Decimal('0.00')
-                original_commission = Decimal('0.00')
-
-                # 计算该学员的虚拟任务收入
-                for task in virtual_tasks:
-                    if task.target_student_id == student.roleId and task.commission:
-                        commission = Decimal(str(task.commission))
-                        original_commission += commission
-
-                        # 虚拟任务按代理返佣比例计算实际收入
-                        actual_commission = commission * agent_rebate_decimal
-                        print(f"[DEBUG] 虚拟任务 {task.id}: 佣金 {commission}, 返佣比例 {agent_rebate_decimal}, 实际收入 {actual_commission}")
-
-                        total_commission += actual_commission
-                        completed_orders += 1
-
-                # 计算该学员的普通任务收入（暂时跳过，专注于虚拟任务统计）
-                # TODO: 如果需要统计普通任务，需要建立学生roleId到用户ID的映射关系
-                # 目前主要关注虚拟任务的数据一致性问题
-
-                # 计算虚拟任务和普通任务的统计
-                virtual_commission = Decimal('0.00')
-                normal_commission = Decimal('0.00')
-                virtual_orders = 0
-                normal_orders = 0
-
-                # 统计虚拟任务
-                for task in virtual_tasks:
-                    if task.target_student_id == student.roleId and task.commission:
-                        commission = Decimal(str(task.commission))
-                        # 虚拟任务：按返佣比例计算
-                        virtual_commission += commission * agent_rebate_decimal
-                        virtual_orders += 1
-
-                # 统计普通任务（暂时跳过，因为需要建立roleId到用户ID的映射）
-                # TODO: 需要建立学生roleId到用户ID的映射关系来处理普通任务
-                for task in normal_tasks:
-                    # 暂时跳过普通任务的统计
-                    pass
+            for row in rows:
+                agent_rebate = self._format_agent_rebate(row.agent_rebate)
+                original_commission = row.original_commission if row.original_commission is not None else Decimal('0.00')
+                # 虚拟任务按代理返佣比例计算实际收入
+                actual_commission = original_commission * Decimal(agent_rebate) if row.completed_orders else Decimal('0.00')
 
                 # 添加学员统计数据（使用驼峰命名，会被中间件转换）
-                student_stat = {
-                    "student_id": student.roleId,
-                    "student_name": student.name or "",
+                students_stats.append({
+                    "student_id": row.roleId,
+                    "student_name": row.name or "",
                     "yesterday_income": str(original_commission),  # 昨天任务的原始佣金总额
-                    "yesterday_completed_orders": completed_orders,
-                    "commission_rate": agent_rebate if completed_orders > 0 else "N/A",  # 有任务时显示返佣比例
-                    "actual_income": str(total_commission),  # 实际到手金额
-                    "phone_number": student.phone_number or "",
-                    "virtual_orders": virtual_orders,  # 虚拟任务数量
-                    "normal_orders": normal_orders,  # 普通任务数量
-                    "virtual_commission": str(virtual_commission),  # 虚拟任务佣金
-                    "normal_commission": str(normal_commission)  # 普通任务佣金
-                    # 移除 agent_id 字段
-                }
-                students_stats.append(student_stat)
-
-            # 按完成订单数从大到小排序
-            students_stats.sort(key=lambda x: x["yesterday_completed_orders"], reverse=True)
-
-            # 计算分页
-            total_students = len(students_stats)
-            start_index = (page - 1) * size
-            end_index = start_index + size
-            paginated_students = students_stats[start_index:end_index]
+                    "yesterday_completed_orders": row.completed_orders,
+                    "commission_rate": agent_rebate if row.completed_orders > 0 else "N/A",  # 有任务时显示返佣比例
+                    "actual_income": str(actual_commission),  # 实际到手金额
+                    "phone_number": row.phone_number or "",
+                    "virtual_orders": row.completed_orders,  # 虚拟任务数量
+                    # 普通任务暂不统计（需要建立学生roleId到用户ID的映射关系）
+                    "normal_orders": 0,  # 普通任务数量
+                    "virtual_commission": str(actual_commission),  # 虚拟任务佣金
+                    "normal_commission": "0.00"  # 普通任务佣金
+                })
 
             result = {
-                "students": paginated_students,
+                "students": students_stats,
                 "total": total_students,
                 "page": page,
                 "size": size,
@@ -620,7 +564,8 @@ class AuthService:
                 "stat_date": target_date.strftime('%Y-%m-%d')
             }
 
-            print(f"[DEBUG] 返回结果: 第{page}页，共 {len(paginated_students)} 个学员，总计 {total_students} 个学员")
+            if cacheable:
+                self._cache_income_stats(cache_key, result)
             return result
 
         except BusinessException as e:
@@ -632,6 +577,48 @@ class AuthService:
                 data=None
             )
 
+    @staticmethod
+    def _format_agent_rebate(agent_rebate: str) -> str:
+        """解析代理返佣比例（如 "15%" -> "0.15"、"60" -> "0.6"），未设置时为 0.00"""
+        if not agent_rebate:
+            return "0.00"
+        rebate_str = agent_rebate.replace('%', '') if '%' in agent_rebate else agent_rebate
+        rebate_value = float(rebate_str)
+        # 如果值大于1，说明是百分比形式（如60），需要除以100
+        if rebate_value > 1:
+            return str(rebate_value / 100)
+        return str(rebate_value)
+
+    @classmethod
+    def _get_cached_income_stats(cls, key: tuple):
+        with cls._income_stats_cache_lock:
+            entry = cls._income_stats_cache.get(key)
+            if entry and entry[1] > time.monotonic():
+                return copy.deepcopy(entry[0])
+            cls._income_stats_cache.pop(key, None)
+        return None
+
+    @classmethod
+    def _cache_income_stats(cls, key: tuple, result: dict) -> None:
+        with cls._income_stats_cache_lock:
+            if len(cls._income_stats_cache) >= cls.INCOME_STATS_CACHE_MAX_ENTRIES:
+                now = time.monotonic()
+                for expired_key in [k for k, (_, expire_at) in cls._income_stats_cache.items() if expire_at <= now]:
+                    del cls._income_stats_cache[expired_key]
+                if len(cls._income_stats_cache) >= cls.INCOME_STATS_CACHE_MAX_ENTRIES:
+                    cls._income_stats_cache.clear()
+            cls._income_stats_cache[key] = (copy.deepcopy(result), time.monotonic() + cls.INCOME_STATS_CACHE_TTL)
+
+    @classmethod
+    def invalidate_income_stats_cache(cls, stat_date: date = None) -> None:
+        """清除学员收入统计缓存，stat_date为None时全部清除"""
+        with cls._income_stats_cache_lock:
+            if stat_date is None:
+                cls._income_stats_cache.clear()
+            else:
+                for key in [k for k in cls._income_stats_cache if k[0] == stat_date]:
+                    del cls._income_stats_cache[key]
+
     def adjust_student_subsidy_pool(self, student_id: int, adjustment_amount: float, reason: str = "手动调整") -> dict:
         """
         手动调整学员补贴池金额（用于修复误删任务等情况）
@@ -648,11 +635,11 @@ class AuthService:
             from shared.models.virtual_order_pool import VirtualOrderPool
             from decimal import Decimal
 
-            # 查找学员补贴池
+            # 查找学员补贴池（锁定到事务结束，调整量基于最新余额计算）
             pool = self.db.query(VirtualOrderPool).filter(
                 VirtualOrderPool.student_id == student_id,
                 VirtualOrderPool.is_deleted == False
-            ).first()
+            ).with_for_update().first()
 
             if not pool:
                 raise BusinessException(
@@ -661,21 +648,25 @@ class AuthService:
                     data=None
                 )
 
-            # 记录调整前的金额
-            old_remaining = float(pool.remaining_amount)
+            from datetime import datetime
+            from shared.services.subsidy_ledger_service import SubsidyLedgerService
+
+            # 记录调整前的金额（已汇总余额 + 未汇总的补贴流水）
+            ledger_service = SubsidyLedgerService(self.db)
+            old_remaining_decimal = ledger_service.get_balances([pool], lock=True)[pool.id]['remaining_amount']
+            old_remaining = float(old_remaining_decimal)
             old_total = float(pool.total_subsidy)
 
-            # 执行调整
+            # 执行调整，确保金额不为负数
             adjustment_decimal = Decimal(str(adjustment_amount))
-            pool.remaining_amount += adjustment_decimal
-
-            # 确保金额不为负数
-            if pool.remaining_amount < 0:
-                pool.remaining_amount = Decimal('0')
+            new_remaining = max(old_remaining_decimal + adjustment_decimal, Decimal('0'))
 
-            # 更新时间
-            from datetime import datetime
-            pool.updated_at = datetime.now()
+            # 以调整流水追加，由定时任务汇总到补贴池
+            ledger_service.append(
+                pool.id, student_id, SubsidyLedgerService.EVENT_ADJUST,
+                remaining_delta=new_remaining - old_remaining_decimal,
+                remark=reason[:255] if reason else None
+            )
 
             self.db.commit()
 
@@ -693,7 +684,7 @@ class AuthService:
                 },
                 "after": {
                     "total_subsidy": float(pool.total_subsidy),
-                    "remaining_amount": float(pool.remaining_amount)
+                    "remaining_amount": float(new_remaining)
                 }
             }
 
@@ -708,3 +699,74 @@ class AuthService:
             )
 
 
+# 学员收入统计依赖的字段，本进程内通过ORM修改后在事务结束时清除对应缓存
+_INCOME_STATS_PENDING_KEY = 'income_stats_invalidate_dates'
+_INCOME_STATS_STUDENT_FIELDS = ('agentId', 'name', 'phone_number', 'level', 'isDeleted')
+_INCOME_STATS_TASK_FIELDS = ('status', 'commission', 'target_student_id', 'is_virtual')
+
+
+def _mark_income_stats_dirty(target, stat_date: date = None) -> None:
+    """记录需要清除的统计日期（None 表示全部），不在会话中时立即清除"""
+    session = object_session(target)
+    if session is None:
+        AuthService.invalidate_income_stats_cache(stat_date)
+        return
+    session.info.setdefault(_INCOME_STATS_PENDING_KEY, set()).add(stat_date)
+
+
+def _mark_task_dirty(target) -> None:
+    if target.created_at is not None:
+        _mark_income_stats_dirty(target, target.created_at.date())
+
+
+@event.listens_for(Agents, 'after_update')
+def _invalidate_income_stats_on_agent_rebate_change(mapper, connection, target):
+    """代理返佣比例变更影响所有日期的实际收入"""
+    if inspect(target).attrs.agent_rebate.history.has_changes():
+        _mark_income_stats_dirty(target)
+
+
+@event.listens_for(UserInfo, 'after_insert')
+@event.listens_for(UserInfo, 'after_delete')
+def _invalidate_income_stats_on_student_change(mapper, connection, target):
+    if target.level == '3':
+        _mark_income_stats_dirty(target)
+
+
+@event.listens_for(UserInfo, 'after_update')
+def _invalidate_income_stats_on_student_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if any(getattr(attrs, field).history.has_changes() for field in _INCOME_STATS_STUDENT_FIELDS):
+        _mark_income_stats_dirty(target)
+
+
+@event.listens_for(Tasks, 'after_insert')
+@event.listens_for(Tasks, 'after_delete')
+def _invalidate_income_stats_on_task_change(mapper, connection, target):
+    if target.is_virtual:
+        _mark_task_dirty(target)
+
+
+@event.listens_for(Tasks, 'after_update')
+def _invalidate_income_stats_on_task_update(mapper, connection, target):
+    """任务完成、佣金调整等只清除任务创建日期的缓存，创建时间被修改时全部清除"""
+    attrs = inspect(target).attrs
+    if attrs.created_at.history.has_changes():
+        _mark_income_stats_dirty(target)
+    elif any(getattr(attrs, field).history.has_changes() for field in _INCOME_STATS_TASK_FIELDS):
+        _mark_task_dirty(target)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _flush_income_stats_invalidation(session, transaction):
+    """最外层事务结束（提交后）才清除缓存，避免并发请求在提交前重新缓存旧数据"""
+    if transaction.parent is not None:
+        return
+    dates = session.info.pop(_INCOME_STATS_PENDING_KEY, None)
+    if not dates:
+        return
+    if None in dates:
+        AuthService.invalidate_income_stats_cache()
+        return
+    for stat_date in dates:
+        AuthService.invalidate_income_stats_cache(stat_date)
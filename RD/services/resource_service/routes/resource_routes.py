@@ -6,6 +6,7 @@ import logging
 from shared.dependencies.database import get_db
 from shared.dependencies.auth import get_current_active_user
 from shared.exceptions import BusinessException
+from shared.middlewares.response_transform_middleware import TransformedJSONRoute
 from ..service.resource_service import ResourceService
 from ..schemas.resource_schemas import (
     CategoryResponse, ImageResponse, ImageListResponse, UploadResponse,
@@ -16,7 +17,7 @@ from ..schemas.resource_schemas import (
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/resources", tags=["资源库管理"])
+router = APIRouter(prefix="/api/resources", tags=["资源库管理"], route_class=TransformedJSONRoute)
 
 @router.get("", summary="获取资源列表")
 async def get_resources(
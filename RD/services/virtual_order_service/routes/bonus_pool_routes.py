@@ -1,17 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import Optional
 from datetime import date, datetime
-import io
 
 from shared.database.session import get_db
 from shared.schemas.common import ResponseSchema
 from shared.exceptions import BusinessException
+from shared.middlewares.response_transform_middleware import TransformedJSONRoute
 from ..service.bonus_pool_service import BonusPoolService
 from ..service.virtual_order_service import VirtualOrderService
+from ..utils.excel_utils import StreamingExporter
 
-router = APIRouter(prefix="/bonusPool", tags=["奖金池管理"])
+router = APIRouter(prefix="/bonusPool", tags=["奖金池管理"], route_class=TransformedJSONRoute)
 
 @router.get("/status")
 async def get_bonus_pool_status(
@@ -90,9 +92,10 @@ async def export_daily_subsidy_stats(
     start_date: Optional[date] = Query(None, description="开始日期，格式：YYYY-MM-DD"),
     end_date: Optional[date] = Query(None, description="结束日期，格式：YYYY-MM-DD，默认为今天"),
     days: Optional[int] = Query(7, description="查询天数，当start_date和end_date都为空时使用，默认7天"),
+    file_format: str = Query("xlsx", alias="format", description="导出格式：xlsx 或 csv"),
     db: Session = Depends(get_db)
 ):
-    """导出每日补贴统计数据为Excel
+    """导出每日补贴统计数据（默认Excel，可选CSV）
 
     导出数据包含：
     - 每天补贴总金额
@@ -107,7 +110,9 @@ async def export_daily_subsidy_stats(
     """
     try:
         service = BonusPoolService(db)
-        excel_data = service.export_daily_subsidy_stats(start_date, end_date, days)
+        content = await run_in_threadpool(
+            service.export_daily_subsidy_stats, start_date, end_date, days, file_format
+        )
 
         # 生成文件名
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -117,17 +122,13 @@ async def export_daily_subsidy_stats(
         elif days:
             date_range = f"_最近{days}天"
 
-        filename = f"每日补贴统计{date_range}_{timestamp}.xlsx"
+        filename = f"每日补贴统计{date_range}_{timestamp}.{file_format}"
 
-        # 返回Excel文件 - 修复中文文件名编码问题
-        from urllib.parse import quote
-        encoded_filename = quote(filename, encoding='utf-8')
+        # 分块返回文件（中文文件名按RFC 5987编码）
         return StreamingResponse(
-            io.BytesIO(excel_data),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={
-                "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"
-            }
+            content,
+            media_type=StreamingExporter.media_type(file_format),
+            headers=StreamingExporter.content_disposition(filename)
         )
 
     except BusinessException as e:
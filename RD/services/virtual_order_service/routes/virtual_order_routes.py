@@ -5,13 +5,14 @@ import uuid
 import logging
 from datetime import datetime, date
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 
 logger = logging.getLogger(__name__)
-import io
 
 from shared.database.session import get_db
 from shared.schemas.common import ResponseSchema
 from shared.exceptions import BusinessException
+from shared.middlewares.response_transform_middleware import TransformedJSONRoute
 from ..api.api_docs import VirtualOrderApiDocs
 from ..schemas.virtual_order_schemas import (
     StudentSubsidyImportResponse,
@@ -36,9 +37,9 @@ from ..schemas.virtual_order_schemas import (
     StudentPoolDeleteResponse
 )
 from ..service.virtual_order_service import VirtualOrderService
-from ..utils.excel_utils import ExcelProcessor
+from ..utils.excel_utils import ExcelProcessor, StreamingExporter
 
-router = APIRouter()
+router = APIRouter(route_class=TransformedJSONRoute)
 
 @router.post(
     "/import/studentSubsidy",
@@ -399,24 +400,25 @@ async def delete_virtual_customer_service(
     **VirtualOrderApiDocs.EXPORT_STUDENT_INCOME
 )
 async def export_student_income(
+    file_format: str = Query("xlsx", alias="format", description="导出格式：xlsx 或 csv"),
     db: Session = Depends(get_db)
 ):
-    """导出学生收入数据为Excel（导出所有数据，无需参数）"""
+    """导出学生收入数据（导出所有数据，默认Excel，可选CSV）"""
     try:
         service = VirtualOrderService(db)
 
-        # 导出所有学生收入数据（不传任何过滤参数）
-        excel_data = service.export_student_income_data()
+        # 导出所有学生收入数据（不传任何过滤参数），在线程池中生成，避免阻塞事件循环
+        content = await run_in_threadpool(service.export_student_income_data, file_format=file_format)
 
         # 生成文件名
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"student_income_all_{timestamp}.xlsx"
+        filename = f"student_income_all_{timestamp}.{file_format}"
 
-        # 返回Excel文件
+        # 分块返回文件
         return StreamingResponse(
-            io.BytesIO(excel_data),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+            content,
+            media_type=StreamingExporter.media_type(file_format),
+            headers=StreamingExporter.content_disposition(filename)
         )
 
     except BusinessException as e:
@@ -465,13 +467,16 @@ async def get_student_income_summary(
     "/sync/completedTasks",
     response_model=ResponseSchema[dict],
     summary="同步已完成虚拟任务",
-    description="同步所有已完成的虚拟任务到学生补贴池，更新完成金额"
+    description="同步已完成的虚拟任务到学生补贴池，更新完成金额。默认只处理上次同步后有变动的任务，full_rebuild=true 时全量重建"
 )
-async def sync_completed_virtual_tasks(db: Session = Depends(get_db)):
+async def sync_completed_virtual_tasks(
+    full_rebuild: bool = Query(False, description="是否全量重建所有学生补贴池"),
+    db: Session = Depends(get_db)
+):
     """同步已完成虚拟任务到学生补贴池"""
     try:
         service = VirtualOrderService(db)
-        result = service.sync_completed_virtual_tasks()
+        result = service.sync_completed_virtual_tasks(full_rebuild=full_rebuild)
 
         return ResponseSchema[dict](
             code=200,
@@ -552,6 +557,21 @@ async def manual_check_auto_confirm_tasks():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"手动检查自动确认任务失败: {str(e)}")
 
+@router.get(
+    "/valueRecyclingMetrics",
+    response_model=ResponseSchema[dict],
+    summary="获取价值回收运行指标",
+    description="获取最近一次价值回收的积压深度、处理数量、批次大小和消化速度"
+)
+async def get_value_recycling_metrics():
+    """获取价值回收运行指标"""
+    from ..service.task_scheduler import get_value_recycling_metrics
+    return ResponseSchema[dict](
+        code=200,
+        message="获取价值回收运行指标成功",
+        data=get_value_recycling_metrics()
+    )
+
 @router.get(
     "/autoConfirmConfig",
     response_model=ResponseSchema[dict],
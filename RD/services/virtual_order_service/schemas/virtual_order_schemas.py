@@ -3,6 +3,9 @@ from pydantic import BaseModel, Field
 from datetime import datetime, date
 from decimal import Decimal
 
+# 响应模型继承 CamelResponseModel：驼峰别名在定义时生成，接口直接输出驼峰 key
+from shared.schemas.base import CamelResponseModel
+
 # 基础响应模型
 class BaseResponse(BaseModel):
     code: int = 200
@@ -15,7 +18,7 @@ class StudentSubsidyImportRequest(BaseModel):
     pass  # 文件上传通过FastAPI的UploadFile处理
 
 # 学生补贴导入响应
-class StudentSubsidyImportResponse(BaseModel):
+class StudentSubsidyImportResponse(CamelResponseModel):
     """学生补贴导入响应"""
     import_batch: str = Field(..., description="导入批次号")
     total_students: int = Field(..., description="导入学生总数")
@@ -23,14 +26,14 @@ class StudentSubsidyImportResponse(BaseModel):
     generated_tasks: int = Field(..., description="生成的虚拟任务数量")
 
 # 专用客服导入响应
-class CustomerServiceImportResponse(BaseModel):
+class CustomerServiceImportResponse(CamelResponseModel):
     """专用客服导入响应"""
     total_imported: int = Field(..., description="成功导入数量")
     failed_count: int = Field(..., description="失败数量")
     failed_details: Optional[List[str]] = Field(None, description="失败详情")
 
 # 虚拟订单统计响应
-class VirtualOrderStatsResponse(BaseModel):
+class VirtualOrderStatsResponse(CamelResponseModel):
     """虚拟订单统计响应"""
     total_students: int = Field(..., description="总学生数")
     total_subsidy: Decimal = Field(..., description="总补贴金额")
@@ -39,7 +42,7 @@ class VirtualOrderStatsResponse(BaseModel):
     completion_rate: float = Field(..., description="完成率")
 
 # 虚拟订单当天统计响应
-class VirtualOrderDailyStatsResponse(BaseModel):
+class VirtualOrderDailyStatsResponse(CamelResponseModel):
     """虚拟订单当天统计响应"""
     date: str = Field(..., description="统计日期")
     daily_tasks_generated: int = Field(..., description="当天生成的任务数")
@@ -49,7 +52,7 @@ class VirtualOrderDailyStatsResponse(BaseModel):
     daily_completion_rate: float = Field(..., description="当天完成率")
 
 # 学生补贴池信息
-class StudentPoolInfo(BaseModel):
+class StudentPoolInfo(CamelResponseModel):
     """学生补贴池信息"""
     id: int
     student_id: int
@@ -73,7 +76,7 @@ class StudentPoolInfo(BaseModel):
         from_attributes = True
 
 # 学生补贴池列表响应
-class StudentPoolListResponse(BaseModel):
+class StudentPoolListResponse(CamelResponseModel):
     """学生补贴池列表响应"""
     items: List[StudentPoolInfo]
     total: int
@@ -86,7 +89,7 @@ class ReallocateTasksRequest(BaseModel):
     student_id: int = Field(..., description="学生ID")
 
 # 重新分配任务响应
-class ReallocateTasksResponse(BaseModel):
+class ReallocateTasksResponse(CamelResponseModel):
     """重新分配任务响应"""
     student_id: int
     remaining_amount: Decimal
@@ -100,7 +103,7 @@ class GenerateReportRequest(BaseModel):
     student_ids: Optional[List[int]] = Field(None, description="指定学生ID列表，为空则包含所有学生")
 
 # 报表生成响应
-class GenerateReportResponse(BaseModel):
+class GenerateReportResponse(CamelResponseModel):
     """报表生成响应"""
     report_url: str = Field(..., description="报表下载链接")
     total_records: int = Field(..., description="报表记录总数")
@@ -131,7 +134,7 @@ class VirtualCustomerServiceCreate(BaseModel):
     account: str = Field(..., description="客服账号")
     initial_password: str = Field("123456", description="初始密码")
 
-class VirtualCustomerServiceResponse(BaseModel):
+class VirtualCustomerServiceResponse(CamelResponseModel):
     """虚拟客服响应"""
     id: int
     user_id: int
@@ -141,7 +144,7 @@ class VirtualCustomerServiceResponse(BaseModel):
     status: str
     initial_password: str
 
-class VirtualCustomerServiceInfo(BaseModel):
+class VirtualCustomerServiceInfo(CamelResponseModel):
     """虚拟客服信息"""
     id: int
     user_id: int
@@ -155,7 +158,7 @@ class VirtualCustomerServiceInfo(BaseModel):
     class Config:
         from_attributes = True
 
-class VirtualCustomerServiceListResponse(BaseModel):
+class VirtualCustomerServiceListResponse(CamelResponseModel):
     """虚拟客服列表响应"""
     items: List[VirtualCustomerServiceInfo]
     total: int
@@ -171,7 +174,7 @@ class VirtualCustomerServiceUpdate(BaseModel):
     class Config:
         allow_population_by_field_name = True  # 允许通过字段名和别名两种方式赋值
 
-class VirtualCustomerServiceUpdateResponse(BaseModel):
+class VirtualCustomerServiceUpdateResponse(CamelResponseModel):
     """更新虚拟客服响应"""
     id: int
     name: str
@@ -179,7 +182,7 @@ class VirtualCustomerServiceUpdateResponse(BaseModel):
     status: str
     updated_fields: List[str]
 
-class VirtualCustomerServiceDeleteResponse(BaseModel):
+class VirtualCustomerServiceDeleteResponse(CamelResponseModel):
     """删除虚拟客服响应"""
     id: int
     name: str
@@ -193,14 +196,14 @@ class StudentIncomeExportRequest(BaseModel):
     end_date: Optional[date] = Field(None, description="结束日期")
     student_ids: Optional[List[int]] = Field(None, description="指定学生ID列表")
 
-class StudentIncomeExportResponse(BaseModel):
+class StudentIncomeExportResponse(CamelResponseModel):
     """学生收入导出响应"""
     filename: str = Field(..., description="文件名")
     download_url: str = Field(..., description="下载链接")
     total_records: int = Field(..., description="导出记录数")
     export_time: str = Field(..., description="导出时间")
 
-class StudentIncomeSummaryResponse(BaseModel):
+class StudentIncomeSummaryResponse(CamelResponseModel):
     """学生收入汇总响应"""
     total_students: int = Field(..., description="学生总数")
     total_tasks: int = Field(..., description="任务总数")
@@ -217,7 +220,7 @@ class StudentIncomeExportRequest(BaseModel):
     end_date: Optional[str] = Field(None, description="结束日期 (YYYY-MM-DD)")
     student_ids: Optional[List[int]] = Field(None, description="指定学生ID列表，为空则导出所有学生")
 
-class StudentIncomeStatsResponse(BaseModel):
+class StudentIncomeStatsResponse(CamelResponseModel):
     """学生收入统计响应"""
     total_students: int = Field(..., description="学生总数")
     total_tasks: int = Field(..., description="任务总数")
@@ -227,7 +230,7 @@ class StudentIncomeStatsResponse(BaseModel):
     date_range: dict = Field(..., description="日期范围")
 
 # 学生补贴池删除相关模型
-class StudentPoolDeleteResponse(BaseModel):
+class StudentPoolDeleteResponse(CamelResponseModel):
     """删除学生补贴池响应"""
     id: int = Field(..., description="补贴池ID")
     student_id: int = Field(..., description="学生ID")
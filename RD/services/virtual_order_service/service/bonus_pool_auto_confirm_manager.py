@@ -8,9 +8,9 @@ from sqlalchemy import and_, func
 from shared.models.tasks import Tasks
 from shared.models.studenttask import StudentTask
 from shared.models.userinfo import UserInfo
-from shared.models.agents import Agents
 from shared.models.virtual_order_pool import VirtualOrderPool
 from .virtual_order_service import VirtualOrderService
+from .rebate_rate_resolver import RebateRateResolver
 
 logger = logging.getLogger(__name__)
 
@@ -22,7 +22,7 @@ class BonusPoolAutoConfirmManager:
     
     def get_student_rebate_rate(self, student_id: int) -> Decimal:
         """
-        获取学生的返佣比例（复制自VirtualOrderService）
+        获取学生的返佣比例
         
         Args:
             student_id: 学生ID（roleId）
@@ -30,33 +30,7 @@ class BonusPoolAutoConfirmManager:
         Returns:
             Decimal: 返佣比例（如0.6表示60%）
         """
-        # 查询学生信息
-        student = self.db.query(UserInfo).filter(
-            UserInfo.roleId == student_id
-        ).first()
-        
-        if not student or not student.agentId:
-            return Decimal('0.6')  # 默认返佣比例60%
-        
-        # 查询代理信息
-        agent = self.db.query(Agents).filter(
-            Agents.id == student.agentId
-        ).first()
-        
-        if not agent or not agent.agent_rebate:
-            return Decimal('0.6')  # 默认返佣比例60%
-        
-        # 处理返佣比例字符串
-        rebate_str = agent.agent_rebate.replace('%', '') if '%' in agent.agent_rebate else agent.agent_rebate
-        try:
-            rebate_value = float(rebate_str)
-            # 如果值大于1，说明是百分比形式（如60），需要除以100
-            if rebate_value > 1:
-                return Decimal(str(rebate_value / 100))
-            else:
-                return Decimal(str(rebate_value))
-        except:
-            return Decimal('0.6')  # 解析失败时使用默认值
+        return RebateRateResolver(self.db).get_rate(student_id)
     
     async def check_bonus_pool_auto_confirm_tasks(self, interval_hours: int = 1, max_batch_size: int = 50) -> Dict[str, Any]:
         """
@@ -1,9 +1,13 @@
 from datetime import datetime, timedelta, date
 from decimal import Decimal
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_, func, case
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+import copy
+import time
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -15,12 +19,22 @@ from shared.models.userinfo import UserInfo
 from shared.models.agents import Agents
 from shared.exceptions import BusinessException
 from .virtual_order_service import VirtualOrderService
+from .rebate_rate_resolver import DEFAULT_REBATE_RATE, parse_agent_rebate
+from .daily_rollup_service import DailyRollupService
+from ..utils.excel_utils import ExportSheet, StreamingExporter, EXPORT_FORMATS
 
 logger = logging.getLogger(__name__)
 
 class BonusPoolService:
     """奖金池服务类"""
 
+    # 每日补贴统计缓存：只缓存已结束的日期（跨天完成和每日达标更新会修改前一天的数据，
+    # 因此前天及更早才视为已结束），{date: (stat, expire_at)}，所有实例共享
+    CLOSED_DAY_OFFSET = 2
+    DAILY_STATS_CACHE_TTL = 3600
+    _daily_stats_cache: Dict[date, Tuple[Dict[str, Any], float]] = {}
+    _daily_stats_cache_lock = threading.Lock()
+
     def __init__(self, db: Session):
         self.db = db
         self.virtual_order_service = VirtualOrderService(db)
@@ -180,12 +194,16 @@ class BonusPoolService:
             'is_achieved': is_achieved
         }
 
-    def update_daily_achievements(self, target_date: date = None) -> Dict[str, Any]:
+    def update_daily_achievements(self, target_date: date = None, chunk_size: int = 1000) -> Dict[str, Any]:
         """
         更新所有学生的每日达标记录
 
+        通过一次分组聚合（学生 LEFT JOIN 当日已完成虚拟任务汇总 LEFT JOIN 代理返佣比例）
+        计算所有学生的达标情况，再分批 INSERT ... ON DUPLICATE KEY UPDATE 写入达标记录。
+
         Args:
             target_date: 目标日期，默认为昨天
+            chunk_size: 每批写入的记录数
 
         Returns:
             Dict: 更新统计
@@ -193,53 +211,74 @@ class BonusPoolService:
         if target_date is None:
             target_date = date.today() - timedelta(days=1)
 
-        # 获取所有学生
-        students = self.db.query(UserInfo).filter(
+        day_start = datetime.combine(target_date, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+
+        # 当日已完成虚拟任务面值汇总（按创建时间范围过滤，可使用索引）
+        completed_tasks = self.db.query(
+            Tasks.target_student_id.label('student_id'),
+            func.sum(Tasks.commission).label('completed_face_value')
+        ).filter(
+            Tasks.is_virtual == True,
+            Tasks.status == '4',  # 已完成
+            Tasks.created_at >= day_start,
+            Tasks.created_at < day_end
+        ).group_by(Tasks.target_student_id).subquery()
+
+        # 所有学生及其当日完成面值、代理返佣比例
+        students = self.db.query(
+            UserInfo.roleId,
+            UserInfo.name,
+            UserInfo.agentId,
+            Agents.agent_rebate,
+            completed_tasks.c.completed_face_value
+        ).outerjoin(
+            Agents, Agents.id == UserInfo.agentId
+        ).outerjoin(
+            completed_tasks, completed_tasks.c.student_id == UserInfo.roleId
+        ).filter(
             UserInfo.level == '3',  # 学生级别
             UserInfo.isDeleted == False
         ).all()
 
-        total_students = 0
-        achieved_students = 0
-
-        for student in students:
-            try:
-                # 计算达标情况
-                achievement_data = self.calculate_student_daily_achievement(
-                    student.roleId, target_date
-                )
-
-                # 查找或创建记录
-                achievement = self.db.query(StudentDailyAchievement).filter(
-                    StudentDailyAchievement.student_id == student.roleId,
-                    StudentDailyAchievement.achievement_date == target_date
-                ).first()
+        daily_target = self.get_daily_target()
 
-                if achievement:
-                    # 更新现有记录（使用实际消耗的补贴）
-                    achievement.completed_amount = achievement_data['consumed_subsidy']
-                    achievement.is_achieved = achievement_data['is_achieved']
-                else:
-                    # 创建新记录（使用实际消耗的补贴）
-                    achievement = StudentDailyAchievement(
-                        student_id=student.roleId,
-                        student_name=achievement_data['student_name'],
-                        achievement_date=target_date,
-                        daily_target=achievement_data['daily_target'],
-                        completed_amount=achievement_data['consumed_subsidy'],  # 使用实际消耗的补贴
-                        is_achieved=achievement_data['is_achieved']
-                    )
-                    self.db.add(achievement)
-
-                total_students += 1
-                if achievement_data['is_achieved']:
-                    achieved_students += 1
+        rows = []
+        achieved_students = 0
+        for role_id, name, agent_id, agent_rebate, completed_face_value in students:
+            # 计算实际消耗的补贴（面值 × 返佣比例）
+            rebate_rate = parse_agent_rebate(agent_rebate) if agent_id else DEFAULT_REBATE_RATE
+            consumed_subsidy = (completed_face_value or Decimal('0')) * rebate_rate
+
+            # 判断是否达标（基于实际消耗的补贴）
+            is_achieved = consumed_subsidy >= daily_target
+            if is_achieved:
+                achieved_students += 1
+
+            rows.append({
+                'student_id': role_id,
+                'student_name': name or '',
+                'achievement_date': target_date,
+                'daily_target': daily_target,
+                'completed_amount': consumed_subsidy,  # 使用实际消耗的补贴
+                'is_achieved': is_achieved,
+                'created_at': datetime.now()
+            })
 
-            except Exception as e:
-                print(f"更新学生 {student.roleId} 达标记录失败: {str(e)}")
-                continue
+        # 批量写入：已存在的记录只更新完成金额和达标状态
+        for i in range(0, len(rows), chunk_size):
+            stmt = mysql_insert(StudentDailyAchievement).values(rows[i:i + chunk_size])
+            stmt = stmt.on_duplicate_key_update(
+                completed_amount=stmt.inserted.completed_amount,
+                is_achieved=stmt.inserted.is_achieved
+            )
+            self.db.execute(stmt)
 
         self.db.commit()
+        self.invalidate_daily_stats_cache(target_date)
+
+        total_students = len(rows)
+        logger.info(f"{target_date} 学生达标记录更新完成: 共 {total_students} 人，达标 {achieved_students} 人")
 
         return {
             'date': target_date.isoformat(),
@@ -273,12 +312,92 @@ class BonusPoolService:
 
         return achievement is not None
 
-    def collect_unachieved_students_subsidy(self, target_date: date = None) -> Dict[str, Any]:
+    def _student_subsidy_query(self, target_date: date):
+        """
+        达标记录关联补贴池剩余金额的查询（一次关联查询）
+
+        每个学生取id最小的有效补贴池（与逐个查询时的 .first() 一致），
+        剩余金额叠加尚未汇总的补贴流水。
+        """
+        from shared.models.virtual_order_pool import VirtualOrderPool
+        from shared.models.subsidy_ledger import SubsidyLedger
+
+        student_pools = self.db.query(
+            VirtualOrderPool.student_id.label('student_id'),
+            func.min(VirtualOrderPool.id).label('pool_id')
+        ).filter(
+            VirtualOrderPool.is_deleted == False,
+            VirtualOrderPool.status == 'active'
+        ).group_by(VirtualOrderPool.student_id).subquery()
+
+        pending = self.db.query(
+            SubsidyLedger.pool_id.label('pool_id'),
+            func.sum(SubsidyLedger.remaining_delta).label('remaining_delta')
+        ).filter(
+            SubsidyLedger.is_materialized == False
+        ).group_by(SubsidyLedger.pool_id).subquery()
+
+        pool_remaining = func.greatest(
+            func.coalesce(VirtualOrderPool.remaining_amount, 0) + func.coalesce(pending.c.remaining_delta, 0), 0
+        )
+
+        return self.db.query(
+            StudentDailyAchievement.student_id,
+            StudentDailyAchievement.student_name,
+            StudentDailyAchievement.completed_amount,
+            StudentDailyAchievement.is_achieved,
+            func.coalesce(pool_remaining, 0).label('pool_remaining_amount')
+        ).outerjoin(
+            student_pools, student_pools.c.student_id == StudentDailyAchievement.student_id
+        ).outerjoin(
+            VirtualOrderPool, VirtualOrderPool.id == student_pools.c.pool_id
+        ).outerjoin(
+            pending, pending.c.pool_id == student_pools.c.pool_id
+        ).filter(
+            StudentDailyAchievement.achievement_date == target_date
+        ), pool_remaining
+
+    @staticmethod
+    def _student_subsidy_item(row) -> Dict[str, Any]:
+        """达标学员剩余补贴为0（不进入奖金池），没达标学员使用补贴池的剩余金额"""
+        pool_remaining = float(row.pool_remaining_amount or 0)
+        return {
+            'student_id': row.student_id,
+            'student_name': row.student_name,
+            'consumed_subsidy': float(row.completed_amount),
+            'pool_remaining_amount': pool_remaining,
+            'remaining_subsidy': 0.0 if row.is_achieved else pool_remaining
+        }
+
+    def iter_students_subsidy(self, target_date: date = None, batch_size: int = 1000):
+        """
+        流式返回学员剩余补贴明细（逐行读取，不在内存中构建完整列表）
+
+        Args:
+            target_date: 目标日期，默认为昨天
+            batch_size: 每次从数据库读取的行数
+
+        Yields:
+            Dict: 学员剩余补贴明细，包含 is_achieved 字段
+        """
+        if target_date is None:
+            target_date = date.today() - timedelta(days=1)
+
+        query, _ = self._student_subsidy_query(target_date)
+        for row in query.yield_per(batch_size):
+            item = self._student_subsidy_item(row)
+            item['is_achieved'] = bool(row.is_achieved)
+            yield item
+
+    def collect_unachieved_students_subsidy(self, target_date: date = None,
+                                            include_breakdown: bool = True) -> Dict[str, Any]:
         """
         收集没达标学员的剩余补贴（基于补贴池实际剩余金额）
 
         Args:
             target_date: 目标日期，默认为昨天
+            include_breakdown: 是否返回学员明细；为False时只通过一次聚合查询返回汇总，
+                               需要明细又不想一次加载时使用 iter_students_subsidy
 
         Returns:
             Dict: 剩余补贴统计
@@ -286,60 +405,42 @@ class BonusPoolService:
         if target_date is None:
             target_date = date.today() - timedelta(days=1)
 
-        from shared.models.virtual_order_pool import VirtualOrderPool
+        query, pool_remaining = self._student_subsidy_query(target_date)
 
-        # 查询所有学员的达标记录
-        achievements = self.db.query(StudentDailyAchievement).filter(
-            StudentDailyAchievement.achievement_date == target_date
-        ).all()
+        if not include_breakdown:
+            total_students, achieved_count, total_remaining_subsidy = query.with_entities(
+                func.count(StudentDailyAchievement.id),
+                func.sum(case((StudentDailyAchievement.is_achieved == True, 1), else_=0)),
+                func.sum(case(
+                    (StudentDailyAchievement.is_achieved == False, func.coalesce(pool_remaining, 0)),
+                    else_=0
+                ))
+            ).one()
+
+            achieved_count = int(achieved_count or 0)
+            return {
+                'target_date': target_date.isoformat(),
+                'total_students': total_students,
+                'achieved_students_count': achieved_count,
+                'unachieved_students_count': total_students - achieved_count,
+                'total_remaining_subsidy': float(total_remaining_subsidy or 0)
+            }
 
         total_remaining_subsidy = Decimal('0')
         unachieved_students = []
         achieved_students = []
 
-        for achievement in achievements:
-            # 查询该学员的补贴池信息
-            student_pool = self.db.query(VirtualOrderPool).filter(
-                VirtualOrderPool.student_id == achievement.student_id,
-                VirtualOrderPool.is_deleted == False,
-                VirtualOrderPool.status == 'active'
-            ).first()
-
-            if achievement.is_achieved:
-                # 达标学员：剩余补贴为0（不进入奖金池）
-                pool_remaining = float(student_pool.remaining_amount) if student_pool else 0.0
-                achieved_students.append({
-                    'student_id': achievement.student_id,
-                    'student_name': achievement.student_name,
-                    'consumed_subsidy': float(achievement.completed_amount),
-                    'pool_remaining_amount': pool_remaining,
-                    'remaining_subsidy': 0.0  # 达标学员不贡献奖金池
-                })
+        for row in query.all():
+            item = self._student_subsidy_item(row)
+            if row.is_achieved:
+                achieved_students.append(item)
             else:
-                # 没达标学员：使用补贴池的剩余金额
-                if student_pool and student_pool.remaining_amount > 0:
-                    pool_remaining = student_pool.remaining_amount
-                    total_remaining_subsidy += pool_remaining
-                    unachieved_students.append({
-                        'student_id': achievement.student_id,
-                        'student_name': achievement.student_name,
-                        'consumed_subsidy': float(achievement.completed_amount),
-                        'pool_remaining_amount': float(pool_remaining),
-                        'remaining_subsidy': float(pool_remaining)  # 使用补贴池剩余金额
-                    })
-                else:
-                    # 没有补贴池或剩余金额为0
-                    unachieved_students.append({
-                        'student_id': achievement.student_id,
-                        'student_name': achievement.student_name,
-                        'consumed_subsidy': float(achievement.completed_amount),
-                        'pool_remaining_amount': 0.0,
-                        'remaining_subsidy': 0.0
-                    })
+                total_remaining_subsidy += Decimal(str(row.pool_remaining_amount or 0))
+                unachieved_students.append(item)
 
         return {
             'target_date': target_date.isoformat(),
-            'total_students': len(achievements),
+            'total_students': len(achieved_students) + len(unachieved_students),
             'achieved_students_count': len(achieved_students),
             'unachieved_students_count': len(unachieved_students),
             'total_remaining_subsidy': float(total_remaining_subsidy),
@@ -413,7 +514,7 @@ class BonusPoolService:
 
         # 收集昨天没达标学员的剩余补贴
         yesterday = pool_date - timedelta(days=1)
-        subsidy_data = self.collect_unachieved_students_subsidy(yesterday)
+        subsidy_data = self.collect_unachieved_students_subsidy(yesterday, include_breakdown=False)
 
         # 同时收集过期任务（保留原有逻辑）
         expired_data = self.collect_expired_virtual_tasks(yesterday)
@@ -1028,6 +1129,8 @@ class BonusPoolService:
         """
         获取每日补贴统计数据
 
+        整个日期范围通过四个按日分组的查询计算，已结束日期的结果在进程内缓存。
+
         Args:
             start_date: 开始日期，默认为7天前
             end_date: 结束日期，默认为今天
@@ -1048,93 +1151,26 @@ class BonusPoolService:
             if start_date > end_date:
                 start_date, end_date = end_date, start_date
 
-            daily_stats = []
-            current_date = start_date
-
-            while current_date <= end_date:
-                # 获取当日奖金池数据
-                bonus_pool = self.db.query(BonusPool).filter(
-                    BonusPool.pool_date == current_date
-                ).first()
-
-                # 统计当日任务数据（包括虚拟任务和奖金池任务）
-                task_stats = self.db.query(
-                    func.count(Tasks.id).label('total_generated'),
-                    func.count(case((Tasks.status == '4', 1))).label('total_completed'),
-                    func.sum(case((Tasks.status == '4', Tasks.commission), else_=0)).label('completed_amount')
-                ).filter(
-                    Tasks.is_virtual == True,
-                    func.date(Tasks.created_at) == current_date
-                ).first()
-
-                # 统计当日学员补贴总金额（每个学员的固定补贴金额总和）
-                from shared.models.virtual_order_pool import VirtualOrderPool
-                subsidy_stats = self.db.query(
-                    func.count(VirtualOrderPool.id).label('total_students'),
-                    func.sum(VirtualOrderPool.total_subsidy).label('total_subsidy_amount')
-                ).filter(
-                    VirtualOrderPool.is_deleted == False,
-                    func.date(VirtualOrderPool.created_at) <= current_date  # 在当日或之前创建的补贴池
-                ).first()
-
-                # 统计当日学生达标情况
-                achievement_stats = self.db.query(
-                    func.count(StudentDailyAchievement.id).label('total_students'),
-                    func.count(case((StudentDailyAchievement.is_achieved == True, 1))).label('achieved_students'),
-                    func.sum(StudentDailyAchievement.completed_amount).label('total_completed_amount')
-                ).filter(
-                    StudentDailyAchievement.achievement_date == current_date
-                ).first()
-
-                # 计算统计数据
-                total_generated = task_stats.total_generated or 0
-                total_completed = task_stats.total_completed or 0
-                actual_earned_amount = float(task_stats.completed_amount or 0)
-
-                # 计算当日补贴总金额（所有学员的固定补贴金额总和）
-                total_subsidy_amount = float(subsidy_stats.total_subsidy_amount or 0)
-                active_students_count = subsidy_stats.total_students or 0
-
-                # 计算完成率
-                completion_rate = 0.0
-                if total_generated > 0:
-                    completion_rate = round((total_completed / total_generated) * 100, 2)
-
-                # 奖金池相关数据
-                bonus_pool_data = {
-                    'total_amount': 0.0,
-                    'remaining_amount': 0.0,
-                    'generated_amount': 0.0,
-                    'completed_amount': 0.0
-                }
-
-                if bonus_pool:
-                    bonus_pool_data = {
-                        'total_amount': float(bonus_pool.total_amount),
-                        'remaining_amount': float(bonus_pool.remaining_amount),
-                        'generated_amount': float(bonus_pool.generated_amount),
-                        'completed_amount': float(bonus_pool.completed_amount)
-                    }
-
-                daily_stat = {
-                    'date': current_date.isoformat(),
-                    'subsidy_total_amount': total_subsidy_amount,  # 每天补贴总金额（所有学员固定补贴总和）
-                    'remaining_amount': bonus_pool_data['remaining_amount'],  # 剩余金额（奖金池）
-                    'actual_earned_amount': actual_earned_amount,  # 实际获得金额
-                    'completion_rate': completion_rate,  # 每天完成率
-                    'tasks_generated': total_generated,  # 每天生成任务数
-                    'tasks_completed': total_completed,  # 完成数
-                    'active_students_count': active_students_count,  # 当日有补贴的学员数量
-                    'bonus_pool': bonus_pool_data,  # 奖金池详细数据
-                    'achievement_stats': {
-                        'total_students': achievement_stats.total_students or 0,
-                        'achieved_students': achievement_stats.achieved_students or 0,
-                        'total_completed_amount': float(achievement_stats.total_completed_amount or 0)
-                    }
-                }
+            # 已结束的日期使用缓存，其余日期通过分组查询一次计算
+            today = date.today()
+            daily_stats_by_date = self._get_cached_daily_stats(start_date, end_date)
+            missing_dates = [
+                start_date + timedelta(days=i)
+                for i in range((end_date - start_date).days + 1)
+                if start_date + timedelta(days=i) not in daily_stats_by_date
+            ]
+
+            if missing_dates:
+                computed = self._compute_daily_subsidy_stats(missing_dates[0], missing_dates[-1])
+                daily_stats_by_date.update(
+                    (stat_date, computed[stat_date]) for stat_date in missing_dates
+                )
+                self._cache_closed_daily_stats(
+                    {stat_date: computed[stat_date] for stat_date in missing_dates
+                     if stat_date <= today - timedelta(days=self.CLOSED_DAY_OFFSET)}
+                )
 
-                daily_stats.append(daily_stat)
-                current_date += timedelta(days=1)
+            daily_stats = [daily_stats_by_date[stat_date] for stat_date in sorted(daily_stats_by_date)]
 
             # 将日期倒序排列，最新的日期在前
             daily_stats.reverse()
@@ -1173,99 +1209,210 @@ class BonusPoolService:
                 data=None
             )
 
-    def export_daily_subsidy_stats(self, start_date: date = None, end_date: date = None, days: int = 7) -> bytes:
+    def _compute_daily_subsidy_stats(self, start_date: date, end_date: date) -> Dict[date, Dict[str, Any]]:
+        """
+        按日分组计算日期范围内每天的补贴统计（共四个分组查询）
+
+        Returns:
+            Dict[date, Dict]: {日期: 当日统计}
+        """
+        from shared.models.virtual_order_pool import VirtualOrderPool
+
+        range_end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+
+        # 1. 奖金池数据
+        bonus_pools = {
+            pool.pool_date: pool for pool in self.db.query(BonusPool).filter(
+                BonusPool.pool_date >= start_date,
+                BonusPool.pool_date <= end_date
+            ).all()
+        }
+
+        # 2. 每日任务数据（包括虚拟任务和奖金池任务）：已关账日期读取每日汇总，其余日期聚合原始任务
+        task_stats = {
+            stat_date: (row.total_tasks_generated or 0, row.total_tasks_completed or 0, row.total_amount_completed)
+            for stat_date, row in DailyRollupService(self.db).get_closed_day_totals(start_date, end_date).items()
+        }
+        open_from = max(task_stats) + timedelta(days=1) if task_stats else start_date
+        if open_from <= end_date:
+            task_day = func.date(Tasks.created_at)
+            for row in self.db.query(
+                task_day.label('stat_date'),
+                func.count(Tasks.id).label('total_generated'),
+                func.count(case((Tasks.status == '4', 1))).label('total_completed'),
+                func.sum(case((Tasks.status == '4', Tasks.commission), else_=0)).label('completed_amount')
+            ).filter(
+                Tasks.is_virtual == True,
+                Tasks.created_at >= datetime.combine(open_from, datetime.min.time()),
+                Tasks.created_at < range_end
+            ).group_by(task_day).all():
+                task_stats[self._as_date(row.stat_date)] = (row.total_generated, row.total_completed, row.completed_amount)
+
+        # 3. 学员补贴总金额：在当日或之前创建的补贴池，开始日期之前创建的归入开始日期后累加
+        pool_day = func.greatest(func.date(VirtualOrderPool.created_at), start_date)
+        pool_additions = {
+            self._as_date(row.stat_date): row for row in self.db.query(
+                pool_day.label('stat_date'),
+                func.count(VirtualOrderPool.id).label('total_students'),
+                func.sum(VirtualOrderPool.total_subsidy).label('total_subsidy_amount')
+            ).filter(
+                VirtualOrderPool.is_deleted == False,
+                VirtualOrderPool.created_at < range_end
+            ).group_by(pool_day).all()
+        }
+
+        # 4. 学生达标情况
+        achievement_stats = {
+            row.achievement_date: row for row in self.db.query(
+                StudentDailyAchievement.achievement_date,
+                func.count(StudentDailyAchievement.id).label('total_students'),
+                func.count(case((StudentDailyAchievement.is_achieved == True, 1))).label('achieved_students'),
+                func.sum(StudentDailyAchievement.completed_amount).label('total_completed_amount')
+            ).filter(
+                StudentDailyAchievement.achievement_date >= start_date,
+                StudentDailyAchievement.achievement_date <= end_date
+            ).group_by(StudentDailyAchievement.achievement_date).all()
+        }
+
+        results = {}
+        active_students_count = 0
+        total_subsidy_amount = 0.0
+        current_date = start_date
+
+        while current_date <= end_date:
+            total_generated, total_completed, completed_amount = task_stats.get(current_date, (0, 0, 0))
+            actual_earned_amount = float(completed_amount or 0)
+
+            # 当日补贴总金额（所有学员的固定补贴金额总和）为截至当日的累计值
+            pool_row = pool_additions.get(current_date)
+            if pool_row:
+                active_students_count += pool_row.total_students or 0
+                total_subsidy_amount += float(pool_row.total_subsidy_amount or 0)
+
+            # 计算完成率
+            completion_rate = 0.0
+            if total_generated > 0:
+                completion_rate = round((total_completed / total_generated) * 100, 2)
+
+            # 奖金池相关数据
+            bonus_pool = bonus_pools.get(current_date)
+            bonus_pool_data = {
+                'total_amount': float(bonus_pool.total_amount) if bonus_pool else 0.0,
+                'remaining_amount': float(bonus_pool.remaining_amount) if bonus_pool else 0.0,
+                'generated_amount': float(bonus_pool.generated_amount) if bonus_pool else 0.0,
+                'completed_amount': float(bonus_pool.completed_amount) if bonus_pool else 0.0
+            }
+
+            achievement_row = achievement_stats.get(current_date)
+
+            results[current_date] = {
+                'date': current_date.isoformat(),
+                'subsidy_total_amount': total_subsidy_amount,  # 每天补贴总金额（所有学员固定补贴总和）
+                'remaining_amount': bonus_pool_data['remaining_amount'],  # 剩余金额（奖金池）
+                'actual_earned_amount': actual_earned_amount,  # 实际获得金额
+                'completion_rate': completion_rate,  # 每天完成率
+                'tasks_generated': total_generated,  # 每天生成任务数
+                'tasks_completed': total_completed,  # 完成数
+                'active_students_count': active_students_count,  # 当日有补贴的学员数量
+                'bonus_pool': bonus_pool_data,  # 奖金池详细数据
+                'achievement_stats': {
+                    'total_students': achievement_row.total_students if achievement_row else 0,
+                    'achieved_students': achievement_row.achieved_students or 0 if achievement_row else 0,
+                    'total_completed_amount': float(achievement_row.total_completed_amount or 0) if achievement_row else 0.0
+                }
+            }
+            current_date += timedelta(days=1)
+
+        return results
+
+    @staticmethod
+    def _as_date(value) -> date:
+        """分组键统一转换为date（部分驱动对DATE()/GREATEST()结果返回字符串）"""
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, str):
+            return date.fromisoformat(value[:10])
+        return value
+
+    @classmethod
+    def _get_cached_daily_stats(cls, start_date: date, end_date: date) -> Dict[date, Dict[str, Any]]:
+        """获取已缓存的已结束日期统计"""
+        now = time.monotonic()
+        with cls._daily_stats_cache_lock:
+            return {
+                stat_date: copy.deepcopy(stat)
+                for stat_date, (stat, expire_at) in cls._daily_stats_cache.items()
+                if start_date <= stat_date <= end_date and expire_at > now
+            }
+
+    @classmethod
+    def _cache_closed_daily_stats(cls, stats: Dict[date, Dict[str, Any]]) -> None:
+        expire_at = time.monotonic() + cls.DAILY_STATS_CACHE_TTL
+        with cls._daily_stats_cache_lock:
+            for stat_date, stat in stats.items():
+                cls._daily_stats_cache[stat_date] = (copy.deepcopy(stat), expire_at)
+
+    @classmethod
+    def invalidate_daily_stats_cache(cls, stat_date: date = None) -> None:
+        """清除每日补贴统计缓存，stat_date为None时全部清除"""
+        with cls._daily_stats_cache_lock:
+            if stat_date is None:
+                cls._daily_stats_cache.clear()
+            else:
+                cls._daily_stats_cache.pop(stat_date, None)
+
+    # 每日补贴统计导出列：(列名, 列宽)
+    DAILY_STATS_EXPORT_COLUMNS = [
+        ('日期', 12),
+        ('补贴总金额', 15),
+        ('剩余金额', 12),
+        ('实际获得金额', 15),
+        ('完成率(%)', 12),
+        ('生成任务数', 12),
+        ('完成任务数', 12),
+        ('补贴学员数', 12),
+        ('奖金池总金额', 15),
+        ('奖金池已生成金额', 18),
+        ('奖金池已完成金额', 18),
+        ('达标学生数', 12),
+        ('总学生数', 12),
+        ('导出时间', 20),
+    ]
+
+    def export_daily_subsidy_stats(self, start_date: date = None, end_date: date = None, days: int = 7,
+                                   file_format: str = 'xlsx') -> Iterator[bytes]:
         """
-        导出每日补贴统计数据为Excel
+        流式导出每日补贴统计数据
 
         Args:
             start_date: 开始日期，默认为7天前
             end_date: 结束日期，默认为今天
             days: 查询天数，当start_date和end_date都为None时使用，默认7天
+            file_format: 导出格式，xlsx 或 csv
 
         Returns:
-            bytes: Excel文件内容
+            Iterator[bytes]: 文件内容分块
         """
-        try:
-            import pandas as pd
-            import io
+        if file_format not in EXPORT_FORMATS:
+            raise BusinessException(code=400, message=f"不支持的导出格式: {file_format}", data=None)
 
+        try:
             # 获取统计数据
             stats_data = self.get_daily_subsidy_stats(start_date, end_date, days)
-
-            # 准备Excel数据 - 完全参考studentIncome/export的方式
-            data = []
-            for daily_stat in stats_data['daily_stats']:
-                data.append({
-                    '日期': daily_stat['date'],
-                    '补贴总金额': float(daily_stat['subsidy_total_amount']),
-                    '剩余金额': float(daily_stat['remaining_amount']),
-                    '实际获得金额': float(daily_stat['actual_earned_amount']),
-                    '完成率(%)': daily_stat['completion_rate'],
-                    '生成任务数': daily_stat['tasks_generated'],
-                    '完成任务数': daily_stat['tasks_completed'],
-                    '补贴学员数': daily_stat.get('active_students_count', 0),
-                    '奖金池总金额': float(daily_stat['bonus_pool']['total_amount']),
-                    '奖金池已生成金额': float(daily_stat['bonus_pool']['generated_amount']),
-                    '奖金池已完成金额': float(daily_stat['bonus_pool']['completed_amount']),
-                    '达标学生数': daily_stat['achievement_stats']['achieved_students'],
-                    '总学生数': daily_stat['achievement_stats']['total_students'],
-                    '导出时间': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                })
-
-            # 如果没有数据，创建一个示例行
-            if not data:
-                data.append({
-                    '日期': date.today().isoformat(),
-                    '补贴总金额': 0.0,
-                    '剩余金额': 0.0,
-                    '实际获得金额': 0.0,
-                    '完成率(%)': 0.0,
-                    '生成任务数': 0,
-                    '完成任务数': 0,
-                    '补贴学员数': 0,
-                    '奖金池总金额': 0.0,
-                    '奖金池已生成金额': 0.0,
-                    '奖金池已完成金额': 0.0,
-                    '达标学生数': 0,
-                    '总学生数': 0,
-                    '导出时间': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                })
-
-            # 创建DataFrame
-            df = pd.DataFrame(data)
-
-            # 创建Excel文件 - 完全按照studentIncome/export的方式
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                # 写入每日统计数据
-                df.to_excel(writer, sheet_name='每日补贴统计', index=False)
-
-                # 获取工作表对象进行格式化
-                worksheet = writer.sheets['每日补贴统计']
-
-                # 设置列宽
-                column_widths = {
-                    'A': 12,  # 日期
-                    'B': 15,  # 补贴总金额
-                    'C': 12,  # 剩余金额
-                    'D': 15,  # 实际获得金额
-                    'E': 12,  # 完成率
-                    'F': 12,  # 生成任务数
-                    'G': 12,  # 完成任务数
-                    'H': 12,  # 补贴学员数
-                    'I': 15,  # 奖金池总金额
-                    'J': 18,  # 奖金池已生成金额
-                    'K': 18,  # 奖金池已完成金额
-                    'L': 12,  # 达标学生数
-                    'M': 12,  # 总学生数
-                    'N': 20,  # 导出时间
-                }
-
-                for col, width in column_widths.items():
-                    worksheet.column_dimensions[col].width = width
-
-            output.seek(0)
-            return output.getvalue()
+            headers = [name for name, _ in self.DAILY_STATS_EXPORT_COLUMNS]
+            rows = self._iter_daily_stats_rows(stats_data['daily_stats'])
+
+            if file_format == 'csv':
+                return StreamingExporter.stream_csv(headers, rows)
+
+            return StreamingExporter.stream_xlsx([
+                ExportSheet(
+                    title='每日补贴统计',
+                    headers=headers,
+                    rows=rows,
+                    column_widths=[width for _, width in self.DAILY_STATS_EXPORT_COLUMNS]
+                )
+            ])
 
         except Exception as e:
             logger.error(f"导出每日补贴统计失败: {e}")
@@ -1274,3 +1421,30 @@ class BonusPoolService:
                 message=f"导出每日补贴统计失败: {str(e)}",
                 data=None
             )
+
+    @staticmethod
+    def _iter_daily_stats_rows(daily_stats: List[Dict[str, Any]]) -> Iterator[List[Any]]:
+        """逐行生成每日补贴统计导出数据"""
+        export_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        for daily_stat in daily_stats:
+            yield [
+                daily_stat['date'],
+                float(daily_stat['subsidy_total_amount']),
+                float(daily_stat['remaining_amount']),
+                float(daily_stat['actual_earned_amount']),
+                daily_stat['completion_rate'],
+                daily_stat['tasks_generated'],
+                daily_stat['tasks_completed'],
+                daily_stat.get('active_students_count', 0),
+                float(daily_stat['bonus_pool']['total_amount']),
+                float(daily_stat['bonus_pool']['generated_amount']),
+                float(daily_stat['bonus_pool']['completed_amount']),
+                daily_stat['achievement_stats']['achieved_students'],
+                daily_stat['achievement_stats']['total_students'],
+                export_time
+            ]
+
+        if not daily_stats:
+            # 如果没有数据，输出一个示例行
+            yield [date.today().isoformat(), 0.0, 0.0, 0.0, 0.0, 0, 0, 0, 0.0, 0.0, 0.0, 0, 0, export_time]
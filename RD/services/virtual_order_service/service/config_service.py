@@ -3,7 +3,7 @@ from shared.models.system_config import SystemConfig
 from typing import Union
 import json
 import logging
-from datetime import datetime
+from decimal import Decimal
 
 logger = logging.getLogger(__name__)
 
@@ -264,18 +264,26 @@ class ConfigService:
 
             # 导入虚拟订单服务
             from .virtual_order_service import VirtualOrderService
+            from .pool_ledger import StudentPoolLedger
             service = VirtualOrderService(self.db)
 
+            # 按实时余额（含未汇总的补贴流水）生成任务，扣减以补贴流水记录
+            ledger = StudentPoolLedger(self.db).load(pool.student_id for pool in ungenerated_pools)
+
             processed_count = 0
             total_generated_tasks = 0
 
             for pool in ungenerated_pools:
                 try:
-                    logger.info(f"为学生 {pool.student_name}(ID:{pool.student_id}) 生成任务，剩余补贴: {pool.remaining_amount}")
+                    state = ledger.get(pool.student_id)
+                    if not state or state.remaining_amount <= 0:
+                        continue
+
+                    logger.info(f"为学生 {pool.student_name}(ID:{pool.student_id}) 生成任务，剩余补贴: {state.remaining_amount}")
 
                     # 使用虚拟客服分配策略按需生成任务（1-2个任务）
                     result = service.generate_virtual_tasks_with_service_allocation(
-                        pool.student_id, pool.student_name, pool.remaining_amount, on_demand=True
+                        pool.student_id, pool.student_name, state.remaining_amount, on_demand=True
                     )
 
                     if result['success']:
@@ -284,11 +292,10 @@ class ConfigService:
                         processed_count += 1
 
                         # 更新补贴池剩余金额（按需生成模式）
-                        generated_amount = result['total_amount']
-                        pool.remaining_amount -= generated_amount
-                        pool.updated_at = datetime.now()
+                        generated_amount = Decimal(str(result['total_amount']))
+                        ledger.deduct(pool.student_id, generated_amount)
 
-                        logger.info(f"成功为学生 {pool.student_name} 生成了 {task_count} 个任务，总金额: {result['total_amount']}，剩余补贴: {pool.remaining_amount}")
+                        logger.info(f"成功为学生 {pool.student_name} 生成了 {task_count} 个任务，总金额: {result['total_amount']}，剩余补贴: {state.remaining_amount}")
                     else:
                         logger.error(f"为学生 {pool.student_name} 生成任务失败: {result['message']}")
 
@@ -297,6 +304,7 @@ class ConfigService:
                     continue
 
             # 提交所有更改
+            ledger.flush()
             self.db.commit()
 
             logger.info(f"补贴池任务生成完成: 处理了 {processed_count} 个补贴池，共生成 {total_generated_tasks} 个任务")
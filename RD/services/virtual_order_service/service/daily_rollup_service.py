@@ -0,0 +1,364 @@
+"""
+虚拟订单每日汇总服务
+按日、按学生汇总虚拟任务到 virtual_order_reports，定时任务增量刷新未关账日期，
+日期结束两天后关账；统计接口历史日期读取汇总，只对未关账日期聚合原始任务
+"""
+
+import logging
+from datetime import datetime, timedelta, date
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional, Union
+
+from sqlalchemy import func, case, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+from shared.models.tasks import Tasks
+from shared.models.userinfo import UserInfo
+from shared.models.virtual_order_reports import VirtualOrderReports
+
+logger = logging.getLogger(__name__)
+
+# 汇总指标字段
+METRIC_FIELDS = (
+    'total_tasks_generated', 'total_amount_generated',
+    'total_tasks_accepted', 'total_amount_accepted',
+    'total_tasks_completed', 'total_amount_completed',
+    'total_tasks_expired', 'total_amount_expired',
+    'tasks_completed_on_day', 'amount_completed_on_day',
+    'active_students',
+)
+
+
+class DailyRollupService:
+    """虚拟订单每日汇总服务"""
+
+    # 当日全部虚拟任务（含无目标学生的奖金池任务）汇总行
+    DAY_TOTAL_STUDENT_ID = 0
+    DAY_TOTAL_STUDENT_NAME = '全部'
+
+    # 当天提交的任务可能在次日才自动确认，日期结束两天后（stat_date <= 今天 - 2）才关账，
+    # 与学生收入统计、每日补贴统计的已关账日期规则一致
+    CLOSED_DAY_OFFSET = 2
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def refresh_day(self, stat_date: date, close: bool = False) -> int:
+        """
+        重新汇总某一天并写入汇总表（两个分组查询 + 一次批量写入，不提交事务）
+
+        Args:
+            stat_date: 汇总日期
+            close: 是否同时关账（之后不再刷新）
+
+        Returns:
+            int: 写入的汇总行数
+        """
+        day_start = datetime.combine(stat_date, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+
+        # 按创建时间统计当日生成的任务及其当前状态
+        created_rows = self.db.query(
+            Tasks.target_student_id,
+            func.count(Tasks.id),
+            func.sum(Tasks.commission),
+            func.sum(case((Tasks.status.in_(['1', '2', '3']), 1), else_=0)),
+            func.sum(case((Tasks.status.in_(['1', '2', '3']), Tasks.commission), else_=0)),
+            func.sum(case((Tasks.status == '4', 1), else_=0)),
+            func.sum(case((Tasks.status == '4', Tasks.commission), else_=0)),
+            func.sum(case((Tasks.status == '5', 1), else_=0)),
+            func.sum(case((Tasks.status == '5', Tasks.commission), else_=0))
+        ).filter(
+            Tasks.is_virtual.is_(True),
+            Tasks.created_at >= day_start,
+            Tasks.created_at < day_end
+        ).group_by(Tasks.target_student_id).all()
+
+        # 按完成时间统计当日完成的任务
+        completed_rows = self.db.query(
+            Tasks.target_student_id,
+            func.count(Tasks.id),
+            func.sum(Tasks.commission)
+        ).filter(
+            Tasks.is_virtual.is_(True),
+            Tasks.status == '4',
+            Tasks.updated_at >= day_start,
+            Tasks.updated_at < day_end
+        ).group_by(Tasks.target_student_id).all()
+
+        metrics: Dict[Optional[int], Dict[str, Any]] = {}
+        for row in created_rows:
+            m = metrics.setdefault(row[0], self._empty_metrics())
+            (m['total_tasks_generated'], m['total_amount_generated'],
+             m['total_tasks_accepted'], m['total_amount_accepted'],
+             m['total_tasks_completed'], m['total_amount_completed'],
+             m['total_tasks_expired'], m['total_amount_expired']) = [value or 0 for value in row[1:]]
+        for student_id, count, amount in completed_rows:
+            m = metrics.setdefault(student_id, self._empty_metrics())
+            m['tasks_completed_on_day'] = count or 0
+            m['amount_completed_on_day'] = amount or 0
+
+        student_ids = [sid for sid in metrics if sid]
+        for sid in student_ids:
+            metrics[sid]['active_students'] = 1
+
+        # 当日汇总行（无目标学生的任务只计入汇总行）
+        day_total = self._empty_metrics()
+        for m in metrics.values():
+            for field in METRIC_FIELDS:
+                day_total[field] += m[field]
+        day_total['active_students'] = len(student_ids)
+
+        names = dict(self.db.query(UserInfo.roleId, UserInfo.name).filter(
+            UserInfo.roleId.in_(student_ids)
+        ).all()) if student_ids else {}
+
+        # 剩余补贴只由 snapshot_remaining_subsidy 在当日补贴池重置前记录，这里不写入
+        now = datetime.now()
+        rows = [dict(
+            report_date=stat_date,
+            student_id=self.DAY_TOTAL_STUDENT_ID,
+            student_name=self.DAY_TOTAL_STUDENT_NAME,
+            is_closed=close,
+            created_at=now,
+            updated_at=now,
+            **day_total
+        )]
+        for sid in student_ids:
+            rows.append(dict(
+                report_date=stat_date,
+                student_id=sid,
+                student_name=names.get(sid) or '',
+                is_closed=close,
+                created_at=now,
+                updated_at=now,
+                **metrics[sid]
+            ))
+
+        stmt = mysql_insert(VirtualOrderReports).values(rows)
+        update_fields = {field: stmt.inserted[field] for field in METRIC_FIELDS}
+        update_fields.update(
+            student_name=stmt.inserted.student_name,
+            is_closed=stmt.inserted.is_closed,
+            updated_at=stmt.inserted.updated_at
+        )
+        self.db.execute(stmt.on_duplicate_key_update(**update_fields))
+
+        return len(rows)
+
+    def snapshot_remaining_subsidy(self, stat_date: date) -> int:
+        """
+        记录某一天汇总行的学生剩余补贴（不提交事务）
+
+        补贴池只保存当前余额，必须在该日的补贴池被每日任务重置前调用；
+        回填或延迟关账的历史日期无法还原当日余额，不记录剩余补贴。
+
+        Returns:
+            int: 更新的学生汇总行数
+        """
+        student_ids = [row[0] for row in self.db.query(VirtualOrderReports.student_id).filter(
+            VirtualOrderReports.report_date == stat_date,
+            VirtualOrderReports.student_id != self.DAY_TOTAL_STUDENT_ID
+        ).all()]
+        remaining = self._get_remaining_subsidy(student_ids)
+        if not remaining:
+            return 0
+
+        self.db.execute(
+            update(VirtualOrderReports)
+            .where(
+                VirtualOrderReports.report_date == stat_date,
+                VirtualOrderReports.student_id.in_(list(remaining))
+            )
+            .values(remaining_subsidy=case(remaining, value=VirtualOrderReports.student_id, else_=0))
+            .execution_options(synchronize_session=False)
+        )
+        self.db.execute(
+            update(VirtualOrderReports)
+            .where(
+                VirtualOrderReports.report_date == stat_date,
+                VirtualOrderReports.student_id == self.DAY_TOTAL_STUDENT_ID
+            )
+            .values(remaining_subsidy=sum(remaining.values(), Decimal('0')))
+            .execution_options(synchronize_session=False)
+        )
+        return len(remaining)
+
+    def get_last_closed_date(self) -> Optional[date]:
+        """获取最后一个已关账的日期（关账按日期顺序进行，之前的日期均已关账）"""
+        return self.db.query(func.max(VirtualOrderReports.report_date)).filter(
+            VirtualOrderReports.student_id == self.DAY_TOTAL_STUDENT_ID,
+            VirtualOrderReports.is_closed.is_(True)
+        ).scalar()
+
+    def refresh_open_days(self, today: date = None) -> int:
+        """增量刷新所有未关账日期（最后关账日期之后至今天）"""
+        today = today or date.today()
+        last_closed = self.get_last_closed_date()
+        current = last_closed + timedelta(days=1) if last_closed else today
+
+        refreshed = 0
+        while current <= today:
+            self.refresh_day(current)
+            refreshed += 1
+            current += timedelta(days=1)
+        return refreshed
+
+    def close_settled_days(self, today: date = None, max_days: int = 31) -> int:
+        """关账所有已结束 CLOSED_DAY_OFFSET 天的日期"""
+        today = today or date.today()
+        return self.close_days_before(today - timedelta(days=self.CLOSED_DAY_OFFSET - 1), max_days)
+
+    def close_days_before(self, before_date: date, max_days: int = 31) -> int:
+        """
+        按日期顺序关账 before_date 之前的所有未关账日期
+
+        首次运行时从最早的虚拟任务日期开始回填，每次最多处理 max_days 天。
+
+        Returns:
+            int: 本次关账的天数
+        """
+        last_closed = self.get_last_closed_date()
+        if last_closed:
+            current = last_closed + timedelta(days=1)
+        else:
+            first_created = self.db.query(func.min(Tasks.created_at)).filter(
+                Tasks.is_virtual.is_(True)
+            ).scalar()
+            if not first_created:
+                return 0
+            current = first_created.date()
+
+        closed = 0
+        while current < before_date and closed < max_days:
+            self.refresh_day(current, close=True)
+            self.db.commit()
+            closed += 1
+            current += timedelta(days=1)
+
+        if closed:
+            logger.info(f"虚拟订单每日汇总关账 {closed} 天，最后关账日期: {current - timedelta(days=1)}")
+        return closed
+
+    def get_closed_day_totals(self, start_date: date, end_date: date) -> Dict[date, VirtualOrderReports]:
+        """获取日期范围内已关账日期的当日汇总行"""
+        return {
+            row.report_date: row for row in self.db.query(VirtualOrderReports).filter(
+                VirtualOrderReports.student_id == self.DAY_TOTAL_STUDENT_ID,
+                VirtualOrderReports.is_closed.is_(True),
+                VirtualOrderReports.report_date >= start_date,
+                VirtualOrderReports.report_date <= end_date
+            ).all()
+        }
+
+    def get_task_totals(self, start: Union[str, datetime, None] = None,
+                        end: Union[str, datetime, None] = None) -> Dict[str, Any]:
+        """
+        统计创建时间在 [start, end] 内的虚拟任务数量和金额
+
+        已关账的完整日期读取汇总表，其余部分（未关账日期和不足一天的边界）聚合原始任务。
+
+        Returns:
+            Dict: total_tasks, completed_tasks, total_amount, completed_amount
+        """
+        start_dt = self._parse_datetime(start)
+        end_dt = self._parse_datetime(end)
+
+        totals = {'total_tasks': 0, 'completed_tasks': 0, 'total_amount': 0.0, 'completed_amount': 0.0}
+
+        last_closed = self.get_last_closed_date()
+        closed_from = closed_to = None
+        if last_closed:
+            # 完整落在查询范围内的已关账日期
+            if start_dt is None:
+                closed_from = date.min
+            else:
+                closed_from = start_dt.date() if start_dt.time() == datetime.min.time() else start_dt.date() + timedelta(days=1)
+            closed_to = last_closed
+            if end_dt is not None:
+                # 次日零点不晚于 end 的日期才是完整日期
+                closed_to = min(closed_to, end_dt.date() - timedelta(days=1))
+            if closed_from > closed_to:
+                closed_from = closed_to = None
+
+        if closed_from is None:
+            self._add_totals(totals, self._raw_task_totals(start_dt, end_dt, end_inclusive=True))
+            return totals
+
+        rollup = self.db.query(
+            func.sum(VirtualOrderReports.total_tasks_generated),
+            func.sum(VirtualOrderReports.total_tasks_completed),
+            func.sum(VirtualOrderReports.total_amount_generated),
+            func.sum(VirtualOrderReports.total_amount_completed)
+        ).filter(
+            VirtualOrderReports.student_id == self.DAY_TOTAL_STUDENT_ID,
+            VirtualOrderReports.is_closed.is_(True),
+            VirtualOrderReports.report_date >= closed_from,
+            VirtualOrderReports.report_date <= closed_to
+        ).one()
+        self._add_totals(totals, rollup)
+
+        # 汇总范围之前和之后的部分聚合原始任务
+        closed_start = datetime.combine(closed_from, datetime.min.time()) if closed_from != date.min else None
+        closed_end = datetime.combine(closed_to + timedelta(days=1), datetime.min.time())
+
+        if closed_start is not None and (start_dt is None or start_dt < closed_start):
+            self._add_totals(totals, self._raw_task_totals(start_dt, closed_start, end_inclusive=False))
+        if end_dt is None or end_dt >= closed_end:
+            self._add_totals(totals, self._raw_task_totals(closed_end, end_dt, end_inclusive=True))
+
+        return totals
+
+    def _raw_task_totals(self, start_dt: Optional[datetime], end_dt: Optional[datetime], end_inclusive: bool):
+        query = self.db.query(
+            func.count(Tasks.id),
+            func.sum(case((Tasks.status == '4', 1), else_=0)),
+            func.sum(Tasks.commission),
+            func.sum(case((Tasks.status == '4', Tasks.commission), else_=0))
+        ).filter(Tasks.is_virtual.is_(True))
+        if start_dt is not None:
+            query = query.filter(Tasks.created_at >= start_dt)
+        if end_dt is not None:
+            query = query.filter(Tasks.created_at <= end_dt if end_inclusive else Tasks.created_at < end_dt)
+        return query.one()
+
+    @staticmethod
+    def _add_totals(totals: Dict[str, Any], row: Iterable) -> None:
+        total_tasks, completed_tasks, total_amount, completed_amount = row
+        totals['total_tasks'] += int(total_tasks or 0)
+        totals['completed_tasks'] += int(completed_tasks or 0)
+        totals['total_amount'] += float(total_amount or 0)
+        totals['completed_amount'] += float(completed_amount or 0)
+
+    @staticmethod
+    def _parse_datetime(value: Union[str, datetime, None]) -> Optional[datetime]:
+        """解析日期参数（支持 YYYY-MM-DD 和 YYYY-MM-DD HH:MM:SS）"""
+        if value is None or isinstance(value, datetime):
+            return value
+        if isinstance(value, date):
+            return datetime.combine(value, datetime.min.time())
+        value = value.strip()
+        if not value:
+            return None
+        for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                continue
+        raise ValueError(f"无法解析的日期: {value}")
+
+    @staticmethod
+    def _empty_metrics() -> Dict[str, Any]:
+        return {field: 0 for field in METRIC_FIELDS}
+
+    def _get_remaining_subsidy(self, student_ids) -> Dict[int, Decimal]:
+        """学生补贴池当前剩余金额（含未汇总的补贴流水）"""
+        if not student_ids:
+            return {}
+        from .pool_ledger import StudentPoolLedger
+        ledger = StudentPoolLedger(self.db).load(student_ids, lock=False)
+        return {
+            sid: ledger.get(sid).remaining_amount
+            for sid in student_ids if ledger.get(sid)
+        }
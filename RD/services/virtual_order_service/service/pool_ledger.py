@@ -0,0 +1,250 @@
+"""
+学生补贴池内存账本
+一次查询加载本轮涉及的补贴池（含未汇总的补贴流水），在内存中应用增量并校验不变量，
+处理结束后将变动以补贴流水批量追加，由物化器汇总到 virtual_order_pool 表
+"""
+
+import logging
+from dataclasses import dataclass, replace
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from shared.models.virtual_order_pool import VirtualOrderPool
+from shared.services.subsidy_ledger_service import SubsidyLedgerService
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0')
+
+
+@dataclass
+class PoolState:
+    """补贴池内存状态"""
+    pool_id: int
+    student_id: int
+    student_name: str
+    total_subsidy: Decimal
+    remaining_amount: Decimal
+    allocated_amount: Decimal
+    completed_amount: Decimal
+    consumed_subsidy: Decimal
+    last_allocation_at: Optional[datetime] = None
+
+    @property
+    def reached_limit(self) -> bool:
+        """是否已达到补贴上限"""
+        return self.consumed_subsidy >= self.total_subsidy
+
+
+class StudentPoolLedger:
+    """
+    学生补贴池账本（写回式）
+
+    每次变动记录为一条补贴流水（变动量为校验不变量后的实际差值），
+    flush 时一次批量追加，不直接更新补贴池行。
+
+    release_expired、correct、exhaust 等按目标值计算差值的变动依赖加载时的余额，
+    因此默认以锁定读（SELECT ... FOR UPDATE）加载补贴池和未汇总流水，
+    同一补贴池的账本写入在事务结束前串行执行，不会基于过期快照重复计算差值。
+
+    不变量：
+    - remaining_amount >= 0（手动调整允许超过 total_subsidy，不做上限截断）
+    - consumed_subsidy >= total_subsidy 时 remaining_amount 归零，不再为该学生生成任务
+      （consumed_subsidy 记录学生实际获得的收益，不做截断）
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.ledger_service = SubsidyLedgerService(db)
+        self._states: Dict[int, PoolState] = {}
+        self._events: List[Dict[str, Any]] = []
+
+    def load(self, student_ids: Optional[Iterable[int]] = None, lock: bool = True) -> 'StudentPoolLedger':
+        """
+        一次查询加载补贴池
+
+        Args:
+            student_ids: 需要加载的学生ID，为None时加载所有未删除的补贴池
+            lock: 是否锁定补贴池和未汇总流水直到事务结束（只读取余额时传False）
+        """
+        query = self.db.query(
+            VirtualOrderPool.id,
+            VirtualOrderPool.student_id,
+            VirtualOrderPool.student_name,
+            VirtualOrderPool.total_subsidy,
+            VirtualOrderPool.remaining_amount,
+            VirtualOrderPool.allocated_amount,
+            VirtualOrderPool.completed_amount,
+            VirtualOrderPool.consumed_subsidy,
+            VirtualOrderPool.last_allocation_at
+        ).filter(VirtualOrderPool.is_deleted == False)
+
+        if student_ids is not None:
+            ids = {sid for sid in student_ids if sid is not None} - set(self._states)
+            if not ids:
+                return self
+            query = query.filter(VirtualOrderPool.student_id.in_(ids))
+
+        # 与逐个查询时的 .first() 保持一致：每个学生取id最小的补贴池
+        rows = {}
+        if lock:
+            query = query.with_for_update()
+
+        for row in query.order_by(VirtualOrderPool.id).all():
+            if row.student_id not in self._states:
+                rows.setdefault(row.student_id, row)
+
+        # 叠加尚未汇总的补贴流水，得到实时余额
+        pending = self.ledger_service.get_pending_deltas((row.id for row in rows.values()), lock=lock)
+
+        for student_id, row in rows.items():
+            deltas = pending.get(row.id, {})
+            self._states[student_id] = PoolState(
+                pool_id=row.id,
+                student_id=student_id,
+                student_name=row.student_name,
+                total_subsidy=row.total_subsidy or ZERO,
+                remaining_amount=(row.remaining_amount or ZERO) + deltas.get('remaining_amount', ZERO),
+                allocated_amount=row.allocated_amount or ZERO,
+                completed_amount=(row.completed_amount or ZERO) + deltas.get('completed_amount', ZERO),
+                consumed_subsidy=(row.consumed_subsidy or ZERO) + deltas.get('consumed_subsidy', ZERO),
+                last_allocation_at=row.last_allocation_at
+            )
+
+        return self
+
+    def get(self, student_id: int) -> Optional[PoolState]:
+        """获取学生补贴池状态，未加载时返回None"""
+        return self._states.get(student_id)
+
+    def release_expired(self, student_id: int, task_id: Optional[int] = None) -> PoolState:
+        """过期任务释放后，按 总补贴 - 已完成金额 重算剩余金额"""
+        state = self._states[student_id]
+        # 确保剩余金额不超过总补贴金额
+        return self._apply(
+            state, SubsidyLedgerService.EVENT_EXPIRE, task_id=task_id,
+            remaining_amount=min(state.total_subsidy - state.completed_amount, state.total_subsidy)
+        )
+
+    def record_completion(self, student_id: int, commission: Decimal, student_income: Decimal,
+                          task_id: Optional[int] = None, return_value: bool = True) -> PoolState:
+        """
+        记录任务完成：累计完成金额和实际消耗
+
+        Args:
+            return_value: True时剩余价值（面值 - 学生收入）加回补贴池；
+                          False时剩余金额按 总补贴 - 实际消耗 重算
+        """
+        state = self._states[student_id]
+        consumed = state.consumed_subsidy + student_income
+        if return_value:
+            remaining = state.remaining_amount + commission - student_income
+        else:
+            remaining = state.total_subsidy - consumed
+        return self._apply(
+            state, SubsidyLedgerService.EVENT_COMPLETE, task_id=task_id,
+            remaining_amount=remaining,
+            completed_amount=state.completed_amount + commission,
+            consumed_subsidy=consumed
+        )
+
+    def credit(self, student_id: int, amount: Decimal,
+               event_type: str = SubsidyLedgerService.EVENT_RECYCLE,
+               task_id: Optional[int] = None, remark: Optional[str] = None) -> PoolState:
+        """增加剩余金额（价值回收、手动调整等）"""
+        state = self._states[student_id]
+        return self._apply(
+            state, event_type, task_id=task_id, remark=remark,
+            remaining_amount=state.remaining_amount + amount
+        )
+
+    def deduct(self, student_id: int, amount: Decimal,
+               event_type: str = SubsidyLedgerService.EVENT_ALLOCATE) -> PoolState:
+        """生成任务后扣减剩余金额"""
+        state = self._states[student_id]
+        return self._apply(state, event_type, remaining_amount=state.remaining_amount - amount)
+
+    def exhaust(self, student_id: int) -> PoolState:
+        """学生已达补贴上限，剩余金额归零"""
+        state = self._states[student_id]
+        return self._apply(
+            state, SubsidyLedgerService.EVENT_ADJUST, remark="已达补贴上限",
+            remaining_amount=ZERO
+        )
+
+    def correct(self, student_id: int, remark: str, **targets: Decimal) -> PoolState:
+        """将余额校正为给定值（如按任务记录重算后的已完成金额）"""
+        return self._apply(self._states[student_id], SubsidyLedgerService.EVENT_ADJUST, remark=remark, **targets)
+
+    def savepoint(self, student_id: int) -> Tuple[int, int, Optional[PoolState]]:
+        """
+        记录学生处理前的账本位置（配合数据库 SAVEPOINT 使用）
+
+        共享账本逐个处理学生时，某个学生失败并回滚到数据库保存点后，
+        需调用 rollback_to 撤销该学生的流水和内存余额，避免写回已回滚变更对应的增量
+        """
+        state = self._states.get(student_id)
+        return len(self._events), student_id, replace(state) if state else None
+
+    def rollback_to(self, savepoint: Tuple[int, int, Optional[PoolState]]) -> None:
+        """撤销保存点之后记录的流水，恢复该学生的内存余额"""
+        event_count, student_id, state = savepoint
+        del self._events[event_count:]
+        if state is not None:
+            self._states[student_id] = state
+
+    def flush(self) -> int:
+        """
+        将本轮变动以补贴流水批量追加（一条多行INSERT，不提交事务）
+
+        Returns:
+            int: 写入的流水条数
+        """
+        if not self._events:
+            return 0
+
+        events, self._events = self._events, []
+        count = self.ledger_service.append_many(events)
+        logger.info(f"补贴池账本追加 {count} 条补贴流水，涉及 {len({e['pool_id'] for e in events})} 个补贴池")
+        return count
+
+    def _apply(self, state: PoolState, event_type: str, task_id: Optional[int] = None,
+               remark: Optional[str] = None, **targets: Decimal) -> PoolState:
+        """设置新余额，校验不变量后按实际差值记录流水"""
+        before = (state.remaining_amount, state.completed_amount, state.consumed_subsidy)
+
+        for field, value in targets.items():
+            setattr(state, field, value)
+        self._check(state)
+
+        remaining_delta = state.remaining_amount - before[0]
+        completed_delta = state.completed_amount - before[1]
+        consumed_delta = state.consumed_subsidy - before[2]
+
+        if event_type in SubsidyLedgerService.ALLOCATION_EVENTS:
+            state.last_allocation_at = datetime.now()
+
+        if remaining_delta or completed_delta or consumed_delta:
+            self._events.append({
+                'pool_id': state.pool_id,
+                'student_id': state.student_id,
+                'event_type': event_type,
+                'remaining_delta': remaining_delta,
+                'completed_delta': completed_delta,
+                'consumed_delta': consumed_delta,
+                'task_id': task_id,
+                'remark': remark,
+            })
+        return state
+
+    @staticmethod
+    def _check(state: PoolState) -> None:
+        """校验不变量"""
+        if state.remaining_amount < 0:
+            state.remaining_amount = ZERO
+        if state.reached_limit and state.remaining_amount > 0:
+            logger.info(f"学生 {state.student_name} 已达到补贴上限: 上限={state.total_subsidy}元, 已获得={state.consumed_subsidy}元, 剩余金额归零")
+            state.remaining_amount = ZERO
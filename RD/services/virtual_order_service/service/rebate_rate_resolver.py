@@ -0,0 +1,247 @@
+"""
+学生返佣比例解析器
+批量加载学生的代理返佣比例，并在进程内和Redis中缓存
+"""
+
+import json
+import time
+import logging
+import threading
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import redis
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from shared.cache.redis_client import get_redis_client, pipelined
+from shared.models.userinfo import UserInfo
+from shared.models.agents import Agents
+
+logger = logging.getLogger(__name__)
+
+# 默认返佣比例60%
+DEFAULT_REBATE_RATE = Decimal('0.6')
+
+
+def parse_agent_rebate(agent_rebate: Optional[str], default: Decimal = DEFAULT_REBATE_RATE) -> Decimal:
+    """
+    解析代理返佣比例字符串
+
+    Args:
+        agent_rebate: 代理返佣比例（如 "0.6"、"60"、"60%"）
+        default: 为空或解析失败时的默认值
+
+    Returns:
+        Decimal: 返佣比例（如0.6表示60%）
+    """
+    if not agent_rebate:
+        return default
+
+    rebate_str = agent_rebate.replace('%', '') if '%' in agent_rebate else agent_rebate
+    try:
+        rebate_value = float(rebate_str)
+        # 如果值大于1，说明是百分比形式（如60），需要除以100
+        if rebate_value > 1:
+            return Decimal(str(rebate_value / 100))
+        return Decimal(str(rebate_value))
+    except (TypeError, ValueError):
+        return default
+
+
+class RebateRateResolver:
+    """学生返佣比例解析器（进程内缓存 + Redis缓存 + 单次关联查询批量加载）"""
+
+    REDIS_KEY_PREFIX = "rebate_rate:student:"
+
+    # 进程内缓存：{student_id: (agent_id, rate, expire_at)}，所有实例共享
+    _local_cache: Dict[int, Tuple[Optional[int], Decimal, float]] = {}
+    _local_lock = threading.Lock()
+
+    def __init__(self, db: Session, redis_client: Optional[redis.Redis] = None,
+                 local_ttl: int = 300, redis_ttl: int = 1800):
+        self.db = db
+        # 未指定时使用全局共享的Redis客户端（Redis不可用时为None，只使用进程内缓存）
+        self.redis_client = redis_client if redis_client is not None else get_redis_client()
+        self.local_ttl = local_ttl  # 进程内缓存5分钟
+        self.redis_ttl = redis_ttl  # Redis缓存30分钟
+
+    def get_rate(self, student_id: int) -> Decimal:
+        """获取单个学生的返佣比例"""
+        return self.get_rates([student_id]).get(student_id, DEFAULT_REBATE_RATE)
+
+    def get_rates(self, student_ids: Iterable[int]) -> Dict[int, Decimal]:
+        """
+        批量获取学生的返佣比例
+
+        依次查找进程内缓存、Redis缓存，剩余未命中的学生通过一次
+        userinfo LEFT JOIN agents 查询加载。
+
+        Args:
+            student_ids: 学生ID（roleId）列表
+
+        Returns:
+            Dict[int, Decimal]: {student_id: 返佣比例}
+        """
+        ids = {sid for sid in student_ids if sid is not None}
+        if not ids:
+            return {}
+
+        rates: Dict[int, Decimal] = {}
+
+        # 1. 进程内缓存
+        now = time.monotonic()
+        with self._local_lock:
+            for sid in ids:
+                entry = self._local_cache.get(sid)
+                if entry and entry[2] > now:
+                    rates[sid] = entry[1]
+
+        missing = [sid for sid in ids if sid not in rates]
+        if not missing:
+            return rates
+
+        # 2. Redis缓存
+        redis_hits = self._get_from_redis(missing)
+        if redis_hits:
+            self._store_local(redis_hits)
+            for sid, (_, rate) in redis_hits.items():
+                rates[sid] = rate
+            missing = [sid for sid in missing if sid not in redis_hits]
+
+        if not missing:
+            return rates
+
+        # 3. 数据库批量加载
+        loaded = self._load_from_db(missing)
+        self._store_local(loaded)
+        self._store_redis(loaded)
+        for sid, (_, rate) in loaded.items():
+            rates[sid] = rate
+
+        return rates
+
+    def invalidate_students(self, student_ids: Iterable[int]) -> None:
+        """清除指定学生的返佣比例缓存"""
+        ids = [sid for sid in student_ids if sid is not None]
+        if not ids:
+            return
+
+        with self._local_lock:
+            for sid in ids:
+                self._local_cache.pop(sid, None)
+
+        if self.redis_client:
+            try:
+                self.redis_client.delete(*[f"{self.REDIS_KEY_PREFIX}{sid}" for sid in ids])
+            except Exception as e:
+                logger.warning(f"清除返佣比例缓存失败: {e}")
+
+    def invalidate_agent(self, agent_id: int) -> None:
+        """代理返佣比例变更后，清除其名下所有学生的缓存"""
+        with self._local_lock:
+            cached_ids = [sid for sid, entry in self._local_cache.items() if entry[0] == agent_id]
+
+        student_ids = set(cached_ids)
+        try:
+            student_ids.update(
+                row[0] for row in self.db.query(UserInfo.roleId).filter(
+                    UserInfo.agentId == agent_id
+                ).all()
+            )
+        except Exception as e:
+            logger.warning(f"查询代理 {agent_id} 名下学生失败: {e}")
+
+        self.invalidate_students(student_ids)
+        logger.info(f"已清除代理 {agent_id} 名下 {len(student_ids)} 个学生的返佣比例缓存")
+
+    @classmethod
+    def clear_local_cache(cls) -> None:
+        """清空进程内缓存"""
+        with cls._local_lock:
+            cls._local_cache.clear()
+
+    def _load_from_db(self, student_ids: List[int]) -> Dict[int, Tuple[Optional[int], Decimal]]:
+        """通过一次关联查询加载学生返佣比例"""
+        rows = self.db.query(
+            UserInfo.roleId, UserInfo.agentId, Agents.agent_rebate
+        ).outerjoin(
+            Agents, Agents.id == UserInfo.agentId
+        ).filter(
+            UserInfo.roleId.in_(student_ids)
+        ).all()
+
+        loaded = {sid: (None, DEFAULT_REBATE_RATE) for sid in student_ids}
+        for role_id, agent_id, agent_rebate in rows:
+            if not agent_id:
+                continue
+            loaded[role_id] = (agent_id, parse_agent_rebate(agent_rebate))
+        return loaded
+
+    def _store_local(self, entries: Dict[int, Tuple[Optional[int], Decimal]]) -> None:
+        expire_at = time.monotonic() + self.local_ttl
+        with self._local_lock:
+            for sid, (agent_id, rate) in entries.items():
+                self._local_cache[sid] = (agent_id, rate, expire_at)
+
+    def _get_from_redis(self, student_ids: List[int]) -> Dict[int, Tuple[Optional[int], Decimal]]:
+        if not self.redis_client:
+            return {}
+        try:
+            values = self.redis_client.mget([f"{self.REDIS_KEY_PREFIX}{sid}" for sid in student_ids])
+        except Exception as e:
+            logger.warning(f"从缓存获取返佣比例失败: {e}")
+            return {}
+
+        hits = {}
+        for sid, value in zip(student_ids, values):
+            if not value:
+                continue
+            try:
+                data = json.loads(value)
+                hits[sid] = (data.get('agent_id'), Decimal(data['rate']))
+            except Exception:
+                continue
+        return hits
+
+    def _store_redis(self, entries: Dict[int, Tuple[Optional[int], Decimal]]) -> None:
+        if not self.redis_client or not entries:
+            return
+        try:
+            pipelined(self.redis_client, lambda pipe: [
+                pipe.setex(
+                    f"{self.REDIS_KEY_PREFIX}{sid}",
+                    self.redis_ttl,
+                    json.dumps({'agent_id': agent_id, 'rate': str(rate)})
+                )
+                for sid, (agent_id, rate) in entries.items()
+            ])
+        except Exception as e:
+            logger.warning(f"缓存返佣比例失败: {e}")
+
+
+def _listener_resolver() -> RebateRateResolver:
+    return RebateRateResolver(None)
+
+
+@event.listens_for(Agents, 'after_update')
+def _invalidate_on_agent_rebate_change(mapper, connection, target):
+    """本进程内通过ORM修改代理返佣比例时，自动清除其名下学生的缓存"""
+    if not inspect(target).attrs.agent_rebate.history.has_changes():
+        return
+    try:
+        student_ids = [
+            row[0] for row in connection.execute(
+                select(UserInfo.roleId).where(UserInfo.agentId == target.id)
+            )
+        ]
+        _listener_resolver().invalidate_students(student_ids)
+    except Exception as e:
+        logger.warning(f"清除代理 {target.id} 返佣比例缓存失败: {e}")
+
+
+@event.listens_for(UserInfo, 'after_update')
+def _invalidate_on_student_agent_change(mapper, connection, target):
+    """学生所属代理变更时，自动清除该学生的缓存"""
+    if inspect(target).attrs.agentId.history.has_changes():
+        _listener_resolver().invalidate_students([target.roleId])
@@ -12,9 +12,11 @@ from shared.models.virtual_order_pool import VirtualOrderPool
 from .virtual_order_service import VirtualOrderService
 from .bonus_pool_service import BonusPoolService
 from .bonus_pool_auto_confirm_manager import BonusPoolAutoConfirmManager
+from .pool_ledger import StudentPoolLedger, PoolState
+from .rebate_rate_resolver import DEFAULT_REBATE_RATE
+from .daily_rollup_service import DailyRollupService
+from shared.services.subsidy_ledger_service import SubsidyLedgerService
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class VirtualOrderTaskScheduler:
@@ -26,11 +28,20 @@ class VirtualOrderTaskScheduler:
         self.check_interval_minutes = 5
         # 价值回收检查间隔（2.5分钟）
         self.value_recycling_interval_minutes = 2.5
+        # 价值回收批次配置：普通批次50个，追赶模式下按积压自适应放大
+        self.value_recycling_batch_size = 50
+        self.value_recycling_max_batch_size = 500
+        self.value_recycling_catch_up_time_budget_seconds = 120  # 小于回收间隔，避免重叠
+        self.value_recycling_metrics: Dict[str, Any] = {}
+        # 补贴流水每批汇总条数
+        self.subsidy_ledger_batch_size = 1000
         self.last_value_recycling_check_time = None
         # 记录上次执行每日任务的日期
         self.last_daily_task_date = None
         # 添加每日任务执行标志，用于暂停其他定时任务
         self.daily_task_running = False
+        # 补贴池相关任务（每日任务、过期任务、价值回收、自动确认）共用的锁，保证不会同时修改补贴池和任务
+        self._pool_job_lock = None
 
         # 固定配置：每天9点执行每日任务，8:55-24:00执行其他任务
         self.daily_task_hour = 8  # 早上8点
@@ -83,6 +94,10 @@ class VirtualOrderTaskScheduler:
                     if self.is_running:
                         await self.check_bonus_pool_task_generation()
 
+                    # 7. 增量刷新虚拟订单每日汇总
+                    if self.is_running:
+                        await self.refresh_daily_rollups()
+
                     # 等待指定间隔时间
                     wait_seconds = self.check_interval_minutes * 60
                     logger.info(f"主任务下次执行时间: {(datetime.now() + timedelta(seconds=wait_seconds)).strftime('%Y-%m-%d %H:%M:%S')}, 等待 {wait_seconds} 秒")
@@ -108,6 +123,10 @@ class VirtualOrderTaskScheduler:
             try:
                 current_time = datetime.now()
 
+                # 补贴流水汇总不受空窗期限制（学生在空窗期也可能完成任务）
+                if not self.daily_task_running:
+                    await self.materialize_subsidy_ledger()
+
                 # 检查是否在空窗期（0:00-16:29）
                 if self.is_in_quiet_period(current_time):
                     logger.info(f"当前时间 {current_time.strftime('%H:%M')} 处于空窗期(00:00-08:55)，跳过价值回收任务")
@@ -137,8 +156,18 @@ class VirtualOrderTaskScheduler:
         # 现在改为间隔执行，直接返回当前时间加上间隔时间
         return datetime.now() + timedelta(minutes=self.check_interval_minutes)
 
+    def _get_pool_job_lock(self) -> asyncio.Lock:
+        """获取补贴池任务锁（在事件循环中首次使用时创建，避免绑定到导入时的事件循环）"""
+        if self._pool_job_lock is None:
+            self._pool_job_lock = asyncio.Lock()
+        return self._pool_job_lock
+
     async def check_expired_tasks(self):
         """检查并处理过期的虚拟任务（每5分钟执行）"""
+        async with self._get_pool_job_lock():
+            await self._check_expired_tasks()
+
+    async def _check_expired_tasks(self):
         # 检查是否正在执行每日任务
         if self.daily_task_running:
             logger.info("每日凌晨任务正在执行中，跳过过期任务检查")
@@ -177,11 +206,14 @@ class VirtualOrderTaskScheduler:
 
             service = VirtualOrderService(db)
 
-            # 处理奖金池过期任务
+            # 处理奖金池过期任务（失败时只回滚到保存点，不影响学生任务处理）
             if bonus_pool_tasks:
+                nested = db.begin_nested()
                 try:
                     await self.process_expired_bonus_pool_tasks(db, service, bonus_pool_tasks)
+                    nested.commit()
                 except Exception as e:
+                    nested.rollback()
                     logger.error(f"处理奖金池过期任务失败: {str(e)}")
 
             # 按学生分组处理学生过期任务
@@ -193,12 +225,22 @@ class VirtualOrderTaskScheduler:
                 if student_id:
                     student_expired_tasks[student_id].append(task)
 
+            # 一次加载所有涉及学生的补贴池
+            ledger = StudentPoolLedger(db).load(student_expired_tasks.keys())
+
+            # 每个学生在独立的保存点中处理：失败时只回滚该学生的任务变更，并撤销其账本流水
             for student_id, tasks in student_expired_tasks.items():
+                savepoint = ledger.savepoint(student_id)
+                nested = db.begin_nested()
                 try:
-                    await self.process_expired_tasks_for_student(db, service, student_id, tasks)
+                    await self.process_expired_tasks_for_student(db, service, student_id, tasks, ledger)
+                    nested.commit()
                 except Exception as e:
+                    nested.rollback()
+                    ledger.rollback_to(savepoint)
                     logger.error(f"处理学生 {student_id} 的过期任务失败: {str(e)}")
 
+            ledger.flush()
             db.commit()
             logger.info("过期任务处理完成")
 
@@ -209,14 +251,21 @@ class VirtualOrderTaskScheduler:
             db.close()
 
     async def process_expired_tasks_for_student(self, db: Session, service: VirtualOrderService,
-                                              student_id: int, expired_tasks: List[Tasks]):
-        """处理单个学生的过期任务"""
+                                              student_id: int, expired_tasks: List[Tasks],
+                                              ledger: StudentPoolLedger = None):
+        """处理单个学生的过期任务
+
+        Args:
+            ledger: 本轮共享的补贴池账本，为None时单独加载并在处理结束后写回；
+                    传入共享账本时由调用方负责保存点和失败回滚
+        """
+        own_ledger = ledger is None
+        if own_ledger:
+            ledger = StudentPoolLedger(db).load([student_id])
+
         try:
-            # 获取学生补贴池（只查询未删除的记录）
-            pool = db.query(VirtualOrderPool).filter(
-                VirtualOrderPool.student_id == student_id,
-                VirtualOrderPool.is_deleted == False
-            ).first()
+            # 获取学生补贴池（只包含未删除的记录）
+            pool = ledger.get(student_id)
 
             if not pool:
                 logger.warning(f"未找到学生 {student_id} 的补贴池")
@@ -261,12 +310,8 @@ class VirtualOrderTaskScheduler:
             if expired_amount > 0:
                 old_remaining = pool.remaining_amount
                 # 修复：使用正确的计算公式，而不是简单加法
-                # remaining_amount = total_subsidy - completed_amount
-                pool.remaining_amount = pool.total_subsidy - pool.completed_amount
-
-                # 确保剩余金额不超过总补贴金额
-                if pool.remaining_amount > pool.total_subsidy:
-                    pool.remaining_amount = pool.total_subsidy
+                # remaining_amount = total_subsidy - completed_amount（账本保证不超过总补贴金额）
+                ledger.release_expired(student_id)
 
                 logger.info(f"释放过期任务金额 {expired_amount} 回补贴池，剩余金额: {old_remaining} → {pool.remaining_amount} (基于公式: {pool.total_subsidy} - {pool.completed_amount})")
 
@@ -279,11 +324,10 @@ class VirtualOrderTaskScheduler:
             # 重新生成任务（1:1替换）
             if expired_task_count > 0:
                 # 关键修复：检查学生是否已超过补贴上限
-                if pool.consumed_subsidy >= pool.total_subsidy:
+                if pool.reached_limit:
                     logger.info(f"学生 {pool.student_name} 已达到补贴上限: 上限={pool.total_subsidy}元, 已获得={pool.consumed_subsidy}元, 停止过期任务重新生成")
                     # 重置剩余金额为0，防止后续生成
-                    pool.remaining_amount = Decimal('0')
-                    pool.updated_at = datetime.now()
+                    ledger.exhaust(student_id)
                     return
 
                 # 过期任务重新生成使用与价值回收相同的规则
@@ -319,30 +363,29 @@ class VirtualOrderTaskScheduler:
 
                 # 更新补贴池剩余金额
                 if generated_tasks_count > 0:
-                    pool.remaining_amount -= total_generated_amount
-
-                    # 确保剩余金额不为负数
-                    if pool.remaining_amount < 0:
-                        pool.remaining_amount = Decimal('0')
-
-                    pool.updated_at = datetime.now()
+                    # 账本保证剩余金额不为负数
+                    ledger.deduct(student_id, total_generated_amount)
 
                     logger.info(f"为学生 {pool.student_name} 重新生成了 {generated_tasks_count} 个任务（1:1替换），总金额: {total_generated_amount}，剩余: {pool.remaining_amount}")
                 else:
                     logger.warning(f"为学生 {pool.student_name} 过期任务重新生成失败")
 
                 # 已分配金额不需要更新（始终等于总补贴金额）
-                # pool.allocated_amount 保持不变
-                pool.last_allocation_at = datetime.now()
+                # pool.allocated_amount 保持不变，last_allocation_at 由补贴流水汇总时更新
 
                 logger.info(f"补贴池状态更新 - 总补贴: {pool.total_subsidy}, 已分配: {pool.allocated_amount}, 剩余: {pool.remaining_amount}, 已完成: {pool.completed_amount}")
             else:
                 logger.info(f"学生 {pool.student_name} 当日补贴额度已满，跳过过期任务重新生成")
 
         except Exception as e:
-            db.rollback()
+            if own_ledger:
+                db.rollback()
+                own_ledger = False  # 事务已回滚，不再写回
             logger.error(f"处理学生 {student_id} 的过期任务失败: {str(e)}")
             raise
+        finally:
+            if own_ledger:
+                ledger.flush()
 
     async def process_expired_bonus_pool_tasks(self, db: Session, service: VirtualOrderService,
                                              expired_tasks: List[Tasks]):
@@ -571,7 +614,7 @@ class VirtualOrderTaskScheduler:
             logger.error(f"标记过期任务失败: {str(e)}")
             db.rollback()
 
-    async def mark_value_recycled_only(self, db: Session):
+    def mark_value_recycled_only(self, db: Session):
         """仅标记已完成任务为已回收，不重新生成任务"""
         try:
             five_minutes_ago = datetime.now() - timedelta(minutes=5)
@@ -587,10 +630,20 @@ class VirtualOrderTaskScheduler:
             ).all()
 
             if completed_tasks:
+                # 这些任务在外部完成，标记已回收前记录完成流水，补贴池的完成金额和实际消耗不会遗漏
+                student_ids = {task.target_student_id for task in completed_tasks}
+                rebate_rates = VirtualOrderService(db).get_student_rebate_rates(student_ids)
+                ledger = StudentPoolLedger(db).load(student_ids)
+
                 for task in completed_tasks:
+                    student_id = task.target_student_id
+                    if ledger.get(student_id):
+                        student_income = task.commission * rebate_rates.get(student_id, DEFAULT_REBATE_RATE)
+                        ledger.record_completion(student_id, task.commission, student_income, task_id=task.id)
                     task.value_recycled = True
                     task.updated_at = datetime.now()
 
+                ledger.flush()
                 db.commit()
                 logger.info(f"已标记 {len(completed_tasks)} 个已完成任务为已回收状态")
             else:
@@ -601,7 +654,16 @@ class VirtualOrderTaskScheduler:
             db.rollback()
 
     async def run_daily_bonus_pool_task(self):
-        """执行每日奖金池任务"""
+        """执行每日奖金池任务（等待正在执行的价值回收等任务结束后再开始）"""
+        # 先设置暂停标志，正在执行的价值回收在当前批次结束后停止
+        self.daily_task_running = True
+        try:
+            async with self._get_pool_job_lock():
+                await self._run_daily_bonus_pool_task()
+        finally:
+            self.daily_task_running = False
+
+    async def _run_daily_bonus_pool_task(self):
         # 修复1: 设置暂停标志，阻止其他定时任务执行
         self.daily_task_running = True
         start_time = datetime.now()
@@ -646,11 +708,23 @@ class VirtualOrderTaskScheduler:
             achievement_result = bonus_service.update_daily_achievements(yesterday)
             logger.info(f"学生达标统计完成: {achievement_result}")
 
+            # 5.1 昨日任务已清理完毕，刷新昨日的虚拟订单每日汇总并在重置补贴池前记录剩余补贴；
+            #     提交的任务可能在今天才自动确认，昨日暂不关账，只关账已结束两天的日期
+            try:
+                rollup_service = DailyRollupService(db)
+                rollup_service.refresh_day(yesterday)
+                rollup_service.snapshot_remaining_subsidy(yesterday)
+                rollup_service.close_settled_days()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"虚拟订单每日汇总关账失败: {str(e)}")
+
             # 6. 重置所有学生的当日完成金额（新的一天开始）- 在清理完昨天数据后执行
-            from shared.models.virtual_order_pool import VirtualOrderPool
             pools = db.query(VirtualOrderPool).filter(
                 VirtualOrderPool.status == 'active'
             ).all()
+            # 重置会覆盖余额，之前未汇总的补贴流水不再累加
+            SubsidyLedgerService(db).supersede_pending([pool.id for pool in pools])
             for pool in pools:
                 pool.completed_amount = Decimal('0')
                 pool.consumed_subsidy = Decimal('0')  # 重置实际消耗的补贴
@@ -725,12 +799,23 @@ class VirtualOrderTaskScheduler:
         self.last_daily_task_date = date.today()
 
     async def check_value_recycling(self):
-        """检查并处理需要价值回收的已完成虚拟任务"""
-        # 检查是否正在执行每日任务
-        if self.daily_task_running:
-            logger.info("每日凌晨任务正在执行中，跳过价值回收任务")
-            return
+        """检查并处理需要价值回收的已完成虚拟任务
 
+        积压超过单批次大小时进入追赶模式：按积压深度自适应放大批次，
+        并在时间预算内连续处理多个批次。
+        数据库操作都是同步的，整个处理过程放到线程中执行，不阻塞事件循环上的API请求；
+        执行期间持有补贴池任务锁，每日任务和过期任务检查会等待其结束。
+        """
+        async with self._get_pool_job_lock():
+            # 检查是否正在执行每日任务
+            if self.daily_task_running:
+                logger.info("每日凌晨任务正在执行中，跳过价值回收任务")
+                return
+
+            await asyncio.to_thread(self._run_value_recycling)
+
+    def _run_value_recycling(self):
+        """价值回收处理（在线程中执行）"""
         db = SessionLocal()
         try:
             logger.info("开始检查需要价值回收的已完成任务...")
@@ -743,137 +828,240 @@ class VirtualOrderTaskScheduler:
             if not generation_config['enabled'] or not generation_config['value_recycling_enabled']:
                 logger.info("虚拟任务生成或价值回收任务生成已禁用，跳过价值回收任务生成")
                 # 仍然需要标记任务为已回收，但不重新生成任务
-                await self.mark_value_recycled_only(db)
+                self.mark_value_recycled_only(db)
                 return
 
-            # 查找所有未回收价值的已完成普通虚拟任务（排除奖金池任务）
-            # 移除时间限制，确保服务中断后重启时能处理所有积压的任务
-            completed_tasks = db.query(Tasks).filter(
-                and_(
-                    Tasks.is_virtual == True,
-                    Tasks.is_bonus_pool == False,  # 只处理普通虚拟任务，排除奖金池任务
-                    Tasks.status == '4',  # 已完成状态
-                    Tasks.value_recycled == False,  # 未回收价值
-                    Tasks.target_student_id.isnot(None)  # 有目标学生的任务
-                )
-            ).order_by(Tasks.updated_at.asc()).limit(50).all()  # 限制批次大小，按时间顺序处理
+            # 所有未回收价值的已完成普通虚拟任务（排除奖金池任务）
+            # 不加时间限制，确保服务中断后重启时能处理所有积压的任务
+            pending_filter = and_(
+                Tasks.is_virtual == True,
+                Tasks.is_bonus_pool == False,  # 只处理普通虚拟任务，排除奖金池任务
+                Tasks.status == '4',  # 已完成状态
+                Tasks.value_recycled == False,  # 未回收价值
+                Tasks.target_student_id.isnot(None)  # 有目标学生的任务
+            )
 
-            if not completed_tasks:
+            backlog_depth = db.query(func.count(Tasks.id)).filter(pending_filter).scalar() or 0
+            started_at = datetime.now()
+
+            if backlog_depth == 0:
+                self._record_value_recycling_metrics(backlog_depth, 0, 0, False, started_at)
                 logger.info("没有发现需要价值回收的已完成任务")
                 return
 
-            logger.info(f"发现 {len(completed_tasks)} 个需要价值回收的已完成普通虚拟任务（不包含奖金池任务）")
+            batch_size = self._get_value_recycling_batch_size(backlog_depth)
+            catch_up_mode = backlog_depth > self.value_recycling_batch_size
+            if catch_up_mode:
+                logger.info(f"价值回收积压 {backlog_depth} 个任务，进入追赶模式，批次大小 {batch_size}")
 
-            # 按学生分组处理
-            student_recycled_values = {}
             service = VirtualOrderService(db)
+            processed_count = 0
 
-            for task in completed_tasks:
-                student_id = task.target_student_id
+            while True:
+                # 按时间顺序处理
+                completed_tasks = db.query(Tasks).filter(pending_filter).order_by(
+                    Tasks.updated_at.asc()
+                ).limit(batch_size).all()
 
-                # 计算回收价值
-                rebate_rate = service.get_student_rebate_rate(student_id)
-                student_income = task.commission * rebate_rate  # 学生实际获得的收益
-                recycled_value = task.commission - student_income  # 回收的价值
+                if not completed_tasks:
+                    break
 
-                # 标记任务已回收
-                task.value_recycled = True
-                task.recycled_at = datetime.now()
+                logger.info(f"发现 {len(completed_tasks)} 个需要价值回收的已完成普通虚拟任务（不包含奖金池任务）")
 
-                # 累计该学生的回收价值
-                if student_id not in student_recycled_values:
-                    student_recycled_values[student_id] = {
-                        'student_name': '',
-                        'recycled_amount': Decimal('0'),
-                        'task_count': 0
-                    }
-
-                student_recycled_values[student_id]['recycled_amount'] += recycled_value
-                student_recycled_values[student_id]['task_count'] += 1
-
-                logger.info(f"任务 {task.id} 回收价值: {recycled_value}元 (任务面值: {task.commission}, 学生收益: {student_income})")
+                self._process_value_recycling_batch(db, service, completed_tasks)
+                db.commit()
+                processed_count += len(completed_tasks)
+
+                # 普通模式每轮只处理一个批次
+                if not catch_up_mode or len(completed_tasks) < batch_size:
+                    break
+
+                # 追赶模式：超出时间预算或调度器状态变化时留到下一轮
+                elapsed = (datetime.now() - started_at).total_seconds()
+                if elapsed >= self.value_recycling_catch_up_time_budget_seconds:
+                    logger.info(f"价值回收追赶模式已执行 {elapsed:.1f} 秒，剩余积压留到下一轮处理")
+                    break
+                if not self.is_running or self.daily_task_running:
+                    break
+
+            self._record_value_recycling_metrics(
+                backlog_depth, processed_count, batch_size, catch_up_mode, started_at
+            )
+            logger.info(f"价值回收处理完成: {self.value_recycling_metrics}")
 
-            # 为每个学生重新生成任务
-            for student_id, recycled_info in student_recycled_values.items():
-                try:
-                    await self.process_value_recycling_for_student(
-                        db, service, student_id, recycled_info['recycled_amount']
-                    )
-                except Exception as e:
-                    logger.error(f"处理学生 {student_id} 的价值回收失败: {str(e)}")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"价值回收检查失败: {str(e)}")
+        finally:
+            db.close()
 
+    async def refresh_daily_rollups(self):
+        """增量刷新未关账日期的虚拟订单每日汇总，并补关前天及更早的日期"""
+        db = SessionLocal()
+        try:
+            rollup_service = DailyRollupService(db)
+            # 补关已结束两天的日期（如每日任务被禁用或服务中断）
+            rollup_service.close_settled_days()
+            refreshed = rollup_service.refresh_open_days()
             db.commit()
-            logger.info("价值回收处理完成")
-
+            logger.info(f"虚拟订单每日汇总已刷新 {refreshed} 天")
         except Exception as e:
             db.rollback()
-            logger.error(f"价值回收检查失败: {str(e)}")
+            logger.error(f"刷新虚拟订单每日汇总失败: {str(e)}")
         finally:
             db.close()
 
-    async def process_value_recycling_for_student(self, db: Session, service: VirtualOrderService,
-                                                student_id: int, recycled_amount: Decimal):
-        """处理单个学生的价值回收"""
+    async def materialize_subsidy_ledger(self):
+        """将未汇总的补贴流水增量汇总到学生补贴池"""
+        db = SessionLocal()
         try:
-            # 获取学生补贴池
-            pool = db.query(VirtualOrderPool).filter(
-                VirtualOrderPool.student_id == student_id,
-                VirtualOrderPool.is_deleted == False
-            ).first()
+            count = SubsidyLedgerService(db).materialize_all(self.subsidy_ledger_batch_size)
+            if count:
+                logger.info(f"补贴流水汇总完成，共 {count} 条")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"补贴流水汇总失败: {str(e)}")
+        finally:
+            db.close()
 
-            if not pool:
-                logger.warning(f"未找到学生 {student_id} 的补贴池")
-                return
+    def _get_value_recycling_batch_size(self, backlog_depth: int) -> int:
+        """根据积压深度计算价值回收批次大小（目标在约5个批次内消化积压）"""
+        adaptive_size = backlog_depth // 5
+        return max(
+            self.value_recycling_batch_size,
+            min(self.value_recycling_max_batch_size, adaptive_size)
+        )
+
+    def _record_value_recycling_metrics(self, backlog_depth: int, processed_count: int,
+                                        batch_size: int, catch_up_mode: bool, started_at: datetime):
+        """记录价值回收的积压深度和消化速度"""
+        duration = (datetime.now() - started_at).total_seconds()
+        self.value_recycling_metrics.update({
+            'backlog_depth': backlog_depth,
+            'remaining_backlog': max(backlog_depth - processed_count, 0),
+            'processed_count': processed_count,
+            'batch_size': batch_size,
+            'catch_up_mode': catch_up_mode,
+            'duration_seconds': round(duration, 2),
+            'drain_rate_per_minute': round(processed_count / duration * 60, 2) if duration > 0 else 0.0,
+            'last_run_at': started_at.isoformat()
+        })
+
+    def get_value_recycling_metrics(self) -> Dict[str, Any]:
+        """获取最近一次价值回收的运行指标"""
+        return dict(self.value_recycling_metrics)
+
+    def _process_value_recycling_batch(self, db: Session, service: VirtualOrderService,
+                                       completed_tasks: List[Tasks]):
+        """
+        处理一个批次的价值回收
 
-            # 价值回收：基于补贴池剩余金额生成1-2个任务
-            logger.info(f"学生 {pool.student_name} 价值回收: 剩余补贴 {pool.remaining_amount}")
+        涉及学生的补贴池和返佣比例各用一次查询预加载，
+        替换任务通过一次批量分配调用生成，补贴池变更在批次结束时一次写回。
+        仓库内的完成路径会同时标记已回收，这里的任务都在外部完成、尚未记录完成流水，
+        先记录完成（累计完成金额和实际消耗）再判断补贴上限和补发任务。
+        """
+        student_ids = {task.target_student_id for task in completed_tasks}
 
-            # 检查是否还有剩余补贴额度
-            if pool.remaining_amount <= 0:
-                logger.info(f"学生 {pool.student_name} 当日补贴已用完，跳过价值回收任务生成")
-                return
+        # 预加载返佣比例和补贴池
+        rebate_rates = service.get_student_rebate_rates(student_ids)
+        ledger = StudentPoolLedger(db).load(student_ids)
 
-            # 关键修复：检查学生是否已超过补贴上限
-            if pool.consumed_subsidy >= pool.total_subsidy:
-                logger.info(f"学生 {pool.student_name} 已达到补贴上限: 上限={pool.total_subsidy}元, 已获得={pool.consumed_subsidy}元, 停止价值回收任务生成")
-                # 重置剩余金额为0，防止后续生成
-                pool.remaining_amount = Decimal('0')
-                pool.updated_at = datetime.now()
-                return
+        # 按学生分组累计回收价值
+        student_recycled_values = {}
+        recycled_at = datetime.now()
 
-            # 价值回收任务金额规则：
-            # - 剩余补贴 < 8元：生成5元任务
-            # - 剩余补贴 >= 8元：生成10元任务
-            if pool.remaining_amount < Decimal('8'):
-                task_amount = Decimal('5')
-            else:
-                task_amount = Decimal('10')
+        for task in completed_tasks:
+            student_id = task.target_student_id
 
-            logger.info(f"学生 {pool.student_name} 价值回收规则：剩余补贴 {pool.remaining_amount}元，生成 {task_amount}元 任务")
+            # 计算回收价值
+            rebate_rate = rebate_rates.get(student_id, DEFAULT_REBATE_RATE)
+            student_income = task.commission * rebate_rate  # 学生实际获得的收益
+            recycled_value = task.commission - student_income  # 回收的价值
 
-            # 使用虚拟客服分配策略生成指定金额的任务
-            result = service.generate_virtual_tasks_with_service_allocation(
-                student_id, pool.student_name, task_amount, on_demand=True
-            )
+            # 记录任务完成（剩余价值加回补贴池，与自动确认的完成路径一致）
+            if ledger.get(student_id):
+                ledger.record_completion(student_id, task.commission, student_income, task_id=task.id)
 
-            if result['success']:
-                # 更新补贴池：减少剩余金额
-                generated_amount = Decimal(str(result['total_amount']))
-                pool.remaining_amount -= generated_amount
+            # 标记任务已回收
+            task.value_recycled = True
+            task.recycled_at = recycled_at
 
-                # 确保剩余金额不为负数（价值回收可能超出剩余补贴）
-                if pool.remaining_amount < 0:
-                    pool.remaining_amount = Decimal('0')
+            student_recycled_values[student_id] = student_recycled_values.get(student_id, Decimal('0')) + recycled_value
 
-                pool.updated_at = datetime.now()
+            logger.debug(f"任务 {task.id} 回收价值: {recycled_value}元 (任务面值: {task.commission}, 学生收益: {student_income})")
 
+        # 汇总需要补发任务的学生
+        allocation_requests = []
+        for student_id in student_recycled_values:
+            pool = ledger.get(student_id)
+            if not pool:
+                logger.warning(f"未找到学生 {student_id} 的补贴池")
+                continue
+
+            task_amount = self._get_value_recycling_task_amount(ledger, pool)
+            if task_amount is None:
+                continue
+
+            allocation_requests.append({
+                'student_id': student_id,
+                'student_name': pool.student_name,
+                'total_amount': task_amount,
+                'on_demand': True
+            })
+
+        if allocation_requests:
+            # 一次批量分配调用生成所有替换任务
+            results = service.generate_virtual_tasks_bulk_with_service_allocation(allocation_requests)
+            self._apply_value_recycling_results(ledger, allocation_requests, results)
+
+        ledger.flush()
+
+    def _apply_value_recycling_results(self, ledger: StudentPoolLedger,
+                                       allocation_requests: List[Dict[str, Any]],
+                                       results: Dict[int, Dict[str, Any]]):
+        """根据批量生成结果扣减补贴池剩余金额"""
+        for request in allocation_requests:
+            pool = ledger.get(request['student_id'])
+            result = results.get(request['student_id'])
+
+            if result and result['success']:
+                generated_amount = Decimal(str(result['total_amount']))
+                # 账本保证剩余金额不为负数（价值回收可能超出剩余补贴）
+                ledger.deduct(pool.student_id, generated_amount, SubsidyLedgerService.EVENT_RECYCLE)
                 logger.info(f"为学生 {pool.student_name} 价值回收生成了 {len(result['tasks'])} 个任务，总金额: {generated_amount}，剩余补贴: {pool.remaining_amount}")
             else:
-                logger.warning(f"为学生 {pool.student_name} 价值回收生成任务失败: {result['message']}")
+                logger.warning(f"为学生 {pool.student_name} 价值回收生成任务失败: {result['message'] if result else '无分配结果'}")
 
-        except Exception as e:
-            logger.error(f"处理学生 {student_id} 的价值回收时出错: {str(e)}")
-            raise
+    def _get_value_recycling_task_amount(self, ledger: StudentPoolLedger, pool: PoolState):
+        """
+        计算价值回收补发任务的金额，不需要补发时返回None
+
+        - 剩余补贴 < 8元：生成5元任务
+        - 剩余补贴 >= 8元：生成10元任务
+        """
+        # 价值回收：基于补贴池剩余金额生成1-2个任务
+        logger.info(f"学生 {pool.student_name} 价值回收: 剩余补贴 {pool.remaining_amount}")
+
+        # 检查是否还有剩余补贴额度
+        if pool.remaining_amount <= 0:
+            logger.info(f"学生 {pool.student_name} 当日补贴已用完，跳过价值回收任务生成")
+            return None
+
+        # 关键修复：检查学生是否已超过补贴上限
+        if pool.reached_limit:
+            logger.info(f"学生 {pool.student_name} 已达到补贴上限: 上限={pool.total_subsidy}元, 已获得={pool.consumed_subsidy}元, 停止价值回收任务生成")
+            # 重置剩余金额为0，防止后续生成
+            ledger.exhaust(pool.student_id)
+            return None
+
+        if pool.remaining_amount < Decimal('8'):
+            task_amount = Decimal('5')
+        else:
+            task_amount = Decimal('10')
+
+        logger.info(f"学生 {pool.student_name} 价值回收规则：剩余补贴 {pool.remaining_amount}元，生成 {task_amount}元 任务")
+        return task_amount
 
     async def process_bonus_pool_value_recycling(self, db: Session, service: VirtualOrderService,
                                                bonus_pool_tasks: List[Tasks]):
@@ -884,11 +1072,16 @@ class VirtualOrderTaskScheduler:
 
             total_recycled_value = Decimal('0')
 
+            # 一次性加载涉及学生的返佣比例
+            rebate_rates = service.get_student_rebate_rates(
+                [task.target_student_id for task in bonus_pool_tasks]
+            )
+
             for task in bonus_pool_tasks:
                 student_id = task.target_student_id
 
                 # 计算回收价值
-                rebate_rate = service.get_student_rebate_rate(student_id)
+                rebate_rate = rebate_rates.get(student_id) or service.get_student_rebate_rate(student_id)
                 student_income = task.commission * rebate_rate  # 学生实际获得的收益
                 recycled_value = task.commission - student_income  # 回收的价值
 
@@ -925,6 +1118,10 @@ class VirtualOrderTaskScheduler:
 
     async def check_auto_confirm_tasks(self):
         """检查并自动确认提交超过配置时间的虚拟任务（每5分钟执行）"""
+        async with self._get_pool_job_lock():
+            await self._check_auto_confirm_tasks()
+
+    async def _check_auto_confirm_tasks(self):
         # 检查是否正在执行每日任务
         if self.daily_task_running:
             logger.info("每日凌晨任务正在执行中，跳过自动确认任务")
@@ -1008,10 +1205,16 @@ class VirtualOrderTaskScheduler:
                 logger.info("阶段1：批量完成所有任务，不生成新任务")
                 affected_students = set()
 
+                # 一次加载本批次涉及学生的补贴池，两个阶段共享同一账本
+                task_ids = [submission.task_id for submission in pending_submissions]
+                ledger = StudentPoolLedger(db).load(
+                    row[0] for row in db.query(Tasks.target_student_id).filter(Tasks.id.in_(task_ids)).distinct()
+                )
+
                 for submission in pending_submissions:
                     try:
                         # 调用仅完成任务的方法（不生成新任务）
-                        result = await self.complete_task_without_generation(db, service, submission.task_id)
+                        result = await self.complete_task_without_generation(db, service, submission.task_id, ledger)
                         if result['success']:
                             logger.info(f"批量完成任务: task_id={submission.task_id}, student_id={result.get('student_id')}, commission={result.get('task_commission')}")
                             confirmed_count += 1
@@ -1024,6 +1227,7 @@ class VirtualOrderTaskScheduler:
 
                 # 提交阶段1的所有数据库更改
                 try:
+                    ledger.flush()
                     db.commit()
                     logger.info(f"阶段1数据库提交成功，已完成 {confirmed_count} 个任务")
                 except Exception as e:
@@ -1035,8 +1239,9 @@ class VirtualOrderTaskScheduler:
                 if affected_students:
                     logger.info(f"阶段2：为 {len(affected_students)} 个学生基于最终状态生成新任务")
                     try:
-                        await self.batch_generate_tasks_for_students(db, service, affected_students)
+                        await self.batch_generate_tasks_for_students(db, service, affected_students, ledger)
                         # 提交阶段2的数据库更改
+                        ledger.flush()
                         db.commit()
                         logger.info("阶段2数据库提交成功，新任务生成完成")
                     except Exception as e:
@@ -1059,10 +1264,14 @@ class VirtualOrderTaskScheduler:
             except Exception as close_error:
                 logger.error(f"数据库连接关闭失败: {str(close_error)}")
 
-    async def complete_task_without_generation(self, db: Session, service: VirtualOrderService, task_id: int) -> Dict[str, Any]:
+    async def complete_task_without_generation(self, db: Session, service: VirtualOrderService, task_id: int,
+                                               ledger: StudentPoolLedger = None) -> Dict[str, Any]:
         """
         仅完成任务，不生成新任务（用于批量处理的第一阶段）
+
+        补贴池变更记录在账本中，由调用方统一写回；未传入账本时单独加载并立即写回。
         """
+        own_ledger = ledger is None
         try:
             # 查找虚拟任务
             task = db.query(Tasks).filter(
@@ -1092,10 +1301,9 @@ class VirtualOrderTaskScheduler:
             task.updated_at = datetime.now()
 
             # 查找对应的学生补贴池
-            pool = db.query(VirtualOrderPool).filter(
-                VirtualOrderPool.student_id == task.target_student_id,
-                VirtualOrderPool.is_deleted == False
-            ).first()
+            if own_ledger:
+                ledger = StudentPoolLedger(db).load([task.target_student_id])
+            pool = ledger.get(task.target_student_id)
 
             if not pool:
                 return {
@@ -1108,13 +1316,10 @@ class VirtualOrderTaskScheduler:
             student_actual_income = task.commission * rebate_rate
             remaining_task_value = task.commission - student_actual_income
 
-            # 更新学生补贴池（只更新统计，不生成新任务）
-            pool.completed_amount += task.commission
-            pool.consumed_subsidy += student_actual_income
-
-            # 将剩余价值加回补贴池
-            pool.remaining_amount += remaining_task_value
-            pool.updated_at = datetime.now()
+            # 更新学生补贴池（只更新统计，不生成新任务），剩余价值加回补贴池
+            ledger.record_completion(task.target_student_id, task.commission, student_actual_income)
+            if own_ledger:
+                ledger.flush()
 
             logger.info(f"任务完成分析: 任务面值={task.commission}, 返佣比例={rebate_rate}, 学生收入={student_actual_income:.3f}, 剩余价值={remaining_task_value:.3f}")
             logger.info(f"剩余价值 {remaining_task_value:.3f} 已加回补贴池，当前剩余: {pool.remaining_amount:.3f}")
@@ -1136,30 +1341,33 @@ class VirtualOrderTaskScheduler:
                 'message': f"完成任务失败: {str(e)}"
             }
 
-    async def batch_generate_tasks_for_students(self, db: Session, service: VirtualOrderService, affected_students: set):
+    async def batch_generate_tasks_for_students(self, db: Session, service: VirtualOrderService, affected_students: set,
+                                               ledger: StudentPoolLedger = None):
         """
         基于最终补贴池状态，为受影响的学生批量生成新任务（批量处理的第二阶段）
+
+        补贴池变更记录在账本中，由调用方统一写回；未传入账本时单独加载并在结束时写回。
         """
+        own_ledger = ledger is None
         try:
             logger.info("开始批量生成任务...")
 
+            if own_ledger:
+                ledger = StudentPoolLedger(db).load(affected_students)
+
             for student_id in affected_students:
                 try:
                     # 获取学生最终的补贴池状态
-                    pool = db.query(VirtualOrderPool).filter(
-                        VirtualOrderPool.student_id == student_id,
-                        VirtualOrderPool.is_deleted == False
-                    ).first()
+                    pool = ledger.get(student_id)
 
                     if not pool:
                         logger.warning(f"未找到学生 {student_id} 的补贴池")
                         continue
 
                     # 检查是否已达到补贴上限
-                    if pool.consumed_subsidy >= pool.total_subsidy:
+                    if pool.reached_limit:
                         logger.info(f"学生 {pool.student_name} 已达到补贴上限: 上限={pool.total_subsidy}元, 已获得={pool.consumed_subsidy}元, 停止生成新任务")
-                        pool.remaining_amount = Decimal('0')
-                        pool.updated_at = datetime.now()
+                        ledger.exhaust(student_id)
                         continue
 
                     # 检查是否有剩余金额可以生成任务
@@ -1183,12 +1391,7 @@ class VirtualOrderTaskScheduler:
 
                         if result['success'] and result['tasks']:
                             generated_amount = Decimal(str(result['total_amount']))
-                            pool.remaining_amount -= generated_amount
-
-                            if pool.remaining_amount < 0:
-                                pool.remaining_amount = Decimal('0')
-
-                            pool.updated_at = datetime.now()
+                            ledger.deduct(student_id, generated_amount)
                             logger.info(f"为学生 {pool.student_name} 生成了 {len(result['tasks'])} 个任务，总金额: {generated_amount}，剩余: {pool.remaining_amount}")
                         else:
                             logger.warning(f"为学生 {pool.student_name} 生成任务失败: {result.get('message')}")
@@ -1199,6 +1402,9 @@ class VirtualOrderTaskScheduler:
                     logger.error(f"为学生 {student_id} 生成任务失败: {str(e)}")
                     continue
 
+            if own_ledger:
+                ledger.flush()
+
             logger.info("批量任务生成完成")
 
         except Exception as e:
@@ -1490,6 +1696,10 @@ async def manual_check_expired():
     """手动检查过期任务的接口"""
     await scheduler.manual_check_expired_tasks()
 
+def get_value_recycling_metrics() -> Dict[str, Any]:
+    """获取最近一次价值回收运行指标的接口"""
+    return scheduler.get_value_recycling_metrics()
+
 async def manual_check_auto_confirm():
     """手动检查自动确认任务的接口"""
     await scheduler.manual_check_auto_confirm_tasks()
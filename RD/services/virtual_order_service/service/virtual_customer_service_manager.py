@@ -10,14 +10,16 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 from decimal import Decimal
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func, or_
+from sqlalchemy import and_, func, or_, case
 import threading
-import bcrypt
 
 from shared.models.virtual_customer_service import VirtualCustomerService
 from shared.models.original_user import OriginalUser
 from shared.models.tasks import Tasks
 from shared.exceptions import BusinessException
+from shared.cache.user_principal_cache import UserPrincipalCache
+from shared.cache.redis_client import delete_pattern
+from shared.services.password_hash_service import PasswordHashService
 from .virtual_task_allocator import VirtualTaskAllocator
 
 logger = logging.getLogger(__name__)
@@ -25,6 +27,9 @@ logger = logging.getLogger(__name__)
 class VirtualCustomerServiceManager:
     """虚拟客服管理器"""
     
+    # 任务状态：0-未接单, 1-已接单, 2-进行中, 3-已提交, 4-已完成
+    TASK_STATUSES = ['0', '1', '2', '3', '4']
+    
     def __init__(self, db: Session, redis_client: Optional[redis.Redis] = None):
         self.db = db
         self.redis_client = redis_client
@@ -33,6 +38,7 @@ class VirtualCustomerServiceManager:
         
         # 缓存配置
         self.cache_ttl = 1800  # 30分钟
+        self.stats_cache_ttl = 60  # 统计报表缓存1分钟
         
         # 管理配置
         self.config = {
@@ -88,8 +94,7 @@ class VirtualCustomerServiceManager:
                 password = initial_password or self.config['default_password']
                 
                 # 对密码进行哈希处理
-                salt = bcrypt.gensalt(rounds=10)
-                hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+                hashed_password = PasswordHashService.hash(password)
                 
                 # 创建用户账号
                 user = OriginalUser(
@@ -175,21 +180,30 @@ class VirtualCustomerServiceManager:
             # 总数统计
             total = query.count()
             
-            # 分页查询
+            # 分页查询（关联用户表获取最后登录时间，避免逐条查询）
             offset = (page - 1) * size
-            customer_services = query.order_by(
+            customer_services = query.outerjoin(
+                OriginalUser,
+                and_(
+                    OriginalUser.id == VirtualCustomerService.user_id,
+                    OriginalUser.isDeleted == False
+                )
+            ).with_entities(
+                VirtualCustomerService, OriginalUser.lastLoginTime
+            ).order_by(
                 VirtualCustomerService.created_at.desc()
             ).offset(offset).limit(size).all()
             
+            # 批量获取本页客服的任务统计（单次聚合查询）
+            task_stats_map = {}
+            if include_stats:
+                task_stats_map = self._get_services_task_stats(
+                    [cs.user_id for cs, _ in customer_services]
+                )
+
             # 转换为字典格式
             items = []
-            for cs in customer_services:
-                # 获取关联的用户信息
-                user = self.db.query(OriginalUser).filter(
-                    OriginalUser.id == cs.user_id,
-                    OriginalUser.isDeleted == False
-                ).first()
-                
+            for cs, last_login_time in customer_services:
                 item_data = {
                     'id': cs.id,
                     'user_id': cs.user_id,
@@ -197,16 +211,16 @@ class VirtualCustomerServiceManager:
                     'account': cs.account,
                     'level': cs.level,
                     'status': cs.status,
-                    'last_login_time': user.lastLoginTime.isoformat() if user and user.lastLoginTime else None,
+                    'last_login_time': last_login_time.isoformat() if last_login_time else None,
                     'created_at': cs.created_at.isoformat(),
                     'updated_at': cs.updated_at.isoformat()
                 }
                 
                 # 包含统计信息
                 if include_stats:
-                    # 统计任务数量
-                    task_stats = self._get_service_task_stats(cs.user_id)
-                    item_data.update(task_stats)
+                    item_data['task_stats'] = task_stats_map.get(
+                        cs.user_id, self._empty_task_stats()
+                    )
                 
                 items.append(item_data)
             
@@ -280,13 +294,8 @@ class VirtualCustomerServiceManager:
                 if 'new_password' in update_data and update_data['new_password'] is not None:
                     new_password = update_data['new_password'].strip()
                     if new_password:  # 确保密码不为空
-                        # 导入必要的模块
-                        import bcrypt
-                        from shared.models.original_user import OriginalUser
-
                         # 加密新密码
-                        salt = bcrypt.gensalt(rounds=10)
-                        hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), salt).decode('utf-8')
+                        hashed_password = PasswordHashService.hash(new_password)
 
                         # 更新虚拟客服表的密码
                         cs.initial_password = hashed_password
@@ -318,6 +327,8 @@ class VirtualCustomerServiceManager:
                     
                     # 清除缓存
                     self._clear_cache()
+                    if any(item['field'] == 'password' for item in updated_fields):
+                        UserPrincipalCache.invalidate(cs.user_id)
                     
                     logger.info(f"虚拟客服 {cs.name} 更新完成: {updated_fields}")
                 
@@ -399,6 +410,7 @@ class VirtualCustomerServiceManager:
                 
                 # 清除缓存
                 self._clear_cache()
+                UserPrincipalCache.invalidate(cs.user_id)
                 
                 logger.info(f"虚拟客服 {cs.name} 删除完成，任务重新分配结果: {reallocation_result}")
                 
@@ -480,17 +492,29 @@ class VirtualCustomerServiceManager:
                 data=None
             )
     
-    def get_service_performance(self, cs_id: int, days: int = 30) -> Dict[str, Any]:
+    def get_service_performance(self, cs_id: int, days: int = 30, use_cache: bool = True) -> Dict[str, Any]:
         """
         获取虚拟客服性能统计
         
         Args:
             cs_id: 虚拟客服ID
             days: 统计天数
+            use_cache: 是否使用缓存
             
         Returns:
             Dict: 性能统计数据
         """
+        cache_key = f"virtual_services:performance:{cs_id}:{days}"
+        
+        # 尝试从缓存获取
+        if use_cache and self.redis_client:
+            try:
+                cached_data = self.redis_client.get(cache_key)
+                if cached_data:
+                    return json.loads(cached_data)
+            except Exception as e:
+                logger.warning(f"从缓存获取虚拟客服性能统计失败: {e}")
+        
         try:
             cs = self.db.query(VirtualCustomerService).filter(
                 VirtualCustomerService.id == cs_id,
@@ -508,39 +532,36 @@ class VirtualCustomerServiceManager:
             end_date = datetime.now()
             start_date = end_date - timedelta(days=days)
             
-            # 查询任务统计
-            task_query = self.db.query(Tasks).filter(
+            # 单次条件聚合查询：总数、各状态数量和总金额
+            status_columns = [
+                func.sum(case((Tasks.status == status, 1), else_=0))
+                for status in self.TASK_STATUSES
+            ]
+            row = self.db.query(
+                func.count(Tasks.id),
+                func.sum(Tasks.commission),
+                *status_columns
+            ).filter(
                 and_(
                     Tasks.founder_id == cs.user_id,
                     Tasks.is_virtual == True,
                     Tasks.created_at >= start_date,
                     Tasks.created_at <= end_date
                 )
-            )
-            
-            total_tasks = task_query.count()
+            ).one()
             
-            # 按状态统计
-            status_stats = {}
-            for status in ['0', '1', '2', '3', '4']:
-                count = task_query.filter(Tasks.status == status).count()
-                status_stats[status] = count
-            
-            # 计算总金额
-            total_amount = self.db.query(func.sum(Tasks.commission)).filter(
-                and_(
-                    Tasks.founder_id == cs.user_id,
-                    Tasks.is_virtual == True,
-                    Tasks.created_at >= start_date,
-                    Tasks.created_at <= end_date
-                )
-            ).scalar() or Decimal('0')
+            total_tasks = row[0] or 0
+            total_amount = row[1] or Decimal('0')
+            status_stats = {
+                status: int(count or 0)
+                for status, count in zip(self.TASK_STATUSES, row[2:])
+            }
             
             # 计算完成率
             completed_tasks = status_stats.get('4', 0)
             completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
             
-            return {
+            result = {
                 'service_id': cs.id,
                 'service_name': cs.name,
                 'period': {
@@ -566,6 +587,15 @@ class VirtualCustomerServiceManager:
                 }
             }
             
+            # 缓存结果
+            if self.redis_client:
+                try:
+                    self.redis_client.setex(cache_key, self.stats_cache_ttl, json.dumps(result))
+                except Exception as e:
+                    logger.warning(f"缓存虚拟客服性能统计失败: {e}")
+            
+            return result
+            
         except BusinessException:
             raise
         except Exception as e:
@@ -578,92 +608,107 @@ class VirtualCustomerServiceManager:
     
     def _get_service_task_stats(self, user_id: int) -> Dict[str, Any]:
         """获取单个虚拟客服的任务统计"""
-        try:
-            # 查询任务统计
-            total_tasks = self.db.query(Tasks).filter(
-                and_(
-                    Tasks.founder_id == user_id,
-                    Tasks.is_virtual == True
-                )
-            ).count()
-            
-            pending_tasks = self.db.query(Tasks).filter(
-                and_(
-                    Tasks.founder_id == user_id,
-                    Tasks.is_virtual == True,
-                    Tasks.status.in_(['0', '1', '2'])
-                )
-            ).count()
-            
-            completed_tasks = self.db.query(Tasks).filter(
-                and_(
-                    Tasks.founder_id == user_id,
-                    Tasks.is_virtual == True,
-                    Tasks.status == '4'
-                )
-            ).count()
+        stats_map = self._get_services_task_stats([user_id])
+        return {'task_stats': stats_map.get(user_id, self._empty_task_stats())}
+    
+    def _get_services_task_stats(self, user_ids: List[int], use_cache: bool = True) -> Dict[int, Dict[str, Any]]:
+        """
+        批量获取虚拟客服的任务统计（按founder_id分组的单次条件聚合查询）
+        
+        Args:
+            user_ids: 虚拟客服关联的用户ID列表
+            use_cache: 是否使用缓存
             
-            # 计算总金额
-            total_amount = self.db.query(func.sum(Tasks.commission)).filter(
+        Returns:
+            Dict[int, Dict]: {user_id: task_stats}
+        """
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return {}
+        
+        cache_key = f"virtual_services:task_stats:{','.join(str(uid) for uid in user_ids)}"
+        
+        # 尝试从缓存获取
+        if use_cache and self.redis_client:
+            try:
+                cached_data = self.redis_client.get(cache_key)
+                if cached_data:
+                    return {int(uid): stats for uid, stats in json.loads(cached_data).items()}
+            except Exception as e:
+                logger.warning(f"从缓存获取任务统计失败: {e}")
+        
+        try:
+            rows = self.db.query(
+                Tasks.founder_id,
+                func.count(Tasks.id),
+                func.sum(case((Tasks.status.in_(['0', '1', '2']), 1), else_=0)),
+                func.sum(case((Tasks.status == '4', 1), else_=0)),
+                func.sum(Tasks.commission)
+            ).filter(
                 and_(
-                    Tasks.founder_id == user_id,
+                    Tasks.founder_id.in_(user_ids),
                     Tasks.is_virtual == True
                 )
-            ).scalar() or Decimal('0')
-            
-            return {
-                'task_stats': {
-                    'total_tasks': total_tasks,
-                    'pending_tasks': pending_tasks,
-                    'completed_tasks': completed_tasks,
-                    'total_amount': float(total_amount),
-                    'completion_rate': round(
-                        (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0, 2
-                    )
-                }
-            }
-            
+            ).group_by(Tasks.founder_id).all()
         except Exception as e:
             logger.warning(f"获取任务统计失败: {e}")
-            return {
-                'task_stats': {
-                    'total_tasks': 0,
-                    'pending_tasks': 0,
-                    'completed_tasks': 0,
-                    'total_amount': 0.0,
-                    'completion_rate': 0.0
-                }
+            return {}
+        
+        stats_map = {}
+        for founder_id, total_tasks, pending_tasks, completed_tasks, total_amount in rows:
+            total_tasks = int(total_tasks or 0)
+            completed_tasks = int(completed_tasks or 0)
+            stats_map[founder_id] = {
+                'total_tasks': total_tasks,
+                'pending_tasks': int(pending_tasks or 0),
+                'completed_tasks': completed_tasks,
+                'total_amount': float(total_amount or 0),
+                'completion_rate': round(
+                    (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0, 2
+                )
             }
+        
+        # 缓存结果
+        if self.redis_client:
+            try:
+                self.redis_client.setex(cache_key, self.stats_cache_ttl, json.dumps(stats_map))
+            except Exception as e:
+                logger.warning(f"缓存任务统计失败: {e}")
+        
+        return stats_map
+    
+    @staticmethod
+    def _empty_task_stats() -> Dict[str, Any]:
+        """无任务时的默认统计"""
+        return {
+            'total_tasks': 0,
+            'pending_tasks': 0,
+            'completed_tasks': 0,
+            'total_amount': 0.0,
+            'completion_rate': 0.0
+        }
     
     def _get_services_summary(self) -> Dict[str, Any]:
         """获取虚拟客服整体统计"""
         try:
-            # 统计虚拟客服数量
-            total_services = self.db.query(VirtualCustomerService).filter(
+            # 单次条件聚合查询统计客服数量
+            recent_cutoff = datetime.now() - timedelta(hours=24)
+            total_services, active_services, new_services = self.db.query(
+                func.count(VirtualCustomerService.id),
+                func.sum(case((VirtualCustomerService.status == 'active', 1), else_=0)),
+                func.sum(case((VirtualCustomerService.created_at >= recent_cutoff, 1), else_=0))
+            ).filter(
                 VirtualCustomerService.is_deleted == False
-            ).count()
-            
-            active_services = self.db.query(VirtualCustomerService).filter(
-                and_(
-                    VirtualCustomerService.is_deleted == False,
-                    VirtualCustomerService.status == 'active'
-                )
-            ).count()
+            ).one()
             
-            # 统计新增客服（24小时内）
-            recent_cutoff = datetime.now() - timedelta(hours=24)
-            new_services = self.db.query(VirtualCustomerService).filter(
-                and_(
-                    VirtualCustomerService.is_deleted == False,
-                    VirtualCustomerService.created_at >= recent_cutoff
-                )
-            ).count()
+            total_services = int(total_services or 0)
+            active_services = int(active_services or 0)
             
             return {
                 'total_services': total_services,
                 'active_services': active_services,
                 'inactive_services': total_services - active_services,
-                'new_services_24h': new_services
+                'new_services_24h': int(new_services or 0)
             }
             
         except Exception as e:
@@ -686,9 +731,7 @@ class VirtualCustomerServiceManager:
                 ]
                 
                 for pattern in cache_keys:
-                    keys = self.redis_client.keys(pattern)
-                    if keys:
-                        self.redis_client.delete(*keys)
+                    delete_pattern(self.redis_client, pattern)
                 
                 logger.info("已清除虚拟客服管理相关缓存")
                 
@@ -3,10 +3,10 @@ import random
 import json
 import os
 import redis
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Iterator
 from decimal import Decimal
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, or_, func, case
 from nanoid import generate
 
 from shared.models.virtual_order_pool import VirtualOrderPool
@@ -15,8 +15,17 @@ from shared.models.tasks import Tasks
 from shared.models.userinfo import UserInfo
 from shared.models.original_user import OriginalUser
 from shared.models.agents import Agents
+from shared.models.task_accepted_student import TaskAcceptedStudent
+from shared.models.system_config import SystemConfig
 from shared.exceptions import BusinessException
-from ..utils.excel_utils import ExcelProcessor
+from shared.cache.user_principal_cache import UserPrincipalCache
+from shared.cache.redis_client import get_redis_client
+from shared.services.password_hash_service import PasswordHashService
+from shared.services.subsidy_ledger_service import SubsidyLedgerService
+from ..utils.excel_utils import ExcelProcessor, ExportSheet, StreamingExporter, EXPORT_FORMATS
+from .rebate_rate_resolver import RebateRateResolver
+from .pool_ledger import StudentPoolLedger
+from .daily_rollup_service import DailyRollupService
 import math
 import logging
 
@@ -34,7 +43,8 @@ class VirtualOrderService:
 
     def __init__(self, db: Session, redis_client: Optional[redis.Redis] = None):
         self.db = db
-        self.redis_client = redis_client
+        # 未指定时使用全局共享的Redis客户端（Redis不可用时为None，按无缓存处理）
+        self.redis_client = redis_client if redis_client is not None else get_redis_client()
 
         # nanoid字符集（对应JS的customAlphabet('1234567890abcdef', 10)）
         self.nanoid_alphabet = '1234567890abcdef'
@@ -64,6 +74,7 @@ class VirtualOrderService:
         # 初始化分配器和管理器（延迟加载，避免循环导入）
         self._allocator = None
         self._service_manager = None
+        self._rebate_resolver = None
 
     @property
     def allocator(self):
@@ -81,6 +92,13 @@ class VirtualOrderService:
             self._service_manager = VirtualCustomerServiceManager(self.db, self.redis_client)
         return self._service_manager
 
+    @property
+    def rebate_resolver(self):
+        """获取返佣比例解析器实例"""
+        if self._rebate_resolver is None:
+            self._rebate_resolver = RebateRateResolver(self.db, self.redis_client)
+        return self._rebate_resolver
+
     def _load_task_content_config(self):
         """加载任务内容配置文件"""
         try:
@@ -115,7 +133,7 @@ class VirtualOrderService:
 
         except Exception as e:
             # 如果加载失败，使用默认配置
-            print(f"警告：加载任务内容配置文件失败: {str(e)}")
+            logger.warning("加载任务内容配置文件失败，使用默认配置: %s", e)
             self.task_titles_data = {
                 'avatar_redesign': ["制作专业商务头像设计"],
                 'room_decoration': ["毛坯房现代简约风格设计"],
@@ -813,33 +831,19 @@ class VirtualOrderService:
         Returns:
             Decimal: 返佣比例（如0.6表示60%）
         """
-        # 查询学生信息
-        student = self.db.query(UserInfo).filter(
-            UserInfo.roleId == student_id
-        ).first()
+        return self.rebate_resolver.get_rate(student_id)
 
-        if not student or not student.agentId:
-            return Decimal('0.6')  # 默认返佣比例60%
-
-        # 查询代理信息
-        agent = self.db.query(Agents).filter(
-            Agents.id == student.agentId
-        ).first()
+    def get_student_rebate_rates(self, student_ids: List[int]) -> Dict[int, Decimal]:
+        """
+        批量获取学生的返佣比例（一次关联查询，结果缓存）
 
-        if not agent or not agent.agent_rebate:
-            return Decimal('0.6')  # 默认返佣比例60%
+        Args:
+            student_ids: 学生ID（roleId）列表
 
-        # 处理返佣比例字符串
-        rebate_str = agent.agent_rebate.replace('%', '') if '%' in agent.agent_rebate else agent.agent_rebate
-        try:
-            rebate_value = float(rebate_str)
-            # 如果值大于1，说明是百分比形式（如60），需要除以100
-            if rebate_value > 1:
-                return Decimal(str(rebate_value / 100))
-            else:
-                return Decimal(str(rebate_value))
-        except:
-            return Decimal('0.6')  # 解析失败时使用默认值
+        Returns:
+            Dict[int, Decimal]: {student_id: 返佣比例}
+        """
+        return self.rebate_resolver.get_rates(student_ids)
 
     def generate_virtual_tasks_for_student(self, student_id: int, student_name: str,
                                          subsidy_amount: Decimal, on_demand: bool = False) -> List[Tasks]:
@@ -926,6 +930,7 @@ class VirtualOrderService:
             total_students = 0
             total_subsidy = Decimal('0')
             total_generated_tasks = 0
+            reset_pool_ids = []  # 余额被整体重置或删除的补贴池
 
             for data in student_data:
                 student_name = data['student_name']
@@ -957,6 +962,7 @@ class VirtualOrderService:
                     # 检查是否为0元补贴（用于删除学生）
                     if subsidy_amount == Decimal('0'):
                         # 0元补贴：执行硬删除，彻底清理该学生的补贴池
+                        reset_pool_ids.append(existing_pool.id)
                         self.db.delete(existing_pool)
                         logger.info(f"学生 {student_name} 导入0元补贴，已执行硬删除")
                         pool = None  # 标记为已删除，后续不生成任务
@@ -995,6 +1001,7 @@ class VirtualOrderService:
 
                             self.db.delete(task)
 
+                        reset_pool_ids.append(existing_pool.id)
                         existing_pool.total_subsidy = subsidy_amount  # 使用最新的补贴金额
                         existing_pool.remaining_amount = subsidy_amount  # 重置剩余金额为最新补贴金额
                         existing_pool.allocated_amount = subsidy_amount  # 重置已分配金额为最新补贴金额
@@ -1061,6 +1068,9 @@ class VirtualOrderService:
                     # 0元补贴或无有效补贴池的情况，只统计学生数量
                     total_students += 1
 
+            # 重置会覆盖余额，之前未汇总的补贴流水不再累加（与重置在同一事务中）
+            SubsidyLedgerService(self.db).supersede_pending(reset_pool_ids)
+
             # 提交事务
             self.db.commit()
 
@@ -1143,6 +1153,8 @@ class VirtualOrderService:
 
             # 提交事务
             self.db.commit()
+            if total_imported:
+                self.service_manager._clear_cache()
 
             return {
                 'total_imported': total_imported,
@@ -1168,13 +1180,11 @@ class VirtualOrderService:
             total_subsidy_result = self.db.query(func.sum(VirtualOrderPool.total_subsidy)).filter(VirtualOrderPool.is_deleted == False).scalar()
             total_subsidy = float(total_subsidy_result) if total_subsidy_result else 0.0
 
-            # 统计生成的任务数量
-            total_tasks_generated = self.db.query(Tasks).filter(Tasks.is_virtual.is_(True)).count()
-
-            # 统计完成的任务数量 (status=4表示已完成)
-            total_tasks_completed = self.db.query(Tasks).filter(
-                and_(Tasks.is_virtual.is_(True), Tasks.status == '4')
-            ).count()
+            # 统计生成和完成的任务数量 (status=4表示已完成)
+            # 已关账日期读取每日汇总，只对未关账日期聚合原始任务
+            task_totals = DailyRollupService(self.db).get_task_totals()
+            total_tasks_generated = task_totals['total_tasks']
+            total_tasks_completed = task_totals['completed_tasks']
 
             # 计算完成率
             completion_rate = (total_tasks_completed / total_tasks_generated * 100) if total_tasks_generated > 0 else 0.0
@@ -1212,6 +1222,24 @@ class VirtualOrderService:
             else:
                 target_date_obj = date.today()
 
+            # 已关账的日期直接读取每日汇总
+            closed_day = DailyRollupService(self.db).get_closed_day_totals(
+                target_date_obj, target_date_obj
+            ).get(target_date_obj)
+            if closed_day:
+                daily_tasks_generated = closed_day.total_tasks_generated or 0
+                daily_tasks_completed = closed_day.tasks_completed_on_day or 0
+                return {
+                    'date': target_date_obj.isoformat(),
+                    'daily_tasks_generated': daily_tasks_generated,
+                    'daily_tasks_completed': daily_tasks_completed,
+                    'daily_subsidy': float(closed_day.amount_completed_on_day or 0),
+                    'daily_active_students': closed_day.active_students or 0,
+                    'daily_completion_rate': round(
+                        (daily_tasks_completed / daily_tasks_generated * 100) if daily_tasks_generated > 0 else 0.0, 2
+                    )
+                }
+
             # 计算当天的开始和结束时间
             start_datetime = datetime.combine(target_date_obj, datetime.min.time())
             end_datetime = datetime.combine(target_date_obj, datetime.max.time())
@@ -1299,10 +1327,15 @@ class VirtualOrderService:
             )
 
     def get_student_pools(self, page: int = 1, size: int = 20, status: str = None) -> Dict[str, Any]:
-        """获取学生补贴池列表（包含奖金池信息）"""
+        """
+        获取学生补贴池列表（包含奖金池信息）
+
+        纯读取：已完成金额和实际消耗由任务完成时追加的补贴流水维护，
+        列表通过一次关联查询获取（补贴池 + 未汇总流水 + 昨日达标 + 代理返佣比例）。
+        """
         try:
             from shared.models.student_daily_achievement import StudentDailyAchievement
-            from shared.models.bonus_pool import BonusPool
+            from shared.models.subsidy_ledger import SubsidyLedger
 
             query = self.db.query(VirtualOrderPool).filter(
                 VirtualOrderPool.is_deleted == False
@@ -1315,53 +1348,70 @@ class VirtualOrderService:
             # 总数统计
             total = query.count()
 
-            # 分页查询
-            offset = (page - 1) * size
-            pools = query.offset(offset).limit(size).all()
-
             # 获取昨天的日期（用于判断达标）
             yesterday = date.today() - timedelta(days=1)
 
-            # 转换为字典格式
-            items = []
-            for pool in pools:
-                # 自动同步该学生的已完成任务金额
-                self._sync_student_completed_amount(pool)
+            # 尚未汇总到补贴池的流水增量
+            pending = self.db.query(
+                SubsidyLedger.pool_id.label('pool_id'),
+                func.sum(SubsidyLedger.remaining_delta).label('remaining_delta'),
+                func.sum(SubsidyLedger.completed_delta).label('completed_delta'),
+                func.sum(SubsidyLedger.consumed_delta).label('consumed_delta')
+            ).filter(
+                SubsidyLedger.is_materialized == False
+            ).group_by(SubsidyLedger.pool_id).subquery()
 
-                # 检查学生昨天是否达标
-                yesterday_achievement = self.db.query(StudentDailyAchievement).filter(
-                    StudentDailyAchievement.student_id == pool.student_id,
+            # 分页查询
+            offset = (page - 1) * size
+            rows = query.outerjoin(
+                pending, pending.c.pool_id == VirtualOrderPool.id
+            ).outerjoin(
+                StudentDailyAchievement, and_(
+                    StudentDailyAchievement.student_id == VirtualOrderPool.student_id,
                     StudentDailyAchievement.achievement_date == yesterday,
                     StudentDailyAchievement.is_achieved == True
-                ).first()
+                )
+            ).outerjoin(
+                UserInfo, UserInfo.roleId == VirtualOrderPool.student_id
+            ).outerjoin(
+                Agents, Agents.id == UserInfo.agentId
+            ).with_entities(
+                VirtualOrderPool,
+                pending.c.remaining_delta,
+                pending.c.completed_delta,
+                pending.c.consumed_delta,
+                StudentDailyAchievement.id.label('achievement_id'),
+                Agents.agent_rebate
+            ).order_by(VirtualOrderPool.id).offset(offset).limit(size).all()
 
-                is_qualified = yesterday_achievement is not None
+            # 转换为字典格式
+            items = []
+            for pool, remaining_delta, completed_delta, consumed_delta, achievement_id, agent_rebate in rows:
+                # 实时余额 = 已汇总余额 + 未汇总流水
+                remaining_amount = max(pool.remaining_amount + (remaining_delta or 0), Decimal('0'))
+                completed_amount = (pool.completed_amount or Decimal('0')) + (completed_delta or 0)
+                consumed_subsidy = (pool.consumed_subsidy or Decimal('0')) + (consumed_delta or 0)
+
+                # 检查学生昨天是否达标
+                is_qualified = achievement_id is not None
 
                 # 计算完成率（基于实际获得金额）
                 completion_rate = 0.0
                 if pool.total_subsidy > 0:
-                    completion_rate = float(pool.consumed_subsidy / pool.total_subsidy * 100)
-
-                # 查询学员的代理返佣比例
-                agent_rebate = None
-                user_info = self.db.query(UserInfo).filter(UserInfo.roleId == pool.student_id).first()
-                if user_info and user_info.agentId:
-                    agent = self.db.query(Agents).filter(Agents.id == user_info.agentId).first()
-                    if agent:
-                        agent_rebate = agent.agent_rebate
+                    completion_rate = float(consumed_subsidy / pool.total_subsidy * 100)
 
                 # 计算总消耗补贴金额（常规补贴 + 奖金池补贴）
-                total_consumed_subsidy = float(pool.consumed_subsidy) + float(pool.bonus_pool_consumed_subsidy or 0)
+                total_consumed_subsidy = float(consumed_subsidy) + float(pool.bonus_pool_consumed_subsidy or 0)
 
                 items.append({
                     'id': pool.id,
                     'student_id': pool.student_id,
                     'student_name': pool.student_name,
                     'total_subsidy': float(pool.total_subsidy),  # 每日补贴额度
-                    'remaining_amount': float(pool.remaining_amount),  # 剩余金额（不再包含奖金池）
+                    'remaining_amount': float(remaining_amount),  # 剩余金额（不再包含奖金池）
                     'allocated_amount': float(pool.allocated_amount),
-                    'completed_amount': float(pool.completed_amount),  # 当日已完成
-                    'consumed_subsidy': float(pool.consumed_subsidy),  # 当日实际消耗的补贴金额
+                    'completed_amount': float(completed_amount),  # 当日已完成
+                    'consumed_subsidy': float(consumed_subsidy),  # 当日实际消耗的补贴金额
                     'bonus_pool_consumed_subsidy': float(pool.bonus_pool_consumed_subsidy or 0),  # 奖金池任务实际获得的补贴金额
                     'total_consumed_subsidy': total_consumed_subsidy,  # 总消耗补贴金额
                     'completion_rate': round(completion_rate, 2),  # 完成率
@@ -1387,83 +1437,38 @@ class VirtualOrderService:
                 data=None
             )
 
+    def _get_reallocatable_pool(self, student_id: int):
+        """获取学生补贴池的实时余额（锁定到事务结束），没有补贴池或剩余金额时抛出业务异常"""
+        pool = StudentPoolLedger(self.db).load([student_id]).get(student_id)
 
+        if not pool:
+            raise BusinessException(
+                code=404,
+                message="未找到该学生的补贴池",
+                data=None
+            )
 
-    def _sync_student_completed_amount(self, pool: VirtualOrderPool) -> None:
-        """
-        同步单个学生的当日已完成任务金额
-
-        Args:
-            pool: 学生补贴池对象
-        """
-        try:
-            # 获取今天的日期范围
-            today_start = datetime.combine(date.today(), datetime.min.time())
-            today_end = datetime.combine(date.today(), datetime.max.time())
-
-            # 查询该学生今天已完成的虚拟任务
-            completed_tasks = self.db.query(Tasks).filter(
-                and_(
-                    Tasks.is_virtual.is_(True),
-                    Tasks.target_student_id == pool.student_id,
-                    Tasks.status == '4',  # 已完成状态
-                    Tasks.created_at >= today_start,  # 今天创建的任务
-                    Tasks.created_at <= today_end
-                )
-            ).all()
-
-            # 计算今日实际已完成金额（任务面值）
-            actual_completed_amount = sum(task.commission for task in completed_tasks)
-
-            # 获取学生的返佣比例
-            rebate_rate = self.get_student_rebate_rate(pool.student_id)
-
-            # 计算实际消耗的补贴（面值 × 返佣比例）
-            actual_consumed_subsidy = actual_completed_amount * rebate_rate
-
-            # 更新补贴池
-            if pool.completed_amount != actual_completed_amount or pool.consumed_subsidy != actual_consumed_subsidy:
-                pool.completed_amount = actual_completed_amount
-                pool.consumed_subsidy = actual_consumed_subsidy
-
-                # 重新计算剩余金额（基于实际消耗的补贴）
-                pool.remaining_amount = pool.total_subsidy - pool.consumed_subsidy
-                # 已分配金额始终等于总补贴金额
-                pool.allocated_amount = pool.total_subsidy
-
-                # 确保剩余金额不为负数
-                if pool.remaining_amount < 0:
-                    pool.remaining_amount = Decimal('0')
-
-                pool.updated_at = datetime.now()
-                self.db.commit()
+        if pool.remaining_amount <= 0:
+            raise BusinessException(
+                code=400,
+                message="该学生没有剩余金额可分配",
+                data=None
+            )
+        return pool
 
-        except Exception as e:
-            # 同步失败不影响主流程，只记录错误
-            print(f"同步学生 {pool.student_id} 完成金额失败: {str(e)}")
+    def _touch_pool_allocation(self, pool_id: int) -> None:
+        """只更新补贴池的分配时间（不写余额字段，余额变动通过补贴流水记录）"""
+        now = datetime.now()
+        self.db.query(VirtualOrderPool).filter(VirtualOrderPool.id == pool_id).update({
+            'last_allocation_at': now,
+            'updated_at': now
+        }, synchronize_session=False)
 
     def reallocate_student_tasks(self, student_id: int) -> Dict[str, Any]:
         """重新分配学生任务"""
         try:
-            # 获取学生补贴池
-            pool = self.db.query(VirtualOrderPool).filter(
-                VirtualOrderPool.student_id == student_id,
-                VirtualOrderPool.is_deleted == False
-            ).first()
-
-            if not pool:
-                raise BusinessException(
-                    code=404,
-                    message="未找到该学生的补贴池",
-                    data=None
-                )
-
-            if pool.remaining_amount <= 0:
-                raise BusinessException(
-                    code=400,
-                    message="该学生没有剩余金额可分配",
-                    data=None
-                )
+            # 获取学生补贴池实时余额（含未汇总的补贴流水）
+            pool = self._get_reallocatable_pool(student_id)
 
             # 删除该学生未接取的虚拟任务
             self.db.query(Tasks).filter(
@@ -1483,11 +1488,9 @@ class VirtualOrderService:
             for task in tasks:
                 self.db.add(task)
 
-            # 更新补贴池信息
+            # 更新补贴池信息（只更新分配时间，余额不变）
             # 已分配金额始终等于总补贴金额（不需要更新）
-            # pool.allocated_amount = pool.total_subsidy
-            pool.last_allocation_at = datetime.now()
-            pool.updated_at = datetime.now()
+            self._touch_pool_allocation(pool.pool_id)
 
             self.db.commit()
 
@@ -1543,9 +1546,12 @@ class VirtualOrderService:
             for task in deleted_tasks:
                 self.db.delete(task)
 
-            # 重置补贴池状态
-            original_completed = float(pool.completed_amount)
-            original_consumed = float(pool.consumed_subsidy)
+            # 重置补贴池状态（按实时余额记录重置前的数据，之前未汇总的补贴流水不再累加）
+            ledger_service = SubsidyLedgerService(self.db)
+            balance = ledger_service.get_balances([pool])[pool.id]
+            original_completed = float(balance['completed_amount'])
+            original_consumed = float(balance['consumed_subsidy'])
+            ledger_service.supersede_pending([pool.id])
 
             pool.completed_amount = Decimal('0')  # 清空已完成金额
             pool.consumed_subsidy = Decimal('0')  # 清空消耗补贴
@@ -1624,9 +1630,7 @@ class VirtualOrderService:
                 )
 
             # 对密码进行哈希处理
-            import bcrypt
-            salt = bcrypt.gensalt(rounds=10)
-            hashed_password = bcrypt.hashpw(initial_password.encode('utf-8'), salt).decode('utf-8')
+            hashed_password = PasswordHashService.hash(initial_password)
 
             # 创建用户账号
             user = OriginalUser(
@@ -1653,6 +1657,8 @@ class VirtualOrderService:
 
             # 提交事务
             self.db.commit()
+            # 清除激活客服列表等缓存，新客服立即参与任务分配
+            self.service_manager._clear_cache()
 
             return {
                 'id': virtual_cs.id,
@@ -1843,19 +1849,21 @@ class VirtualOrderService:
             # 总数统计
             total = query.count()
 
-            # 分页查询
+            # 分页查询（关联用户表获取最后登录时间，避免逐条查询）
             offset = (page - 1) * size
-            customer_services = query.offset(offset).limit(size).all()
+            customer_services = query.outerjoin(
+                OriginalUser,
+                and_(
+                    OriginalUser.id == VirtualCustomerService.user_id,
+                    OriginalUser.isDeleted == False
+                )
+            ).with_entities(
+                VirtualCustomerService, OriginalUser.lastLoginTime
+            ).offset(offset).limit(size).all()
 
             # 转换为字典格式
             items = []
-            for cs in customer_services:
-                # 获取关联的用户信息
-                user = self.db.query(OriginalUser).filter(
-                    OriginalUser.id == cs.user_id,
-                    OriginalUser.isDeleted == False
-                ).first()
-
+            for cs, last_login_time in customer_services:
                 items.append({
                     'id': cs.id,
                     'user_id': cs.user_id,
@@ -1863,7 +1871,7 @@ class VirtualOrderService:
                     'account': cs.account,
                     'level': cs.level,
                     'status': cs.status,
-                    'last_login_time': user.lastLoginTime if user else None,
+                    'last_login_time': last_login_time,
                     'created_at': cs.created_at
                 })
 
@@ -1913,11 +1921,8 @@ class VirtualOrderService:
                 new_password = update_data['new_password'].strip()
                 if new_password:  # 确保密码不为空
                     from shared.models.original_user import OriginalUser
-                    import bcrypt
-
                     # 加密新密码
-                    salt = bcrypt.gensalt(rounds=10)
-                    hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), salt).decode('utf-8')
+                    hashed_password = PasswordHashService.hash(new_password)
 
                     # 更新虚拟客服表的密码
                     cs.initial_password = hashed_password
@@ -1940,6 +1945,10 @@ class VirtualOrderService:
 
             if updated_fields:
                 self.db.commit()
+                # 清除激活客服列表等缓存，停用的客服不再分配任务
+                self.service_manager._clear_cache()
+                if 'password' in updated_fields:
+                    UserPrincipalCache.invalidate(cs.user_id)
 
             return {
                 'id': cs.id,
@@ -1992,6 +2001,9 @@ class VirtualOrderService:
                 user.isDeleted = True
 
             self.db.commit()
+            UserPrincipalCache.invalidate(cs.user_id)
+            # 清除激活客服列表等缓存，已删除的客服不再分配任务
+            self.service_manager._clear_cache()
 
             return {
                 'id': cs.id,
@@ -2084,196 +2096,162 @@ class VirtualOrderService:
                 data=None
             )
 
+    # 学生收入导出列：(列名, 列宽)
+    STUDENT_INCOME_EXPORT_COLUMNS = [
+        ('学生ID', 10),
+        ('学生姓名', 15),
+        ('手机号', 15),
+        ('总任务数', 12),
+        ('总收入金额', 15),
+        ('已完成任务数', 15),
+        ('已完成收入', 15),
+        ('完成率', 10),
+        ('导出时间', 20),
+        ('补贴金额', 15),  # 这一列供用户填写补贴金额
+    ]
+
+    STUDENT_INCOME_EXPORT_INSTRUCTIONS = [
+        ['说明', ''],
+        ['1. 学生收入统计', '显示学生的任务完成情况和收入统计'],
+        ['2. 补贴金额列', '请在此列填写要给学生的补贴金额'],
+        ['3. 导入流程', '填写补贴金额后，将此文件导入到虚拟订单系统'],
+        ['4. 注意事项', '补贴金额必须为正数，系统会自动生成5的倍数任务'],
+        ['', ''],
+        ['字段说明', ''],
+        ['学生ID', '系统内部学生唯一标识'],
+        ['学生姓名', '学生真实姓名'],
+        ['手机号', '学生联系电话'],
+        ['总任务数', '学生接取的所有任务数量'],
+        ['总收入金额', '学生所有任务的总金额'],
+        ['已完成任务数', '学生已完成的任务数量'],
+        ['已完成收入', '学生已完成任务的收入金额'],
+        ['完成率', '任务完成率百分比'],
+        ['导出时间', '数据导出的时间'],
+        ['补贴金额', '要给学生的补贴金额（请填写）']
+    ]
+
     def export_student_income_data(self, start_date: str = None, end_date: str = None,
-                                 student_ids: List[int] = None) -> bytes:
+                                 student_ids: List[int] = None, file_format: str = 'xlsx') -> Iterator[bytes]:
         """
-        导出学生收入数据为Excel
+        流式导出学生收入数据
+
+        Excel 以只写模式写入临时文件后按块返回；CSV 边查询边输出。
 
         Args:
             start_date: 开始日期 (YYYY-MM-DD)
             end_date: 结束日期 (YYYY-MM-DD)
             student_ids: 指定学生ID列表
+            file_format: 导出格式，xlsx 或 csv
 
         Returns:
-            bytes: Excel文件内容
+            Iterator[bytes]: 文件内容分块
         """
-        try:
-            from sqlalchemy import and_, func
-            from sqlalchemy.sql import case
-            from shared.models.tasks import Tasks
-            from shared.models.userinfo import UserInfo
-            from shared.models.original_user import OriginalUser
-            import pandas as pd
-            import io
+        if file_format not in EXPORT_FORMATS:
+            raise BusinessException(code=400, message=f"不支持的导出格式: {file_format}", data=None)
 
-            # 查询所有学生
-            students_query = self.db.query(UserInfo).filter(
-                UserInfo.level == '3',  # 学员级别
-                UserInfo.isDeleted == False
-            )
+        headers = [name for name, _ in self.STUDENT_INCOME_EXPORT_COLUMNS]
+        rows = self.iter_student_income_rows(start_date, end_date, student_ids)
 
-            # 添加学生ID过滤
-            if student_ids:
-                students_query = students_query.filter(UserInfo.roleId.in_(student_ids))
-
-            students = students_query.all()
-
-            # 创建结果列表
-            results = []
-            for student in students:
-                # 查询该学生的任务统计（只查询真实任务，不包括虚拟任务）
-                task_conditions = [
-                    Tasks.is_virtual.is_(False),  # 只查询真实任务
-                    Tasks.accepted_by.like(f'%{student.roleId}%')  # 该学生接取的任务
-                ]
-
-                # 添加日期过滤
-                if start_date:
-                    start_datetime = datetime.strptime(start_date, '%Y-%m-%d')
-                    task_conditions.append(Tasks.created_at >= start_datetime)
-                if end_date:
-                    end_datetime = datetime.strptime(end_date, '%Y-%m-%d')
-                    task_conditions.append(Tasks.created_at <= end_datetime)
-
-                # 统计该学生的任务数据
-                task_stats = self.db.query(
-                    func.count(Tasks.id).label('total_tasks'),
-                    func.sum(Tasks.commission).label('total_income'),
-                    func.count(
-                        case((Tasks.status == '已完成', 1))
-                    ).label('completed_tasks'),
-                    func.sum(
-                        case((Tasks.status == '已完成', Tasks.commission), else_=0)
-                    ).label('completed_income')
-                ).filter(and_(*task_conditions)).first()
-
-                # 为每个学生创建一个记录
-                class StudentResult:
-                    def __init__(self, student_id, student_name, phone_number, id_card,
-                               total_tasks, total_income, completed_tasks, completed_income):
-                        self.student_id = student_id
-                        self.student_name = student_name
-                        self.phone_number = phone_number
-                        self.id_card = id_card
-                        self.total_tasks = total_tasks
-                        self.total_income = total_income
-                        self.completed_tasks = completed_tasks
-                        self.completed_income = completed_income
-
-                result = StudentResult(
-                    student_id=student.roleId,
-                    student_name=student.name or '',
-                    phone_number=student.phone_number or '',
-                    id_card='',  # 不显示身份证
-                    total_tasks=task_stats.total_tasks or 0,
-                    total_income=float(task_stats.total_income or 0),
-                    completed_tasks=task_stats.completed_tasks or 0,
-                    completed_income=float(task_stats.completed_income or 0)
-                )
-                results.append(result)
-
-            # 转换为DataFrame
-            data = []
-            for row in results:
-                data.append({
-                    '学生ID': row.student_id,
-                    '学生姓名': row.student_name or '',
-                    '手机号': row.phone_number or '',
-                    '总任务数': row.total_tasks or 0,
-                    '总收入金额': float(row.total_income or 0),
-                    '已完成任务数': row.completed_tasks or 0,
-                    '已完成收入': float(row.completed_income or 0),
-                    '完成率': round((row.completed_tasks or 0) / max(row.total_tasks or 1, 1) * 100, 2),
-                    '导出时间': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    '补贴金额': 0  # 这一列供用户填写补贴金额
-                })
-
-            if not data:
-                # 如果没有数据，创建一个示例行
-                data.append({
-                    '学生ID': '',
-                    '学生姓名': '示例学生',
-                    '手机号': '',
-                    '总任务数': 0,
-                    '总收入金额': 0.0,
-                    '已完成任务数': 0,
-                    '已完成收入': 0.0,
-                    '完成率': 0.0,
-                    '导出时间': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    '补贴金额': 200.0  # 示例补贴金额
-                })
-
-            df = pd.DataFrame(data)
-
-            # 创建Excel文件
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                # 写入学生收入数据
-                df.to_excel(writer, sheet_name='学生收入统计', index=False)
-
-                # 获取工作表对象进行格式化
-                worksheet = writer.sheets['学生收入统计']
-
-                # 设置列宽
-                column_widths = {
-                    'A': 10,  # 学生ID
-                    'B': 15,  # 学生姓名
-                    'C': 15,  # 手机号
-                    'D': 20,  # 身份证号
-                    'E': 12,  # 总任务数
-                    'F': 15,  # 总收入金额
-                    'G': 15,  # 已完成任务数
-                    'H': 15,  # 已完成收入
-                    'I': 10,  # 完成率
-                    'J': 20,  # 导出时间
-                    'K': 15,  # 补贴金额
-                }
-
-                for col, width in column_widths.items():
-                    worksheet.column_dimensions[col].width = width
-
-                # 添加说明工作表
-                instructions = pd.DataFrame([
-                    ['说明', ''],
-                    ['1. 学生收入统计', '显示学生的任务完成情况和收入统计'],
-                    ['2. 补贴金额列', '请在此列填写要给学生的补贴金额'],
-                    ['3. 导入流程', '填写补贴金额后，将此文件导入到虚拟订单系统'],
-                    ['4. 注意事项', '补贴金额必须为正数，系统会自动生成5的倍数任务'],
-                    ['', ''],
-                    ['字段说明', ''],
-                    ['学生ID', '系统内部学生唯一标识'],
-                    ['学生姓名', '学生真实姓名'],
-                    ['手机号', '学生联系电话'],
-                    ['身份证号', '学生身份证号码'],
-                    ['总任务数', '学生接取的所有任务数量'],
-                    ['总收入金额', '学生所有任务的总金额'],
-                    ['已完成任务数', '学生已完成的任务数量'],
-                    ['已完成收入', '学生已完成任务的收入金额'],
-                    ['完成率', '任务完成率百分比'],
-                    ['导出时间', '数据导出的时间'],
-                    ['补贴金额', '要给学生的补贴金额（请填写）']
-                ], columns=['项目', '说明'])
-
-                instructions.to_excel(writer, sheet_name='使用说明', index=False)
-
-                # 设置说明工作表的列宽
-                instructions_sheet = writer.sheets['使用说明']
-                instructions_sheet.column_dimensions['A'].width = 20
-                instructions_sheet.column_dimensions['B'].width = 50
-
-            output.seek(0)
-            return output.getvalue()
+        if file_format == 'csv':
+            return StreamingExporter.stream_csv(headers, rows)
 
+        try:
+            return StreamingExporter.stream_xlsx([
+                ExportSheet(
+                    title='学生收入统计',
+                    headers=headers,
+                    rows=rows,
+                    column_widths=[width for _, width in self.STUDENT_INCOME_EXPORT_COLUMNS]
+                ),
+                ExportSheet(
+                    title='使用说明',
+                    headers=['项目', '说明'],
+                    rows=self.STUDENT_INCOME_EXPORT_INSTRUCTIONS,
+                    column_widths=[20, 50]
+                )
+            ])
         except Exception as e:
-            import traceback
-            error_details = traceback.format_exc()
-            print(f"导出学生收入数据失败的详细错误: {error_details}")
+            logger.error(f"导出学生收入数据失败: {e}", exc_info=True)
             raise BusinessException(
                 code=500,
                 message=f"导出学生收入数据失败: {str(e)}",
                 data=None
             )
 
+    def iter_student_income_rows(self, start_date: str = None, end_date: str = None,
+                                 student_ids: List[int] = None, batch_size: int = 1000) -> Iterator[List[Any]]:
+        """
+        逐行生成学生收入导出数据
+
+        通过任务接取人映射表一次分组统计所有学生的真实任务，再与学生表关联，
+        整个导出只执行一条查询，按批流式读取。
+
+        Yields:
+            List[Any]: 与 STUDENT_INCOME_EXPORT_COLUMNS 对应的一行数据
+        """
+        export_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        # 真实任务按接取人分组统计
+        task_conditions = [Tasks.is_virtual.is_(False)]  # 只查询真实任务
+        if start_date:
+            task_conditions.append(Tasks.created_at >= datetime.strptime(start_date, '%Y-%m-%d'))
+        if end_date:
+            task_conditions.append(Tasks.created_at <= datetime.strptime(end_date, '%Y-%m-%d'))
+
+        task_stats = self.db.query(
+            TaskAcceptedStudent.student_id.label('student_id'),
+            func.count(Tasks.id).label('total_tasks'),
+            func.sum(Tasks.commission).label('total_income'),
+            func.count(case((Tasks.status == '已完成', 1))).label('completed_tasks'),
+            func.sum(case((Tasks.status == '已完成', Tasks.commission), else_=0)).label('completed_income')
+        ).join(
+            Tasks, Tasks.id == TaskAcceptedStudent.task_id
+        ).filter(
+            *task_conditions
+        ).group_by(TaskAcceptedStudent.student_id).subquery()
+
+        # 学生（学员级别）关联任务统计
+        query = self.db.query(
+            UserInfo.roleId,
+            UserInfo.name,
+            UserInfo.phone_number,
+            task_stats.c.total_tasks,
+            task_stats.c.total_income,
+            task_stats.c.completed_tasks,
+            task_stats.c.completed_income
+        ).outerjoin(
+            task_stats, task_stats.c.student_id == UserInfo.roleId
+        ).filter(
+            UserInfo.level == '3',  # 学员级别
+            UserInfo.isDeleted == False
+        )
+
+        # 添加学生ID过滤
+        if student_ids:
+            query = query.filter(UserInfo.roleId.in_(student_ids))
+
+        count = 0
+        for row in query.order_by(UserInfo.roleId).yield_per(batch_size):
+            total_tasks = row.total_tasks or 0
+            completed_tasks = row.completed_tasks or 0
+            count += 1
+            yield [
+                row.roleId,
+                row.name or '',
+                row.phone_number or '',
+                total_tasks,
+                float(row.total_income or 0),
+                completed_tasks,
+                float(row.completed_income or 0),
+                round(completed_tasks / max(total_tasks or 1, 1) * 100, 2),
+                export_time,
+                0
+            ]
+
+        if count == 0:
+            # 如果没有数据，输出一个示例行
+            yield ['', '示例学生', '', 0, 0.0, 0, 0.0, 0.0, export_time, 200.0]
+
     def get_student_income_summary(self, start_date: str = None, end_date: str = None) -> Dict[str, Any]:
         """
         获取学生收入汇总统计
@@ -2286,9 +2264,7 @@ class VirtualOrderService:
             Dict: 汇总统计数据
         """
         try:
-            from sqlalchemy import and_, func
-            from sqlalchemy.sql import case
-            from shared.models.tasks import Tasks
+            from sqlalchemy import func
             from shared.models.userinfo import UserInfo
             from shared.models.virtual_order_pool import VirtualOrderPool
 
@@ -2306,21 +2282,8 @@ class VirtualOrderService:
                 func.sum(VirtualOrderPool.completed_amount).label('total_completed')
             ).filter(VirtualOrderPool.is_deleted == False).first()
 
-            # 任务统计查询 (status=4表示已完成)
-            task_query = self.db.query(
-                func.count(Tasks.id).label('total_tasks'),
-                func.count(
-                    case((Tasks.status == '4', 1))
-                ).label('completed_tasks')
-            ).filter(Tasks.is_virtual.is_(True))  # 只统计虚拟任务
-
-            # 添加日期过滤
-            if start_date:
-                task_query = task_query.filter(Tasks.created_at >= start_date)
-            if end_date:
-                task_query = task_query.filter(Tasks.created_at <= end_date)
-
-            task_stats = task_query.first()
+            # 虚拟任务统计 (status=4表示已完成)，已关账日期读取每日汇总
+            task_stats = DailyRollupService(self.db).get_task_totals(start_date or None, end_date or None)
 
             # 使用补贴池的数据作为总金额和已完成金额
             total_amount = float(pool_stats.total_subsidy or 0)
@@ -2328,12 +2291,12 @@ class VirtualOrderService:
 
             return {
                 'total_students': total_students,
-                'total_tasks': task_stats.total_tasks or 0,
+                'total_tasks': task_stats['total_tasks'],
                 'total_amount': total_amount,  # 使用补贴池的总补贴金额
-                'completed_tasks': task_stats.completed_tasks or 0,
+                'completed_tasks': task_stats['completed_tasks'],
                 'completed_amount': completed_amount,  # 使用补贴池的已完成金额
                 'completion_rate': round(
-                    (task_stats.completed_tasks or 0) / max(task_stats.total_tasks or 1, 1) * 100, 2
+                    task_stats['completed_tasks'] / max(task_stats['total_tasks'], 1) * 100, 2
                 ),
                 'export_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
@@ -2452,11 +2415,9 @@ class VirtualOrderService:
             task.value_recycled = True  # 立即标记为已回收，避免价值回收任务重复处理
             task.updated_at = datetime.now()
 
-            # 查找对应的学生补贴池
-            pool = self.db.query(VirtualOrderPool).filter(
-                VirtualOrderPool.student_id == task.target_student_id,
-                VirtualOrderPool.is_deleted == False
-            ).first()
+            # 查找对应的学生补贴池（补贴池变动以补贴流水追加，不直接更新补贴池行）
+            ledger = StudentPoolLedger(self.db).load([task.target_student_id])
+            pool = ledger.get(task.target_student_id)
 
             if not pool:
                 raise BusinessException(
@@ -2468,29 +2429,17 @@ class VirtualOrderService:
             # 获取学生的返佣比例
             rebate_rate = self.get_student_rebate_rate(task.target_student_id)
 
-            # 更新补贴池的完成金额（任务面值）
-            pool.completed_amount += task.commission
-
-            # 更新实际消耗的补贴（面值 × 返佣比例）
-            consumed_subsidy_for_this_task = task.commission * rebate_rate
-            pool.consumed_subsidy += consumed_subsidy_for_this_task
-
-            # 更新剩余金额：总补贴 - 实际消耗的补贴
-            pool.remaining_amount = pool.total_subsidy - pool.consumed_subsidy
-
-            # 已分配金额始终等于总补贴金额
-            pool.allocated_amount = pool.total_subsidy
-
-            # 确保剩余金额不为负数
-            if pool.remaining_amount < 0:
-                pool.remaining_amount = Decimal('0')
-
-            pool.updated_at = datetime.now()
-
             # 计算剩余任务价值并重新生成任务
-            student_actual_income = task.commission * rebate_rate  # 学生实际收入
+            student_actual_income = task.commission * rebate_rate  # 学生实际收入（实际消耗的补贴）
             remaining_task_value = task.commission - student_actual_income  # 剩余价值
 
+            # 更新完成金额（任务面值）和实际消耗的补贴（面值 × 返佣比例），
+            # 剩余金额：总补贴 - 实际消耗的补贴（账本保证不为负数）
+            ledger.record_completion(
+                task.target_student_id, task.commission, student_actual_income,
+                task_id=task.id, return_value=False
+            )
+
             logger.info(f"任务完成分析: 任务面值={task.commission}, 返佣比例={rebate_rate}, "
                        f"学生收入={student_actual_income}, 剩余价值={remaining_task_value}")
 
@@ -2505,14 +2454,14 @@ class VirtualOrderService:
                 logger.info(f"跨天任务完成: task_id={task.id}, 创建日期={task_date}, 当前日期={today}, 只确认完成不生成新任务")
             elif remaining_task_value > Decimal('0'):
                 # 当天任务且有剩余价值：检查补贴上限后决定是否生成任务
-                pool.remaining_amount += remaining_task_value
+                ledger.credit(task.target_student_id, remaining_task_value, task_id=task.id)
                 logger.info(f"剩余价值 {remaining_task_value} 已加回补贴池，当前剩余: {pool.remaining_amount}")
 
                 # 关键修复：检查学生是否已达到补贴上限
-                if pool.consumed_subsidy >= pool.total_subsidy:
+                if pool.reached_limit:
                     logger.info(f"学生 {pool.student_name} 已达到补贴上限: 上限={pool.total_subsidy}元, 已获得={pool.consumed_subsidy}元, 停止生成新任务")
                     # 重置剩余金额为0，防止后续生成
-                    pool.remaining_amount = Decimal('0')
+                    ledger.exhaust(task.target_student_id)
                 elif pool.remaining_amount > Decimal('0'):
                     try:
                         # 使用补贴池剩余金额生成任务，而不是直接使用剩余价值
@@ -2535,9 +2484,7 @@ class VirtualOrderService:
                                            f"分配给客服: {allocated_task['founder']}")
 
                             # 更新补贴池剩余金额：扣减已生成的任务金额
-                            pool.remaining_amount -= generated_amount
-                            if pool.remaining_amount < 0:
-                                pool.remaining_amount = Decimal('0')
+                            ledger.deduct(task.target_student_id, generated_amount)
                             logger.info(f"已生成任务总金额: {generated_amount}, 补贴池剩余: {pool.remaining_amount}")
                         else:
                             logger.warning(f"使用虚拟客服分配策略重新生成任务失败: {allocation_result.error_message}")
@@ -2545,6 +2492,7 @@ class VirtualOrderService:
                     except Exception as e:
                         logger.error(f"重新生成任务失败: {str(e)})")
 
+            ledger.flush()
             self.db.commit()
 
             return {
@@ -2556,7 +2504,7 @@ class VirtualOrderService:
                 'remaining_task_value': float(remaining_task_value),
                 'generated_tasks': generated_tasks_info,
                 'total_completed_amount': float(pool.completed_amount),
-                'updated_at': pool.updated_at
+                'updated_at': datetime.now()
             }
 
         except Exception as e:
@@ -2567,83 +2515,138 @@ class VirtualOrderService:
                 data=None
             )
 
-    def sync_completed_virtual_tasks(self) -> Dict[str, Any]:
+    # 已完成虚拟任务同步的高水位（保存在 system_config 中）
+    COMPLETED_SYNC_WATERMARK_KEY = 'virtual_task_completed_sync_watermark'
+    # 增量同步向前回看的时间，覆盖较晚提交但 updated_at 较早的任务（按学生重算，重复处理没有副作用）
+    COMPLETED_SYNC_OVERLAP = timedelta(minutes=5)
+
+    def sync_completed_virtual_tasks(self, full_rebuild: bool = False) -> Dict[str, Any]:
         """
-        同步所有已完成的虚拟任务到学生补贴池
+        同步已完成的虚拟任务到学生补贴池
         用于修复历史数据或手动同步
 
+        默认增量同步：只扫描高水位之后有变动的虚拟任务，对涉及的学生按任务记录
+        重算已完成金额，并以补贴流水记录差值。没有高水位时自动全量重建。
+
+        Args:
+            full_rebuild: 是否全量重建所有有已完成任务的学生补贴池
+
         Returns:
             Dict: 同步结果统计
         """
         try:
-            # 查找所有已完成但未同步的虚拟任务
-            completed_tasks = self.db.query(Tasks).filter(
-                and_(
-                    Tasks.is_virtual.is_(True),
-                    Tasks.status == '4',
-                    Tasks.target_student_id.isnot(None)
-                )
-            ).all()
-
-            if not completed_tasks:
-                return {
-                    'synced_tasks': 0,
-                    'affected_students': 0,
-                    'total_amount': 0.0,
-                    'message': '没有需要同步的已完成虚拟任务'
-                }
+            watermark_config = self.db.query(SystemConfig).filter(
+                SystemConfig.config_key == self.COMPLETED_SYNC_WATERMARK_KEY
+            ).with_for_update().first()
+            watermark = self._parse_sync_watermark(watermark_config)
+            if watermark is None:
+                full_rebuild = True
 
-            # 按学生分组统计
-            student_tasks = {}
-            for task in completed_tasks:
-                student_id = task.target_student_id
-                if student_id not in student_tasks:
-                    student_tasks[student_id] = []
-                student_tasks[student_id].append(task)
+            base_conditions = [
+                Tasks.is_virtual.is_(True),
+                Tasks.target_student_id.isnot(None)
+            ]
 
-            synced_count = 0
-            total_amount = Decimal('0')
-            affected_students = 0
+            if full_rebuild:
+                student_ids = None
+                latest = self.db.query(
+                    func.max(Tasks.updated_at), func.max(Tasks.id)
+                ).filter(*base_conditions).first()
+            else:
+                # 高水位之后有变动的虚拟任务涉及的学生（包括状态被改离已完成的任务）
+                changed_since = watermark['updated_at'] - self.COMPLETED_SYNC_OVERLAP
+                changed = self.db.query(
+                    Tasks.target_student_id,
+                    func.max(Tasks.updated_at),
+                    func.max(Tasks.id)
+                ).filter(
+                    *base_conditions,
+                    Tasks.updated_at >= changed_since
+                ).group_by(Tasks.target_student_id).all()
+
+                student_ids = [row[0] for row in changed]
+                latest = (
+                    max((row[1] for row in changed), default=None),
+                    max((row[2] for row in changed), default=None)
+                )
 
-            for student_id, tasks in student_tasks.items():
-                # 获取学生补贴池
-                pool = self.db.query(VirtualOrderPool).filter(
-                    VirtualOrderPool.student_id == student_id,
-                    VirtualOrderPool.is_deleted == False
-                ).first()
+                if not student_ids:
+                    self.db.rollback()  # 释放高水位行锁
+                    return {
+                        'mode': 'incremental',
+                        'synced_tasks': 0,
+                        'affected_students': 0,
+                        'total_amount': 0.0,
+                        'message': '没有需要同步的已完成虚拟任务'
+                    }
 
-                if not pool:
-                    continue
+            # 按学生分组统计已完成任务金额
+            completed_query = self.db.query(
+                Tasks.target_student_id,
+                func.count(Tasks.id),
+                func.sum(Tasks.commission)
+            ).filter(
+                *base_conditions,
+                Tasks.status == '4'
+            )
+            if student_ids is not None:
+                completed_query = completed_query.filter(Tasks.target_student_id.in_(student_ids))
+            completed = {
+                student_id: (task_count, amount or Decimal('0'))
+                for student_id, task_count, amount in completed_query.group_by(Tasks.target_student_id).all()
+            }
 
-                # 计算该学生已完成任务的总金额
-                student_completed_amount = sum(task.commission for task in tasks)
+            if full_rebuild:
+                # 与原全量同步一致：只处理有已完成任务的学生
+                student_ids = list(completed)
 
-                # 重置并更新完成金额（避免重复计算）
-                pool.completed_amount = student_completed_amount
+            ledger = StudentPoolLedger(self.db).load(student_ids)
 
-                # 更新剩余金额：总补贴 - 已完成金额
-                pool.remaining_amount = pool.total_subsidy - pool.completed_amount
+            synced_count = 0
+            total_amount = Decimal('0')
+            affected_pool_ids = []
 
-                # 已分配金额始终等于总补贴金额
-                pool.allocated_amount = pool.total_subsidy
+            for student_id in student_ids:
+                state = ledger.get(student_id)
+                if not state:
+                    continue
 
-                # 确保剩余金额不为负数
-                if pool.remaining_amount < 0:
-                    pool.remaining_amount = Decimal('0')
+                task_count, student_completed_amount = completed.get(student_id, (0, Decimal('0')))
 
-                pool.updated_at = datetime.now()
+                # 重置完成金额（避免重复计算），剩余金额 = 总补贴 - 已完成金额，不为负数
+                ledger.correct(
+                    student_id, "同步已完成虚拟任务",
+                    completed_amount=student_completed_amount,
+                    remaining_amount=max(state.total_subsidy - student_completed_amount, Decimal('0'))
+                )
 
-                synced_count += len(tasks)
+                synced_count += task_count
                 total_amount += student_completed_amount
-                affected_students += 1
+                affected_pool_ids.append(state.pool_id)
 
+            # 已分配金额始终等于总补贴金额
+            if affected_pool_ids:
+                self.db.query(VirtualOrderPool).filter(
+                    VirtualOrderPool.id.in_(affected_pool_ids)
+                ).update(
+                    {VirtualOrderPool.allocated_amount: VirtualOrderPool.total_subsidy},
+                    synchronize_session=False
+                )
+
+            ledger.flush()
+            if latest[0] is not None:
+                self._save_sync_watermark(watermark_config, latest[0], latest[1])
             self.db.commit()
 
+            mode = 'full' if full_rebuild else 'incremental'
+            logger.info(f"同步已完成虚拟任务({mode}): {synced_count} 个任务，{len(affected_pool_ids)} 个学生，高水位 {latest[0]}")
+
             return {
+                'mode': mode,
                 'synced_tasks': synced_count,
-                'affected_students': affected_students,
+                'affected_students': len(affected_pool_ids),
                 'total_amount': float(total_amount),
-                'message': f'成功同步 {synced_count} 个已完成任务，影响 {affected_students} 个学生'
+                'message': f'成功同步 {synced_count} 个已完成任务，影响 {len(affected_pool_ids)} 个学生'
             }
 
         except Exception as e:
@@ -2654,6 +2657,35 @@ class VirtualOrderService:
                 data=None
             )
 
+    @staticmethod
+    def _parse_sync_watermark(config: Optional[SystemConfig]) -> Optional[Dict[str, Any]]:
+        """解析同步高水位，不存在或格式错误时返回None"""
+        if not config:
+            return None
+        try:
+            value = json.loads(config.config_value)
+            return {
+                'updated_at': datetime.fromisoformat(value['updated_at']),
+                'task_id': value.get('task_id')
+            }
+        except (TypeError, ValueError, KeyError):
+            logger.warning(f"已完成虚拟任务同步高水位格式错误: {config.config_value}")
+            return None
+
+    def _save_sync_watermark(self, config: Optional[SystemConfig], updated_at: datetime,
+                             task_id: Optional[int]) -> None:
+        """保存同步高水位（不提交事务）"""
+        value = json.dumps({'updated_at': updated_at.isoformat(), 'task_id': task_id})
+        if config:
+            config.config_value = value
+            return
+        self.db.add(SystemConfig(
+            config_key=self.COMPLETED_SYNC_WATERMARK_KEY,
+            config_value=value,
+            config_type='json',
+            description='已完成虚拟任务同步到补贴池的高水位（最后处理的updated_at/任务ID）'
+        ))
+
     def _get_reference_image_for_task(self, task_content: Dict[str, str]) -> Optional[str]:
         """
         根据任务内容获取合适的参考图片（优化版本，包含可用性检查）
@@ -2943,6 +2975,44 @@ class VirtualOrderService:
                 'total_amount': 0.0
             }
 
+    def generate_virtual_tasks_bulk_with_service_allocation(self,
+                                                          allocation_requests: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+        """
+        使用虚拟客服分配策略为多个学生批量生成虚拟任务（一次分配调用）
+
+        Args:
+            allocation_requests: 分配请求列表
+                [{'student_id': int, 'student_name': str, 'total_amount': Decimal, 'on_demand': bool}, ...]
+
+        Returns:
+            Dict[int, Dict]: {student_id: 生成结果}，结果格式与
+            generate_virtual_tasks_with_service_allocation 一致
+        """
+        allocation_results = self.allocator.allocate_tasks_bulk(allocation_requests, order_service=self)
+
+        results = {}
+        for request in allocation_requests:
+            student_id = request['student_id']
+            allocation_result = allocation_results.get(student_id)
+
+            if allocation_result and allocation_result.success:
+                results[student_id] = {
+                    'success': True,
+                    'message': f"成功为学生 {request['student_name']} 分配 {len(allocation_result.allocated_tasks)} 个任务",
+                    'tasks': allocation_result.allocated_tasks,
+                    'total_amount': float(allocation_result.total_amount),
+                    'subsidy_amount': float(request['total_amount'])
+                }
+            else:
+                results[student_id] = {
+                    'success': False,
+                    'message': (allocation_result.error_message if allocation_result else None) or '任务分配失败',
+                    'tasks': [],
+                    'total_amount': 0.0
+                }
+
+        return results
+
     def import_student_subsidy_data_with_service_allocation(self,
                                                           student_data: List[Dict],
                                                           import_batch: str,
@@ -2965,6 +3035,7 @@ class VirtualOrderService:
             total_subsidy = Decimal('0')
             total_generated_tasks = 0
             allocation_requests = []  # 用于批量分配
+            reset_pool_ids = []  # 余额被整体重置或删除的补贴池
 
             # 第一阶段：更新补贴池数据
             for data in student_data:
@@ -2994,6 +3065,7 @@ class VirtualOrderService:
                     # 检查是否为0元补贴（用于删除学生）
                     if subsidy_amount == Decimal('0'):
                         # 0元补贴：执行硬删除，彻底清理该学生的补贴池
+                        reset_pool_ids.append(existing_pool.id)
                         self.db.delete(existing_pool)
                         logger.info(f"学生 {student_name} 导入0元补贴，已执行硬删除")
                         should_generate_tasks = False
@@ -3030,6 +3102,7 @@ class VirtualOrderService:
 
                             self.db.delete(task)
 
+                        reset_pool_ids.append(existing_pool.id)
                         existing_pool.total_subsidy = subsidy_amount  # 使用最新的补贴金额
                         existing_pool.remaining_amount = subsidy_amount  # 重置剩余金额为最新补贴金额
                         existing_pool.allocated_amount = subsidy_amount  # 重置已分配金额为最新补贴金额
@@ -3079,11 +3152,17 @@ class VirtualOrderService:
                 if subsidy_amount > Decimal('0'):
                     total_subsidy += subsidy_amount
 
+            # 重置会覆盖余额，之前未汇总的补贴流水不再累加（与重置在同一事务中）
+            SubsidyLedgerService(self.db).supersede_pending(reset_pool_ids)
+
             # 提交补贴池更新
             self.db.commit()
 
             # 第二阶段：生成任务（根据配置决定是否生成）
             if generate_tasks and allocation_requests:
+                # 补贴池已提交，生成任务后的扣减通过账本以补贴流水记录
+                ledger = StudentPoolLedger(self.db).load(request['student_id'] for request in allocation_requests)
+
                 if use_service_allocation:
                     # 使用批量分配
                     results = self.allocator.batch_allocate_tasks(allocation_requests)
@@ -3097,15 +3176,11 @@ class VirtualOrderService:
                             request = allocation_requests[i]
                             if request.get('on_demand', False) and result.allocated_tasks:
                                 generated_amount = sum(Decimal(str(task['amount'])) for task in result.allocated_tasks)
-                                pool = self.db.query(VirtualOrderPool).filter(
-                                    VirtualOrderPool.student_id == request['student_id'],
-                                    VirtualOrderPool.is_deleted == False
-                                ).first()
-                                if pool:
-                                    pool.remaining_amount = request['total_amount'] - generated_amount
-                                    pool.updated_at = datetime.now()
+                                if ledger.get(request['student_id']):
+                                    ledger.deduct(request['student_id'], generated_amount)
 
                     # 提交任务创建
+                    ledger.flush()
                     self.db.commit()
                 else:
                     # 使用原有方式生成任务
@@ -3122,15 +3197,9 @@ class VirtualOrderService:
                             )
 
                             # 更新补贴池剩余金额
-                            if tasks:
+                            if tasks and ledger.get(request['student_id']):
                                 generated_amount = sum(task.commission for task in tasks)
-                                pool = self.db.query(VirtualOrderPool).filter(
-                                    VirtualOrderPool.student_id == request['student_id'],
-                                    VirtualOrderPool.is_deleted == False
-                                ).first()
-                                if pool:
-                                    pool.remaining_amount = request['total_amount'] - generated_amount
-                                    pool.updated_at = datetime.now()
+                                ledger.deduct(request['student_id'], generated_amount)
                         else:
                             # 传统全量生成
                             tasks = self.generate_virtual_tasks_for_student(
@@ -3145,6 +3214,7 @@ class VirtualOrderService:
                         total_generated_tasks += len(tasks)
 
                     # 提交任务创建
+                    ledger.flush()
                     self.db.commit()
 
             return {
@@ -3167,25 +3237,8 @@ class VirtualOrderService:
     def reallocate_student_tasks_with_service_allocation(self, student_id: int) -> Dict[str, Any]:
         """使用虚拟客服分配策略重新分配学生任务"""
         try:
-            # 获取学生补贴池
-            pool = self.db.query(VirtualOrderPool).filter(
-                VirtualOrderPool.student_id == student_id,
-                VirtualOrderPool.is_deleted == False
-            ).first()
-
-            if not pool:
-                raise BusinessException(
-                    code=404,
-                    message="未找到该学生的补贴池",
-                    data=None
-                )
-
-            if pool.remaining_amount <= 0:
-                raise BusinessException(
-                    code=400,
-                    message="该学生没有剩余金额可分配",
-                    data=None
-                )
+            # 获取学生补贴池实时余额（含未汇总的补贴流水）
+            pool = self._get_reallocatable_pool(student_id)
 
             # 删除该学生未接取的虚拟任务
             self.db.query(Tasks).filter(
@@ -3201,9 +3254,8 @@ class VirtualOrderService:
                 student_id, pool.student_name, pool.remaining_amount
             )
 
-            # 更新补贴池信息
-            pool.last_allocation_at = datetime.now()
-            pool.updated_at = datetime.now()
+            # 更新补贴池信息（只更新分配时间，余额不变）
+            self._touch_pool_allocation(pool.pool_id)
 
             self.db.commit()
 
@@ -10,7 +10,7 @@ from datetime import datetime
 from typing import List, Dict, Any, Optional
 from decimal import Decimal
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy import and_, func, case, update
 from dataclasses import dataclass
 import threading
 from concurrent.futures import ThreadPoolExecutor
@@ -57,6 +57,7 @@ class VirtualTaskAllocator:
             'max_task_amount': Decimal('25'),  # 最大任务金额
             'new_service_priority_boost': 100,  # 新增客服优先级提升
             'allocation_batch_size': 20,  # 批量分配大小
+            'reassign_chunk_size': 500,  # 批量重新归属时每条UPDATE处理的任务数
         }
     
     def get_active_virtual_services(self, use_cache: bool = True) -> List[VirtualServiceAllocation]:
@@ -88,16 +89,22 @@ class VirtualTaskAllocator:
                 VirtualCustomerService.is_deleted == False
             ).all()
             
+            # 一次分组查询统计所有客服当前任务数量（未完成的虚拟任务）
+            task_counts = {}
+            if services:
+                task_counts = dict(
+                    self.db.query(Tasks.founder_id, func.count(Tasks.id)).filter(
+                        and_(
+                            Tasks.founder_id.in_([service.user_id for service in services]),
+                            Tasks.is_virtual == True,
+                            Tasks.status.in_(['0', '1', '2'])  # 未接单、已接单、进行中
+                        )
+                    ).group_by(Tasks.founder_id).all()
+                )
+            
             allocations = []
             for service in services:
-                # 统计当前任务数量（未完成的虚拟任务）
-                current_task_count = self.db.query(Tasks).filter(
-                    and_(
-                        Tasks.founder_id == service.user_id,
-                        Tasks.is_virtual == True,
-                        Tasks.status.in_(['0', '1', '2'])  # 未接单、已接单、进行中
-                    )
-                ).count()
+                current_task_count = task_counts.get(service.user_id, 0)
                 
                 # 判断是否为新增客服（24小时内创建的）
                 is_new = (datetime.now() - service.created_at).total_seconds() < 86400
@@ -274,39 +281,9 @@ class VirtualTaskAllocator:
                 available_services.sort(key=lambda x: x.priority)
 
                 # 将任务轮流分配给虚拟客服
-                allocated_tasks = []
-                service_index = 0
-
-                for amount in task_amounts:
-                    # 选择当前客服
-                    selected_service = available_services[service_index % len(available_services)]
-
-                    # 为该客服创建单个任务（如果图片不足则停止）
-                    task = service.create_virtual_task(student_id, student_name, amount)
-
-                    if task is None:
-                        logger.warning(f"图片资源不足，停止为学生 {student_name} 分配虚拟任务")
-                        break
-
-                    # 设置创建者为虚拟客服
-                    task.founder_id = selected_service.user_id
-                    task.founder = selected_service.service_name
-
-                    # 保存到数据库
-                    self.db.add(task)
-
-                    allocated_tasks.append({
-                        'id': task.id,
-                        'amount': float(amount),
-                        'founder_id': selected_service.user_id,
-                        'founder': selected_service.service_name,
-                        'student_id': student_id,
-                        'summary': task.summary,
-                        'order_number': task.order_number
-                    })
-
-                    # 轮转到下一个客服
-                    service_index += 1
+                allocated_tasks, _ = self._create_allocated_tasks(
+                    service, available_services, student_id, student_name, task_amounts
+                )
 
                 # 清除相关缓存
                 self._clear_cache()
@@ -328,12 +305,144 @@ class VirtualTaskAllocator:
     
 
     
-    def handle_service_deletion(self, deleted_service_id: int) -> Dict[str, Any]:
+    def allocate_tasks_bulk(self,
+                            allocation_requests: List[Dict[str, Any]],
+                            order_service=None) -> Dict[int, AllocationResult]:
+        """
+        在一次调用中为多个学生分配任务
+
+        只查询一次激活客服、只初始化一次任务生成服务，并在所有学生之间
+        连续轮转客服，适合批量补发任务的场景。
+
+        Args:
+            allocation_requests: 分配请求列表
+                [{'total_amount': Decimal, 'student_id': int, 'student_name': str, 'on_demand': bool}, ...]
+            order_service: 可复用的VirtualOrderService实例
+
+        Returns:
+            Dict[int, AllocationResult]: {student_id: 分配结果}
+        """
+        results = {}
+        if not allocation_requests:
+            return results
+
+        try:
+            with self.lock:
+                services = self.get_active_virtual_services()
+
+                if not services:
+                    for request in allocation_requests:
+                        results[request['student_id']] = AllocationResult(
+                            success=False,
+                            allocated_tasks=[],
+                            total_amount=Decimal('0'),
+                            error_message="没有可用的虚拟客服"
+                        )
+                    return results
+
+                if order_service is None:
+                    from .virtual_order_service import VirtualOrderService
+                    order_service = VirtualOrderService(self.db)
+
+                services.sort(key=lambda x: x.priority)
+                service_index = 0
+
+                for request in allocation_requests:
+                    student_id = request['student_id']
+                    total_amount = request['total_amount']
+
+                    if request.get('on_demand', False):
+                        task_amounts = order_service.calculate_on_demand_task_amounts(total_amount)
+                    else:
+                        task_amounts = order_service.calculate_task_amounts(total_amount)
+
+                    if not task_amounts:
+                        results[student_id] = AllocationResult(
+                            success=False,
+                            allocated_tasks=[],
+                            total_amount=Decimal('0'),
+                            error_message="无法计算任务金额分配"
+                        )
+                        continue
+
+                    allocated_tasks, service_index = self._create_allocated_tasks(
+                        order_service, services, student_id, request['student_name'],
+                        task_amounts, service_index
+                    )
+
+                    results[student_id] = AllocationResult(
+                        success=True,
+                        allocated_tasks=allocated_tasks,
+                        total_amount=total_amount
+                    )
+
+                # 清除相关缓存
+                self._clear_cache()
+
+        except Exception as e:
+            logger.error(f"批量分配任务失败: {e}")
+            for request in allocation_requests:
+                results.setdefault(request['student_id'], AllocationResult(
+                    success=False,
+                    allocated_tasks=[],
+                    total_amount=Decimal('0'),
+                    error_message=str(e)
+                ))
+
+        return results
+
+    def _create_allocated_tasks(self, order_service, services: List[VirtualServiceAllocation],
+                                student_id: int, student_name: str,
+                                task_amounts: List[Decimal], service_index: int = 0):
+        """
+        按金额列表创建任务并轮流分配给虚拟客服
+
+        Returns:
+            Tuple[List[Dict], int]: (已分配任务列表, 下一个客服索引)
+        """
+        allocated_tasks = []
+
+        for amount in task_amounts:
+            # 选择当前客服
+            selected_service = services[service_index % len(services)]
+
+            # 为该客服创建单个任务（如果图片不足则停止）
+            task = order_service.create_virtual_task(student_id, student_name, amount)
+
+            if task is None:
+                logger.warning(f"图片资源不足，停止为学生 {student_name} 分配虚拟任务")
+                break
+
+            # 设置创建者为虚拟客服
+            task.founder_id = selected_service.user_id
+            task.founder = selected_service.service_name
+
+            # 保存到数据库
+            self.db.add(task)
+
+            allocated_tasks.append({
+                'id': task.id,
+                'amount': float(amount),
+                'founder_id': selected_service.user_id,
+                'founder': selected_service.service_name,
+                'student_id': student_id,
+                'summary': task.summary,
+                'order_number': task.order_number
+            })
+
+            # 轮转到下一个客服
+            service_index += 1
+
+        return allocated_tasks, service_index
+
+    def handle_service_deletion(self, deleted_service_id: int, bulk_reassign: bool = True) -> Dict[str, Any]:
         """
         处理虚拟客服删除后的任务重新分配
         
         Args:
             deleted_service_id: 被删除的虚拟客服ID
+            bulk_reassign: 是否批量重新归属（True=保留原任务和图片，仅转移创建者；
+                           False=删除原任务后按学生重新生成）
             
         Returns:
             Dict: 重新分配结果
@@ -351,6 +460,9 @@ class VirtualTaskAllocator:
                         'message': '未找到指定的虚拟客服'
                     }
                 
+                if bulk_reassign:
+                    return self._bulk_reassign_service_tasks(deleted_service)
+                
                 # 查找该客服的未完成任务
                 pending_tasks = self.db.query(Tasks).filter(
                     and_(
@@ -375,6 +487,13 @@ class VirtualTaskAllocator:
                         student_tasks[student_id] = []
                     student_tasks[student_id].append(task)
                 
+                # 一次性获取所有学生名称
+                student_names = dict(
+                    self.db.query(UserInfo.roleId, UserInfo.name).filter(
+                        UserInfo.roleId.in_([sid for sid in student_tasks if sid is not None])
+                    ).all()
+                )
+                
                 redistributed_count = 0
                 
                 # 为每个学生重新分配任务
@@ -385,12 +504,7 @@ class VirtualTaskAllocator:
                     for task in tasks:
                         self.db.delete(task)
                     
-                    # 获取学生名称
-                    student = self.db.query(UserInfo).filter(
-                        UserInfo.roleId == student_id
-                    ).first()
-                    
-                    student_name = student.name if student else f"学生{student_id}"
+                    student_name = student_names.get(student_id) or f"学生{student_id}"
                     
                     # 重新分配任务
                     result = self.allocate_tasks_to_services(
@@ -418,6 +532,86 @@ class VirtualTaskAllocator:
                 'message': f'重新分配任务失败: {str(e)}'
             }
     
+    def _bulk_reassign_service_tasks(self, deleted_service: VirtualCustomerService) -> Dict[str, Any]:
+        """
+        将被删除客服的未完成任务批量转移给其余激活客服
+        
+        任务行及其关联图片保持不变，只按优先级轮流改写founder_id/founder，
+        每批任务ID使用一条 UPDATE ... CASE 语句完成。
+        
+        Args:
+            deleted_service: 被删除的虚拟客服
+            
+        Returns:
+            Dict: 重新分配结果
+        """
+        # 只加载ID和学生ID，不实例化任务对象
+        pending_rows = self.db.query(Tasks.id, Tasks.target_student_id).filter(
+            and_(
+                Tasks.founder_id == deleted_service.user_id,
+                Tasks.is_virtual == True,
+                Tasks.status.in_(['0', '1', '2'])  # 未接单、已接单、进行中
+            )
+        ).order_by(Tasks.id).all()
+        
+        if not pending_rows:
+            return {
+                'success': True,
+                'message': '该虚拟客服没有待处理的任务',
+                'redistributed_tasks': 0
+            }
+        
+        # 其余激活客服（按优先级排序）
+        services = [
+            s for s in self.get_active_virtual_services(use_cache=False)
+            if s.user_id != deleted_service.user_id
+        ]
+        
+        if not services:
+            return {
+                'success': False,
+                'message': '没有其他可用的虚拟客服，任务未重新分配',
+                'redistributed_tasks': 0
+            }
+        
+        chunk_size = self.config['reassign_chunk_size']
+        task_ids = [row.id for row in pending_rows]
+        
+        for start in range(0, len(task_ids), chunk_size):
+            chunk = task_ids[start:start + chunk_size]
+            founder_ids = {}
+            founder_names = {}
+            for offset, task_id in enumerate(chunk):
+                selected_service = services[(start + offset) % len(services)]
+                founder_ids[task_id] = selected_service.user_id
+                founder_names[task_id] = selected_service.service_name
+            
+            self.db.execute(
+                update(Tasks)
+                .where(Tasks.id.in_(chunk))
+                .values(
+                    founder_id=case(founder_ids, value=Tasks.id),
+                    founder=case(founder_names, value=Tasks.id),
+                    updated_at=datetime.now()
+                )
+                .execution_options(synchronize_session=False)
+            )
+        
+        # 清除缓存
+        self._clear_cache()
+        
+        affected_students = {row.target_student_id for row in pending_rows}
+        logger.info(
+            f"虚拟客服 {deleted_service.name} 的 {len(task_ids)} 个任务已批量转移给 {len(services)} 个客服"
+        )
+        
+        return {
+            'success': True,
+            'message': f'成功重新分配 {len(task_ids)} 个任务',
+            'redistributed_tasks': len(task_ids),
+            'affected_students': len(affected_students)
+        }
+    
     def get_allocation_statistics(self) -> Dict[str, Any]:
         """
         获取分配统计信息
@@ -1,8 +1,14 @@
 import pandas as pd
 import io
-from typing import List, Dict, Any, Tuple
+import csv
+import tempfile
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Tuple, Iterable, Iterator, Sequence, IO
+from urllib.parse import quote
 from fastapi import UploadFile, HTTPException
 from decimal import Decimal
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
 
 class ExcelProcessor:
     """Excel文件处理工具类"""
@@ -139,3 +145,108 @@ class ExcelProcessor:
                 status_code=400, 
                 detail=f"文件大小超过限制，最大允许{max_size_mb}MB"
             )
+
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+
+EXPORT_FORMATS = ('xlsx', 'csv')
+
+
+@dataclass
+class ExportSheet:
+    """流式导出的工作表"""
+    title: str
+    headers: List[str]
+    rows: Iterable[Sequence[Any]]
+    column_widths: List[int] = field(default_factory=list)
+
+
+class StreamingExporter:
+    """
+    流式导出工具类
+
+    Excel 使用 openpyxl 只写模式逐行写入临时文件（内存占用与行数无关），
+    写完后按块读出；CSV 边查询边输出，不落盘。
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    CSV_FLUSH_ROWS = 500
+
+    @staticmethod
+    def media_type(file_format: str) -> str:
+        """导出格式对应的 Content-Type"""
+        return CSV_MEDIA_TYPE if file_format == 'csv' else XLSX_MEDIA_TYPE
+
+    @staticmethod
+    def content_disposition(filename: str) -> Dict[str, str]:
+        """下载响应头（兼容中文文件名）"""
+        return {"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename, encoding='utf-8')}"}
+
+    @staticmethod
+    def write_xlsx(sheets: List[ExportSheet]) -> IO[bytes]:
+        """
+        以只写模式将工作表写入临时文件
+
+        Returns:
+            IO[bytes]: 已定位到开头的临时文件，由调用方读取后关闭
+        """
+        workbook = Workbook(write_only=True)
+        for sheet in sheets:
+            worksheet = workbook.create_sheet(title=sheet.title)
+            # 只写模式下列宽必须在写入数据前设置
+            for index, width in enumerate(sheet.column_widths, start=1):
+                worksheet.column_dimensions[get_column_letter(index)].width = width
+            worksheet.append(sheet.headers)
+            for row in sheet.rows:
+                worksheet.append(list(row))
+
+        output = tempfile.TemporaryFile()
+        try:
+            workbook.save(output)
+        except Exception:
+            output.close()
+            raise
+        output.seek(0)
+        return output
+
+    @staticmethod
+    def iter_file(file: IO[bytes], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """按块读出文件内容，读完后关闭文件"""
+        try:
+            while True:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            file.close()
+
+    @staticmethod
+    def stream_xlsx(sheets: List[ExportSheet], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """生成Excel文件并返回按块读取的迭代器（生成过程中的异常在返回前抛出）"""
+        return StreamingExporter.iter_file(StreamingExporter.write_xlsx(sheets), chunk_size)
+
+    @staticmethod
+    def stream_csv(headers: List[str], rows: Iterable[Sequence[Any]],
+                   flush_rows: int = CSV_FLUSH_ROWS) -> Iterator[bytes]:
+        """逐批输出CSV内容（带BOM，Excel直接打开不乱码）"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        buffer.write('\ufeff')
+        writer.writerow(headers)
+
+        pending = 0
+        for row in rows:
+            writer.writerow(row)
+            pending += 1
+            if pending >= flush_rows:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate(0)
+                pending = 0
+
+        tail = buffer.getvalue()
+        if tail:
+            yield tail.encode('utf-8')
@@ -1,90 +1,307 @@
 """
-Redis缓存客户端配置
+Redis客户端配置
+全项目统一的Redis访问层：同步/异步代码分别共享一个有上限的连接池，
+健康检查在后台线程中定时执行（不在请求路径上），并提供管道辅助方法和调用统计
 """
 
-import redis
-import os
 import logging
-from typing import Optional
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import redis
+from redis import asyncio as redis_asyncio
+from redis.client import Pipeline
+
+from shared.config import settings
 
 logger = logging.getLogger(__name__)
 
+
+class RedisMetrics:
+    """Redis调用统计（进程内累计）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.errors = 0
+            self.total_seconds = 0.0
+            self.commands: Dict[str, int] = {}
+
+    def record(self, command: str, elapsed: float, error: bool = False) -> None:
+        with self._lock:
+            self.calls += 1
+            self.total_seconds += elapsed
+            self.commands[command] = self.commands.get(command, 0) + 1
+            if error:
+                self.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'avg_ms': round(self.total_seconds * 1000 / self.calls, 3) if self.calls else 0.0,
+                'commands': dict(self.commands),
+            }
+
+
+metrics = RedisMetrics()
+
+
+def _command_name(args) -> str:
+    return str(args[0]).upper() if args else 'UNKNOWN'
+
+
+class InstrumentedRedis(redis.Redis):
+    """记录调用统计的同步客户端"""
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        error = False
+        try:
+            return super().execute_command(*args, **options)
+        except Exception:
+            error = True
+            raise
+        finally:
+            metrics.record(_command_name(args), time.perf_counter() - start, error)
+
+
+class InstrumentedAsyncRedis(redis_asyncio.Redis):
+    """记录调用统计的异步客户端"""
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        error = False
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception:
+            error = True
+            raise
+        finally:
+            metrics.record(_command_name(args), time.perf_counter() - start, error)
+
+
 class RedisClient:
-    """Redis客户端管理器"""
-    
+    """
+    Redis客户端管理器
+
+    - 同步客户端（redis.Redis）和异步客户端（redis.asyncio.Redis）各使用一个阻塞式连接池，
+      连接数达到上限时等待 REDIS_POOL_TIMEOUT 秒，而不是无限制新建连接
+    - 后台线程每 REDIS_HEALTH_CHECK_INTERVAL 秒 PING 一次；Redis不可用期间
+      get_client()/get_async_client() 返回None，调用方按无缓存处理，请求不会因等待连接超时而变慢
+    """
+
     def __init__(self):
-        self._client: Optional[redis.Redis] = None
+        self._lock = threading.Lock()
+        self._pool: Optional[redis.BlockingConnectionPool] = None
+        self._async_pool: Optional[redis_asyncio.BlockingConnectionPool] = None
+        self._client: Optional[InstrumentedRedis] = None
+        self._async_client: Optional[InstrumentedAsyncRedis] = None
         self._connected = False
-    
-    def get_client(self) -> Optional[redis.Redis]:
-        """获取Redis客户端实例"""
-        if self._client is None or not self._connected:
-            self._connect()
-        return self._client if self._connected else None
-    
-    def _connect(self):
-        """连接Redis"""
-        try:
-            # 从环境变量获取Redis配置
-            redis_host = os.getenv('REDIS_HOST', 'localhost')
-            redis_port = int(os.getenv('REDIS_PORT', '6379'))
-            redis_password = os.getenv('REDIS_PASSWORD', None)
-            redis_db = int(os.getenv('REDIS_DB', '0'))
-            
-            # 创建Redis连接
-            self._client = redis.Redis(
-                host=redis_host,
-                port=redis_port,
-                password=redis_password,
-                db=redis_db,
-                decode_responses=True,  # 自动解码响应
-                socket_timeout=5,  # 5秒超时
-                socket_connect_timeout=5,  # 5秒连接超时
-                retry_on_timeout=True,
-                health_check_interval=30  # 30秒健康检查
+        self._last_check_at: Optional[float] = None
+        self._health_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def _connection_kwargs() -> Dict[str, Any]:
+        return {
+            'host': settings.REDIS_HOST,
+            'port': settings.REDIS_PORT,
+            'db': settings.REDIS_DB,
+            'password': settings.REDIS_PASSWORD or None,
+            'decode_responses': True,  # 自动解码响应
+            'encoding': 'utf8',
+            'socket_timeout': settings.REDIS_SOCKET_TIMEOUT,
+            'socket_connect_timeout': settings.REDIS_SOCKET_TIMEOUT,
+            'retry_on_timeout': True,
+        }
+
+    def _ensure_started(self) -> None:
+        """首次使用时创建连接池，执行一次健康检查并启动后台检查线程"""
+        if self._health_thread is not None:
+            return
+        with self._lock:
+            if self._health_thread is not None:
+                return
+            kwargs = self._connection_kwargs()
+            self._pool = redis.BlockingConnectionPool(
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+                timeout=settings.REDIS_POOL_TIMEOUT,
+                **kwargs
             )
-            
-            # 测试连接
+            self._async_pool = redis_asyncio.BlockingConnectionPool(
+                max_connections=settings.REDIS_ASYNC_MAX_CONNECTIONS,
+                timeout=settings.REDIS_POOL_TIMEOUT,
+                **kwargs
+            )
+            self._client = InstrumentedRedis(connection_pool=self._pool)
+            self._async_client = InstrumentedAsyncRedis(connection_pool=self._async_pool)
+
+            self.check_health()
+            self._stop_event.clear()
+            self._health_thread = threading.Thread(target=self._health_loop, name="redis-health-check", daemon=True)
+            self._health_thread.start()
+
+    def check_health(self) -> bool:
+        """PING一次并更新连接状态"""
+        try:
             self._client.ping()
-            self._connected = True
-            logger.info(f"Redis连接成功: {redis_host}:{redis_port}")
-            
+            healthy = True
         except Exception as e:
-            logger.warning(f"Redis连接失败: {e}")
-            self._client = None
-            self._connected = False
-    
+            healthy = False
+            if self._connected or self._last_check_at is None:
+                logger.warning("Redis连接失败: %s:%s, %s", settings.REDIS_HOST, settings.REDIS_PORT, e)
+        if healthy and not self._connected:
+            logger.info("Redis连接成功: %s:%s", settings.REDIS_HOST, settings.REDIS_PORT)
+        self._connected = healthy
+        self._last_check_at = time.time()
+        return healthy
+
+    def _health_loop(self) -> None:
+        while not self._stop_event.wait(settings.REDIS_HEALTH_CHECK_INTERVAL):
+            self.check_health()
+
+    def get_client(self) -> Optional[redis.Redis]:
+        """获取同步客户端，Redis不可用时返回None"""
+        self._ensure_started()
+        return self._client if self._connected else None
+
+    def get_async_client(self) -> Optional[redis_asyncio.Redis]:
+        """获取异步客户端，Redis不可用时返回None"""
+        self._ensure_started()
+        return self._async_client if self._connected else None
+
     def is_connected(self) -> bool:
-        """检查Redis是否连接"""
-        if not self._connected or self._client is None:
-            return False
-        
-        try:
-            self._client.ping()
-            return True
-        except:
-            self._connected = False
-            return False
-    
+        """最近一次健康检查是否成功"""
+        self._ensure_started()
+        return self._connected
+
+    def stats(self) -> Dict[str, Any]:
+        """连接状态、连接池使用情况和调用统计"""
+        return {
+            'connected': self._connected,
+            'last_check_at': self._last_check_at,
+            'sync_pool': self._pool_stats(self._pool),
+            'async_pool': self._pool_stats(self._async_pool),
+            **metrics.snapshot(),
+        }
+
+    @staticmethod
+    def _pool_stats(pool) -> Optional[Dict[str, int]]:
+        if pool is None:
+            return None
+        created = [conn for conn in getattr(pool, '_connections', []) if conn is not None]
+        return {'max_connections': pool.max_connections, 'created_connections': len(created)}
+
     def close(self):
-        """关闭Redis连接"""
-        if self._client:
+        """停止健康检查并关闭同步连接池（异步连接池随事件循环关闭）"""
+        with self._lock:
+            self._stop_event.set()
+            if self._pool is not None:
+                try:
+                    self._pool.disconnect()
+                    logger.info("Redis连接已关闭")
+                except Exception:
+                    pass
+            self._pool = self._async_pool = None
+            self._client = self._async_client = None
+            self._connected = False
+            self._health_thread = None
+
+    async def aclose(self):
+        """关闭异步连接池后关闭同步连接池（应用关闭时在事件循环中调用）"""
+        if self._async_pool is not None:
             try:
-                self._client.close()
-                logger.info("Redis连接已关闭")
-            except:
+                await self._async_pool.disconnect()
+            except Exception:
                 pass
-            finally:
-                self._client = None
-                self._connected = False
+        self.close()
+
 
 # 全局Redis客户端实例
 _redis_manager = RedisClient()
 
+
 def get_redis_client() -> Optional[redis.Redis]:
-    """获取Redis客户端实例（全局单例）"""
+    """获取同步Redis客户端（全局共享连接池），Redis不可用时返回None"""
     return _redis_manager.get_client()
 
+
+def get_async_redis_client() -> Optional[redis_asyncio.Redis]:
+    """获取异步Redis客户端（全局共享连接池），Redis不可用时返回None"""
+    return _redis_manager.get_async_client()
+
+
+def is_redis_connected() -> bool:
+    return _redis_manager.is_connected()
+
+
+def get_redis_stats() -> Dict[str, Any]:
+    """Redis连接池和调用统计"""
+    return _redis_manager.stats()
+
+
 def close_redis_connection():
     """关闭Redis连接"""
-    _redis_manager.close()
\ No newline at end of file
+    _redis_manager.close()
+
+
+async def aclose_redis_connection():
+    """关闭Redis连接（包括异步连接池）"""
+    await _redis_manager.aclose()
+
+
+def pipelined(client: redis.Redis, build: Callable[[Pipeline], Any], transaction: bool = False) -> List[Any]:
+    """
+    在一个管道中批量执行命令（一次往返）
+
+    Example:
+        pipelined(client, lambda pipe: [pipe.setex(k, 60, v) for k, v in items.items()])
+    """
+    start = time.perf_counter()
+    error = False
+    try:
+        pipe = client.pipeline(transaction=transaction)
+        build(pipe)
+        return pipe.execute()
+    except Exception:
+        error = True
+        raise
+    finally:
+        metrics.record('PIPELINE', time.perf_counter() - start, error)
+
+
+async def apipelined(client: redis_asyncio.Redis, build: Callable[[Any], Any], transaction: bool = False) -> List[Any]:
+    """在一个管道中批量执行命令（异步版本，见 pipelined）"""
+    start = time.perf_counter()
+    error = False
+    try:
+        pipe = client.pipeline(transaction=transaction)
+        build(pipe)
+        return await pipe.execute()
+    except Exception:
+        error = True
+        raise
+    finally:
+        metrics.record('PIPELINE', time.perf_counter() - start, error)
+
+
+def delete_pattern(client: redis.Redis, pattern: str, batch_size: int = 500) -> int:
+    """
+    删除匹配模式的key（SCAN 遍历 + 管道分批 UNLINK，不使用阻塞的 KEYS）
+
+    Returns:
+        int: 删除的key数量
+    """
+    keys = list(client.scan_iter(match=pattern, count=batch_size))
+    deleted = 0
+    for i in range(0, len(keys), batch_size):
+        batch = keys[i:i + batch_size]
+        deleted += sum(pipelined(client, lambda pipe: pipe.unlink(*batch)))
+    return deleted
@@ -0,0 +1,177 @@
+"""
+登录用户信息缓存
+认证依赖按用户ID缓存用户的基本信息（进程内LRU + Redis），短时间内的重复请求不再查询数据库
+"""
+
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import redis
+from sqlalchemy.orm import Session
+
+from shared.cache.redis_client import get_redis_client
+from shared.models.original_user import OriginalUser
+from shared.models.userinfo import UserInfo
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UserInfoPrincipal:
+    """用户关联的 userinfo 信息"""
+    roleId: int
+    name: Optional[str] = None
+
+
+@dataclass
+class UserPrincipal:
+    """
+    已认证用户信息（对应 user 表，只包含认证和接口中用到的字段）
+
+    token 为当前请求的令牌，不写入缓存。
+    """
+    id: int
+    username: str
+    role: Optional[str] = None
+    isDeleted: bool = False
+    userinfo: Optional[UserInfoPrincipal] = None
+    token: Optional[str] = None
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        data.pop('token', None)
+        return json.dumps(data, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, value: str) -> "UserPrincipal":
+        data = json.loads(value)
+        userinfo = data.pop('userinfo', None)
+        return cls(**data, userinfo=UserInfoPrincipal(**userinfo) if userinfo else None)
+
+
+class UserPrincipalCache:
+    """登录用户信息缓存（进程内LRU + Redis，短TTL）"""
+
+    REDIS_KEY_PREFIX = "auth:principal:"
+    LOCAL_TTL = 30  # 进程内缓存30秒
+    REDIS_TTL = 120  # Redis缓存2分钟
+    MAX_ENTRIES = 4096
+
+    # 进程内缓存：{user_id: (principal, expire_at)}，所有实例共享
+    _local_cache: "OrderedDict[int, tuple]" = OrderedDict()
+    _local_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, db: Session, user_id: int) -> Optional[UserPrincipal]:
+        """
+        获取用户信息，依次查找进程内缓存、Redis缓存、数据库
+
+        Returns:
+            Optional[UserPrincipal]: 用户不存在时返回None；已删除的用户不缓存
+        """
+        principal = cls._get_local(user_id)
+        if principal is not None:
+            return principal
+
+        redis_client = get_redis_client()
+        principal = cls._get_from_redis(redis_client, user_id)
+        if principal is None:
+            principal = cls._load(db, user_id)
+            if principal is None or principal.isDeleted:
+                return principal
+            cls._store_redis(redis_client, principal)
+
+        cls._store_local(principal)
+        return principal
+
+    @classmethod
+    def invalidate(cls, *user_ids: int) -> None:
+        """用户修改密码、被删除或禁用后清除缓存（需在事务提交后调用）"""
+        ids = [uid for uid in user_ids if uid is not None]
+        if not ids:
+            return
+        with cls._local_lock:
+            for uid in ids:
+                cls._local_cache.pop(uid, None)
+
+        redis_client = get_redis_client()
+        if not redis_client:
+            return
+        try:
+            redis_client.delete(*[f"{cls.REDIS_KEY_PREFIX}{uid}" for uid in ids])
+        except Exception as e:
+            logger.warning("清除用户信息缓存失败: %s", e)
+
+    @staticmethod
+    def _load(db: Session, user_id: int) -> Optional[UserPrincipal]:
+        """从数据库加载用户及其 userinfo（一次关联查询）"""
+        row = db.query(
+            OriginalUser.id,
+            OriginalUser.username,
+            OriginalUser.role,
+            OriginalUser.isDeleted,
+            UserInfo.roleId,
+            UserInfo.name
+        ).outerjoin(
+            UserInfo, UserInfo.userId == OriginalUser.id
+        ).filter(
+            OriginalUser.id == user_id
+        ).first()
+
+        if row is None:
+            return None
+        return UserPrincipal(
+            id=row.id,
+            username=row.username,
+            role=row.role,
+            isDeleted=bool(row.isDeleted),
+            userinfo=UserInfoPrincipal(roleId=row.roleId, name=row.name) if row.roleId is not None else None
+        )
+
+    @classmethod
+    def _get_local(cls, user_id: int) -> Optional[UserPrincipal]:
+        now = time.monotonic()
+        with cls._local_lock:
+            entry = cls._local_cache.get(user_id)
+            if entry is None:
+                return None
+            principal, expire_at = entry
+            if expire_at <= now:
+                del cls._local_cache[user_id]
+                return None
+            cls._local_cache.move_to_end(user_id)
+            return principal
+
+    @classmethod
+    def _store_local(cls, principal: UserPrincipal) -> None:
+        expire_at = time.monotonic() + cls.LOCAL_TTL
+        with cls._local_lock:
+            cls._local_cache[principal.id] = (principal, expire_at)
+            cls._local_cache.move_to_end(principal.id)
+            while len(cls._local_cache) > cls.MAX_ENTRIES:
+                cls._local_cache.popitem(last=False)
+
+    @classmethod
+    def _get_from_redis(cls, redis_client: Optional[redis.Redis], user_id: int) -> Optional[UserPrincipal]:
+        if not redis_client:
+            return None
+        try:
+            value = redis_client.get(f"{cls.REDIS_KEY_PREFIX}{user_id}")
+            return UserPrincipal.from_json(value) if value else None
+        except Exception as e:
+            logger.warning("从缓存获取用户信息失败: %s", e)
+            return None
+
+    @classmethod
+    def _store_redis(cls, redis_client: Optional[redis.Redis], principal: UserPrincipal) -> None:
+        if not redis_client:
+            return
+        try:
+            redis_client.setex(f"{cls.REDIS_KEY_PREFIX}{principal.id}", cls.REDIS_TTL, principal.to_json())
+        except Exception as e:
+            logger.warning("缓存用户信息失败: %s", e)
@@ -19,6 +19,8 @@ class Settings(BaseSettings):
     SECRET_KEY: str = Field(env="JWT_SECRET_KEY", default="your-secret-key-keep-it-secret")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = Field(env="JWT_ACCESS_TOKEN_EXPIRE_MINUTES", default=30)
     ALGORITHM: str = "HS256"  # JWT加密算法
+    PASSWORD_HASH_ROUNDS: int = Field(default=10)  # bcrypt加密轮数，调整后用户下次登录时自动按新轮数重新加密
+    PASSWORD_HASH_WORKERS: int = Field(default=-1)  # 密码哈希进程数，-1 为 min(4, CPU数)，0 为不使用进程池
     
     # 数据库配置
     MYSQL_HOST: str
@@ -45,7 +47,25 @@ class Settings(BaseSettings):
     REDIS_PORT: int = Field(default=6379)
     REDIS_DB: int = Field(default=0)
     REDIS_PASSWORD: str = Field(default="")
-    
+    REDIS_MAX_CONNECTIONS: int = Field(default=50)  # 同步连接池上限（线程池中的同步代码共用）
+    REDIS_ASYNC_MAX_CONNECTIONS: int = Field(default=50)  # 异步连接池上限
+    REDIS_POOL_TIMEOUT: float = Field(default=2.0)  # 连接池满时等待空闲连接的秒数
+    REDIS_SOCKET_TIMEOUT: float = Field(default=2.0)
+    REDIS_HEALTH_CHECK_INTERVAL: float = Field(default=10.0)  # 后台健康检查间隔（秒）
+
+    # 日志配置
+    LOG_LEVEL: str = Field(default="INFO")
+    # 按模块设置日志级别，如 "shared.middlewares=WARNING,services.virtual_order_service=DEBUG"
+    LOG_MODULE_LEVELS: str = Field(default="")
+    # 日志格式：text 或 json
+    LOG_FORMAT: str = Field(default="text")
+    # DEBUG 日志采样：同一位置每 N 条输出 1 条（1 表示不采样）
+    LOG_DEBUG_SAMPLE_EVERY: int = Field(default=1)
+
+    # 登录日志批量写入配置
+    LOGIN_AUDIT_BATCH_SIZE: int = Field(default=200)  # 每批最多写入条数
+    LOGIN_AUDIT_FLUSH_INTERVAL_MS: int = Field(default=500)  # 最早一条登录日志最多等待的毫秒数
+    LOGIN_AUDIT_QUEUE_SIZE: int = Field(default=10000)  # 内存队列上限，写满时丢弃新日志
 
     
     class Config:
@@ -9,11 +9,15 @@ from sqlalchemy.orm import Session
 
 from shared.exceptions import BusinessException
 from shared.models.user import User
-from shared.models.original_user import OriginalUser
 from shared.config import settings
 from shared.database.session import get_db
 from shared.schemas.common import ResponseSchema
-from shared.utils.jwt import decode_jwt_token
+from shared.utils.jwt import decode_jwt_token_cached
+from shared.cache.user_principal_cache import UserPrincipal, UserPrincipalCache
+import dataclasses
+import logging
+
+logger = logging.getLogger(__name__)
 
 # OAuth2 配置
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
@@ -39,7 +43,15 @@ class CustomHTTPBearer(HTTPBearer):
 
 security = CustomHTTPBearer()
 
+def get_token_user_id(request: Request, token: str) -> int:
+    """获取token中的用户ID：优先使用 AuthMiddleware 已解析并保存在 request.state 中的结果，避免重复解码"""
+    state_user = getattr(request.state, "user", None)
+    if state_user:
+        return state_user["user_id"]
+    return decode_jwt_token_cached(token).user_id
+
 async def get_current_user(
+    request: Request,
     token: Annotated[str, Depends(oauth2_scheme)],
     db: Session = Depends(get_db)
 ) -> User:
@@ -47,15 +59,12 @@ async def get_current_user(
     从JWT令牌中获取当前用户
     """
     try:
-        print(f"[AUTH] 开始解析Token: {token[:20]}...")
-        # 解码JWT令牌
-        token_data = decode_jwt_token(token)
-        print(f"[AUTH] 令牌解析成功，用户ID: {token_data.user_id}")
+        user_id = get_token_user_id(request, token)
         
         # 从数据库获取用户
-        user = db.query(User).filter(User.id == token_data.user_id).first()
+        user = db.query(User).filter(User.id == user_id).first()
         if user is None:
-            print(f"[AUTH] 用户不存在: {token_data.user_id}")
+            logger.info("用户不存在: %s", user_id)
             raise BusinessException(
                 code=401,
                 message="用户不存在，请重新登录",
@@ -64,7 +73,7 @@ async def get_current_user(
             
         # 检查用户状态
         if user.status != 1:  # 1表示启用状态
-            print(f"[AUTH] 用户已被禁用: {user.id}, 状态: {user.status}")
+            logger.info("用户已被禁用: %s, 状态: %s", user.id, user.status)
             raise BusinessException(
                 code=401,
                 message="账户已被禁用，请联系管理员",
@@ -74,13 +83,12 @@ async def get_current_user(
         # 将token添加到用户对象，方便后续使用
         # 这种方式不会影响数据库中的用户对象
         setattr(user, 'token', token)
-        print(f"[AUTH] 用户{user.id}认证成功，已将token添加到user对象")
-        print(f"[AUTH] 检查token是否成功附加: {hasattr(user, 'token')}")
+        logger.debug("用户%s认证成功", user.id)
             
         return user
         
     except Exception as e:
-        print(f"[AUTH] 认证失败: {str(e)}")
+        logger.info("认证失败: %s", e)
         raise BusinessException(
             code=401,
             message="无法验证凭据",
@@ -88,28 +96,31 @@ async def get_current_user(
         )
 
 async def get_current_active_user(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
-) -> OriginalUser:
+) -> UserPrincipal:
     """获取当前活跃用户
 
+    用户信息按用户ID短时间缓存（见 UserPrincipalCache），修改密码、删除或禁用用户时清除缓存
+
     Args:
+        request: 请求对象
         credentials: HTTP认证凭据
         db: 数据库会话
 
     Returns:
-        OriginalUser: 当前用户对象
+        UserPrincipal: 当前用户信息（字段同 OriginalUser，userinfo 含 roleId 和 name）
 
     Raises:
         HTTPException: 认证失败时抛出
     """
     try:
-        # 解码token
         token = credentials.credentials
-        token_data = decode_jwt_token(token)
+        user_id = get_token_user_id(request, token)
 
-        # 从数据库获取用户（使用OriginalUser表）
-        user = db.query(OriginalUser).filter(OriginalUser.id == token_data.user_id).first()
+        # 获取用户信息（使用OriginalUser表，优先读取缓存）
+        user = UserPrincipalCache.get(db, user_id)
         if user is None:
             raise BusinessException(
                 code=401,
@@ -125,11 +136,8 @@ async def get_current_active_user(
                 data=None
             )
 
-        # 将token添加到用户对象，方便后续使用
-        # 这种方式不会影响数据库中的用户对象
-        setattr(user, 'token', token)
-
-        return user
+        # 将token添加到用户对象，方便后续使用（缓存对象在请求间共享，使用副本）
+        return dataclasses.replace(user, token=token)
         
     except Exception as e:
         # raise HTTPException(
@@ -1,23 +1,24 @@
 from typing import Optional
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response, JSONResponse
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 import logging
 import re
 
-from shared.utils.jwt import decode_jwt_token
+from shared.utils.jwt import decode_jwt_token_cached
+from shared.services.token_blacklist_service import TokenBlacklistService
 from shared.exceptions import BusinessException
 
 logger = logging.getLogger(__name__)
 
-class AuthMiddleware(BaseHTTPMiddleware):
-    """认证中间件
+class AuthMiddleware:
+    """认证中间件（纯ASGI）
     
     处理请求的JWT token认证
     """
     
-    def __init__(self, app):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp):
+        self.app = app
         # 不需要认证的路径白名单
         self.white_list = [
             "/api/auth/login",
@@ -47,36 +48,45 @@ class AuthMiddleware(BaseHTTPMiddleware):
             # Docker容器内的静态PDF文件模式匹配
             re.compile(r"^/app/static/pdf/.*\.pdf$")
         ]
+        # 白名单前缀和正则模式预编译为一个正则，每个请求只匹配一次
+        self.white_matcher = self._compile_white_matcher(self.white_list, self.white_patterns)
+
+    @staticmethod
+    def _compile_white_matcher(prefixes, patterns) -> "re.Pattern":
+        """将白名单前缀和正则模式合并为一个正则（匹配行为与逐个 startswith / pattern.match 一致）"""
+        alternatives = [re.escape(prefix) for prefix in prefixes]
+        alternatives.extend(f"(?:{pattern.pattern})" for pattern in patterns)
+        return re.compile("|".join(alternatives))
+
+    def is_white_path(self, path: str) -> bool:
+        """路径是否在白名单中（前缀匹配或匹配白名单模式）"""
+        return self.white_matcher.match(path) is not None
     
-    async def dispatch(self, request: Request, call_next) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """处理请求
         
         Args:
-            request: 请求对象
-            call_next: 下一个处理函数
-            
-        Returns:
-            Response: 响应对象
+            scope: ASGI连接信息
+            receive: 接收消息
+            send: 发送消息
         """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # 检查是否在白名单中或匹配白名单模式
-        path = request.url.path
-        print(f"[Auth] 当前请求路径: {path}")
-        
-        is_in_whitelist = any(path.startswith(white_path) for white_path in self.white_list)
-        is_match_pattern = any(pattern.match(path) for pattern in self.white_patterns)
-        print(f"[Auth] 是否在白名单中: {is_in_whitelist}")
-        print(f"[Auth] 是否匹配白名单模式: {is_match_pattern}")
-        
-        if is_in_whitelist or is_match_pattern:
-            print(f"[Auth] 路径在白名单中，允许访问: {path}")
-            return await call_next(request)
+        path = scope.get("root_path", "") + scope["path"]
+        if self.is_white_path(path):
+            logger.debug("路径在白名单中，允许访问: %s", path)
+            await self.app(scope, receive, send)
+            return
             
         try:
             # 从请求头获取token
-            auth_header = request.headers.get("Authorization")
+            auth_header = Headers(scope=scope).get("Authorization")
             if not auth_header or not auth_header.startswith("Bearer "):
-                print(f"[Auth] 未提供认证凭据: {path}")
-                return JSONResponse(
+                logger.info("未提供认证凭据: %s", path)
+                response = JSONResponse(
                     status_code=200,
                     content={
                         "code": 401,
@@ -84,29 +94,26 @@ class AuthMiddleware(BaseHTTPMiddleware):
                         "data": None
                     }
                 )
+                await response(scope, receive, send)
+                return
 
             token = auth_header.split(" ")[1]
 
-            # 解析token
-            token_data = decode_jwt_token(token)
-
-            # 将用户信息保存到request.state
-            request.state.user = {
-                "user_id": token_data.user_id,
-                "account": token_data.account,
-                "user_type": token_data.user_type,
-                "organization_id": token_data.organization_id,
-                "enterprise_id": token_data.enterprise_id
-            }
+            # 解析token（同一token的重复请求命中缓存，不再校验签名）
+            token_data = decode_jwt_token_cached(token)
 
-            logger.debug(f"用户信息: {request.state.user}")
-
-            return await call_next(request)
+            # 已退出登录的token（通常命中进程内缓存，不访问Redis）
+            if await TokenBlacklistService.is_blacklisted(token):
+                raise BusinessException(
+                    code=401,
+                    message="登录已失效，请重新登录",
+                    data="token_revoked"
+                )
 
         except BusinessException as e:
             # 业务异常直接返回JSON响应
-            print(f"[Auth] BusinessException: {e.message}")
-            return JSONResponse(
+            logger.info("认证失败: %s %s", path, e.message)
+            response = JSONResponse(
                 status_code=200,
                 content={
                     "code": e.code,
@@ -114,14 +121,32 @@ class AuthMiddleware(BaseHTTPMiddleware):
                     "data": e.data
                 }
             )
+            await response(scope, receive, send)
+            return
         except Exception as e:
             # 其他异常转换为认证失败
-            logger.error(f"认证失败: {str(e)}")
-            return JSONResponse(
+            logger.error("认证失败: %s", e)
+            response = JSONResponse(
                 status_code=200,
                 content={
                     "code": 401,
                     "message": "认证失败",
                     "data": None
                 }
-            )
\ No newline at end of file
+            )
+            await response(scope, receive, send)
+            return
+
+        # 将用户信息保存到request.state（Request.state 读取 scope["state"]）
+        user = {
+            "user_id": token_data.user_id,
+            "account": token_data.account,
+            "user_type": token_data.user_type,
+            "organization_id": token_data.organization_id,
+            "enterprise_id": token_data.enterprise_id
+        }
+        scope.setdefault("state", {})["user"] = user
+
+        logger.debug("用户信息: %s", user)
+
+        await self.app(scope, receive, send)
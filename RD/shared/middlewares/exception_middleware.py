@@ -0,0 +1,62 @@
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from shared.exceptions import BusinessException
+
+class ExceptionMiddleware:
+    """异常处理中间件（纯ASGI）：将未处理的异常转换为统一的JSON响应"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as exc:
+            # 响应已开始发送时无法再返回错误响应
+            if response_started:
+                raise
+            response = self.build_error_response(exc)
+            await response(scope, receive, send)
+
+    @staticmethod
+    def build_error_response(exc: Exception) -> JSONResponse:
+        if isinstance(exc, HTTPException):
+            return JSONResponse(
+                status_code=200,
+                content={
+                    "code": exc.status_code,
+                    "message": exc.detail,
+                    "data": None
+                }
+            )
+        if isinstance(exc, BusinessException):
+            return JSONResponse(
+                status_code=200,
+                content={
+                    "code": exc.code,
+                    "message": exc.message,
+                    "data": exc.data
+                }
+            )
+        return JSONResponse(
+            status_code=200,
+            content={
+                "code": 500,
+                "message": str(exc),
+                "data": None
+            }
+        )
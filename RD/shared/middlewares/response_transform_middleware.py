@@ -0,0 +1,178 @@
+"""
+响应转换中间件（纯ASGI）
+一次解析、一次遍历同时完成 key 驼峰转换和日期时间格式化，替代依次叠加的 CamelCaseMiddleware 和 DatetimeMiddleware
+"""
+
+import json
+import logging
+import re
+from datetime import datetime
+from typing import Any, Optional
+
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from pydantic.utils import lenient_issubclass
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from shared.schemas.base import is_camel_serialized
+from shared.utils.case_util import to_camel_case
+
+logger = logging.getLogger(__name__)
+
+# ISO 8601 日期时间格式的正则表达式模式
+ISO_DATETIME_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:\d{2})?$')
+
+# 序列化时已完成转换的响应带有该内部响应头，中间件直接放行并移除该头
+TRANSFORMED_HEADER = "x-response-transformed"
+
+
+def format_datetime_str(value: str) -> str:
+    """将ISO格式的时间字符串格式化为 YYYY-MM-DD HH:mm:ss（不进行时区转换），不是时间字符串时原样返回"""
+    if len(value) < 19 or value[10] != 'T' or not ISO_DATETIME_PATTERN.match(value):
+        return value
+    try:
+        datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        return value
+    return f"{value[:10]} {value[11:19]}"
+
+
+def transform_response_data(data: Any, camel_case: bool = True, format_datetime: bool = True) -> Any:
+    """
+    一次遍历完成响应数据转换
+
+    - 字典的 key 转换为驼峰格式
+    - 字典中ISO格式的时间字符串格式化为 YYYY-MM-DD HH:mm:ss（列表中的字符串元素不处理）
+    """
+    if isinstance(data, dict):
+        result = {}
+        for key, value in data.items():
+            if isinstance(value, str):
+                if format_datetime:
+                    value = format_datetime_str(value)
+            elif isinstance(value, (dict, list)):
+                value = transform_response_data(value, camel_case, format_datetime)
+            if camel_case and isinstance(key, str):
+                key = to_camel_case(key)
+            result[key] = value
+        return result
+    if isinstance(data, list):
+        return [
+            transform_response_data(item, camel_case, format_datetime) if isinstance(item, (dict, list)) else item
+            for item in data
+        ]
+    return data
+
+
+class TransformedJSONResponse(JSONResponse):
+    """
+    序列化时直接完成转换的JSON响应
+
+    作为 FastAPI 的 default_response_class 使用，路由返回值在生成响应体时转换，
+    响应转换中间件不再重复解析
+    """
+
+    def __init__(self, content: Any, *args, headers: Optional[dict] = None, **kwargs):
+        headers = dict(headers or {})
+        headers[TRANSFORMED_HEADER] = "1"
+        super().__init__(content, *args, headers=headers, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        return super().render(transform_response_data(content))
+
+
+class CamelModelJSONResponse(TransformedJSONResponse):
+    """响应模型已按驼峰别名序列化的JSON响应：只做日期格式化，不再转换 key"""
+
+    def render(self, content: Any) -> bytes:
+        return JSONResponse.render(self, transform_response_data(content, camel_case=False))
+
+
+class TransformedJSONRoute(APIRoute):
+    """
+    路由类：响应模型（含嵌套模型）的别名已全部是驼峰格式时（见 CamelResponseModel），
+    使用 CamelModelJSONResponse，序列化结果直接输出，省去 key 转换
+    """
+
+    def get_route_handler(self):
+        response_class = self.response_class.value if isinstance(self.response_class, DefaultPlaceholder) else self.response_class
+        if (
+            response_class is TransformedJSONResponse
+            and self.response_model_by_alias
+            and lenient_issubclass(self.response_model, BaseModel)
+            and is_camel_serialized(self.response_model)
+        ):
+            self.response_class = CamelModelJSONResponse
+        return super().get_route_handler()
+
+
+class ResponseTransformMiddleware:
+    """
+    响应转换中间件
+
+    只处理带 content-length 的 application/json 响应（StreamingResponse 等流式响应和非JSON响应原样透传），
+    已在序列化时转换的响应（TransformedJSONResponse）直接放行。
+    """
+
+    def __init__(self, app: ASGIApp, camel_case: bool = True, format_datetime: bool = True):
+        self.app = app
+        self.camel_case = camel_case
+        self.format_datetime = format_datetime
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        body_parts = []
+        passthrough = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if TRANSFORMED_HEADER in headers:
+                    del headers[TRANSFORMED_HEADER]
+                    passthrough = True
+                elif headers.get("content-type") != "application/json" or "content-length" not in headers:
+                    passthrough = True
+
+                if passthrough:
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body_parts.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = self._transform_body(b"".join(body_parts))
+            headers = MutableHeaders(scope=start_message)
+            headers["content-length"] = str(len(body))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _transform_body(self, body: bytes) -> bytes:
+        """转换JSON响应体，处理失败时返回原始响应体"""
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return body
+        try:
+            data = transform_response_data(data, self.camel_case, self.format_datetime)
+            return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+        except Exception as e:
+            logger.warning(f"响应转换失败: {e}")
+            return body
@@ -11,6 +11,8 @@ from shared.models.tasks import Tasks
 from shared.models.virtual_order_pool import VirtualOrderPool
 from shared.models.virtual_order_reports import VirtualOrderReports
 from shared.models.virtual_customer_service import VirtualCustomerService
+from shared.models.subsidy_ledger import SubsidyLedger
+from shared.models.task_accepted_student import TaskAcceptedStudent
 
 # 资源库系统模型
 from shared.models.resource_categories import ResourceCategories
@@ -32,6 +34,8 @@ __all__ = [
     'VirtualOrderPool',
     'VirtualOrderReports',
     'VirtualCustomerService',
+    'SubsidyLedger',
+    'TaskAcceptedStudent',
     'ResourceCategories',
     'ResourceUploadBatches',
     'ResourceImages',
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Numeric, Boolean, Index
+from shared.database.session import Base
+from datetime import datetime
+
+class SubsidyLedger(Base):
+    """学生补贴流水表（只追加），由物化器增量汇总到 virtual_order_pool"""
+    __tablename__ = "virtual_order_subsidy_ledger"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    pool_id = Column(Integer, nullable=False, comment="补贴池ID，关联virtual_order_pool表的id")
+    student_id = Column(Integer, nullable=False, index=True, comment="学生ID，关联userinfo表的roleId")
+    event_type = Column(String(20), nullable=False, comment="事件类型：allocate-分配, complete-完成, recycle-价值回收, expire-过期释放, adjust-调整")
+    remaining_delta = Column(Numeric(10, 2), nullable=False, default=0.00, comment="剩余金额变动")
+    completed_delta = Column(Numeric(10, 2), nullable=False, default=0.00, comment="已完成任务金额变动")
+    consumed_delta = Column(Numeric(10, 2), nullable=False, default=0.00, comment="实际消耗补贴变动")
+    task_id = Column(Integer, nullable=True, comment="关联任务ID")
+    remark = Column(String(255), nullable=True, comment="备注")
+    is_materialized = Column(Boolean, nullable=False, default=False, comment="是否已汇总到补贴池")
+    materialized_at = Column(DateTime, nullable=True, comment="汇总时间")
+    created_at = Column(DateTime, nullable=False, default=datetime.now, comment="创建时间")
+
+    __table_args__ = (
+        Index('idx_materialized_id', 'is_materialized', 'id'),
+        Index('idx_pool_materialized', 'pool_id', 'is_materialized'),
+    )
+
+    def __repr__(self):
+        return f"<SubsidyLedger(id={self.id}, pool_id={self.pool_id}, event_type='{self.event_type}', remaining_delta={self.remaining_delta})>"
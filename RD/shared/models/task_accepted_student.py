@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, Index
+from shared.database.session import Base
+
+class TaskAcceptedStudent(Base):
+    """任务接取人映射表：tasks.accepted_by（逗号分隔的ID）拆分后的规范化记录，由数据库触发器维护"""
+    __tablename__ = "task_accepted_students"
+
+    task_id = Column(Integer, primary_key=True, comment="任务ID，关联tasks表的id")
+    student_id = Column(Integer, primary_key=True, comment="接取人ID，与tasks.accepted_by中保存的ID一致")
+
+    __table_args__ = (
+        Index('idx_student_task', 'student_id', 'task_id'),
+    )
+
+    def __repr__(self):
+        return f"<TaskAcceptedStudent(task_id={self.task_id}, student_id={self.student_id})>"
@@ -1,10 +1,10 @@
-from sqlalchemy import Column, String, Integer, DateTime, Numeric, Date
+from sqlalchemy import Column, String, Integer, DateTime, Numeric, Date, Boolean, UniqueConstraint
 from sqlalchemy.orm import relationship
 from shared.database.session import Base
 from datetime import datetime
 
 class VirtualOrderReports(Base):
-    """虚拟订单统计报表模型"""
+    """虚拟订单统计报表模型（按日、按学生汇总，student_id=0 为当日全部虚拟任务汇总）"""
     __tablename__ = "virtual_order_reports"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
@@ -20,8 +20,16 @@ class VirtualOrderReports(Base):
     total_amount_completed = Column(Numeric(10, 2), default=0.00, comment="当日完成任务总金额")
     total_amount_expired = Column(Numeric(10, 2), default=0.00, comment="当日过期任务总金额")
     remaining_subsidy = Column(Numeric(10, 2), default=0.00, comment="剩余补贴金额")
+    tasks_completed_on_day = Column(Integer, default=0, comment="当日完成（按完成时间）任务数")
+    amount_completed_on_day = Column(Numeric(10, 2), default=0.00, comment="当日完成（按完成时间）任务总金额")
+    active_students = Column(Integer, default=0, comment="当日有任务活动的学生数")
+    is_closed = Column(Boolean, default=False, comment="是否已关账：关账后不再刷新")
     created_at = Column(DateTime, default=datetime.now, comment="创建时间")
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment="更新时间")
 
+    __table_args__ = (
+        UniqueConstraint('student_id', 'report_date', name='uk_student_date'),
+    )
+
     def __repr__(self):
         return f"<VirtualOrderReports(id={self.id}, student_name='{self.student_name}', report_date={self.report_date})>"
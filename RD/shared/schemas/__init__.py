@@ -5,16 +5,20 @@
 
 from .base import (
     CamelCaseModel,
+    CamelResponseModel,
     BaseResponseModel,
     BaseRequestModel,
     SnakeCaseModel,
-    to_camel
+    to_camel,
+    is_camel_serialized
 )
 
 __all__ = [
     'CamelCaseModel',
+    'CamelResponseModel',
     'BaseResponseModel', 
     'BaseRequestModel',
     'SnakeCaseModel',
-    'to_camel'
+    'to_camel',
+    'is_camel_serialized'
 ]
\ No newline at end of file
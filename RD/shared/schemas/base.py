@@ -4,9 +4,13 @@
 """
 
 from pydantic import BaseModel
-from typing import Any
+from pydantic.fields import ModelField, MAPPING_LIKE_SHAPES
+from pydantic.utils import lenient_issubclass
+from typing import Any, Optional, Set, Type
 import re
 
+from shared.utils.case_util import to_camel_case
+
 
 def to_camel(snake_str: str) -> str:
     """
@@ -70,6 +74,48 @@ class BaseResponseModel(BaseModel):
         extra = 'allow'
 
 
+class CamelResponseModel(BaseModel):
+    """
+    驼峰输出的响应模型
+
+    驼峰别名在模型定义时由 alias_generator 一次性生成（与响应转换中间件的规则一致），
+    FastAPI 按别名序列化时直接输出驼峰 key，不再需要响应 key 转换。
+    """
+
+    class Config:
+        alias_generator = to_camel_case
+        # 允许通过字段名赋值（接口代码按下划线字段名构造数据）
+        allow_population_by_field_name = True
+
+
+def is_camel_serialized(model: Type[BaseModel], _seen: Optional[Set[type]] = None) -> bool:
+    """
+    判断模型按别名序列化后是否所有 key 都已是驼峰格式
+
+    所有字段（含嵌套模型）的别名都等于驼峰字段名，且不包含 dict/Any 等
+    key 不受模型约束的字段时返回True。
+    """
+    seen = _seen if _seen is not None else set()
+    if model in seen:
+        return True
+    seen.add(model)
+    return all(
+        field.alias == to_camel_case(field.name) and _is_camel_serialized_field(field, seen)
+        for field in model.__fields__.values()
+    )
+
+
+def _is_camel_serialized_field(field: ModelField, seen: Set[type]) -> bool:
+    if field.shape in MAPPING_LIKE_SHAPES:
+        return False
+    if field.sub_fields and not lenient_issubclass(field.type_, BaseModel) and getattr(field.type_, '__origin__', None) is not None:
+        # Union 等组合类型逐个检查
+        return all(_is_camel_serialized_field(sub_field, seen) for sub_field in field.sub_fields)
+    if lenient_issubclass(field.type_, BaseModel):
+        return is_camel_serialized(field.type_, seen)
+    return field.type_ is not Any and not lenient_issubclass(field.type_, dict) and getattr(field.type_, '__origin__', None) is not dict
+
+
 class BaseRequestModel(CamelCaseModel):
     """
     基础请求模型
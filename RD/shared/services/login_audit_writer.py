@@ -0,0 +1,170 @@
+"""
+登录日志批量写入
+登录请求只把登录事件放入内存队列，后台线程按条数或时间间隔合并为一条多行INSERT写入 login_log，
+登录耗时不再包含数据库提交，集中登录时事务数也大幅减少
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+
+from shared.models.login_log import LoginLog
+
+logger = logging.getLogger(__name__)
+
+
+class LoginAuditWriter:
+    """
+    登录日志批量写入器（进程内单例）
+
+    - 缓冲 LOGIN_AUDIT_BATCH_SIZE 条或最早一条等待超过 LOGIN_AUDIT_FLUSH_INTERVAL_MS 毫秒时写入一批
+    - 队列上限 LOGIN_AUDIT_QUEUE_SIZE，写满时丢弃新事件并告警，不阻塞登录
+    - 写入失败重试 MAX_RETRIES 次，仍失败时逐条写入，单条异常数据不影响同批其他登录日志
+    - 进程退出时写入剩余事件（进程被强制终止时缓冲中的事件会丢失）
+    """
+
+    MAX_RETRIES = 3
+    IP_MAX_LENGTH = 50  # login_log.ip 列长度
+
+    _queue: Optional[queue.Queue] = None
+    _thread: Optional[threading.Thread] = None
+    _stop_event = threading.Event()
+    _lock = threading.Lock()
+    _dropped = 0
+
+    @classmethod
+    def enqueue(cls, user_id: int, ip: str, login_time: Optional[datetime] = None) -> bool:
+        """
+        记录一次登录（不访问数据库）
+
+        Returns:
+            bool: 是否成功放入队列（user_id 或 ip 为空时不记录）
+        """
+        if user_id is None or not ip:
+            logger.warning("登录日志缺少用户ID或IP，已忽略: user_id=%s, ip=%s", user_id, ip)
+            return False
+
+        cls._ensure_started()
+        try:
+            cls._queue.put_nowait({
+                'user_id': user_id,
+                'login_time': login_time or datetime.now(),
+                'ip': str(ip)[:cls.IP_MAX_LENGTH],
+            })
+            return True
+        except queue.Full:
+            cls._dropped += 1
+            if cls._dropped % 100 == 1:
+                logger.warning("登录日志队列已满，已丢弃 %s 条登录日志", cls._dropped)
+            return False
+
+    @classmethod
+    def _ensure_started(cls) -> None:
+        if cls._thread is not None:
+            return
+        from shared.config import settings
+        with cls._lock:
+            if cls._thread is not None:
+                return
+            cls._queue = queue.Queue(maxsize=settings.LOGIN_AUDIT_QUEUE_SIZE)
+            cls._stop_event.clear()
+            cls._thread = threading.Thread(
+                target=cls._run,
+                args=(settings.LOGIN_AUDIT_BATCH_SIZE, settings.LOGIN_AUDIT_FLUSH_INTERVAL_MS / 1000),
+                name="login-audit-writer",
+                daemon=True
+            )
+            cls._thread.start()
+            atexit.register(cls.stop)
+
+    @classmethod
+    def _run(cls, batch_size: int, flush_interval: float) -> None:
+        """后台线程：收集一批事件后写入"""
+        while not cls._stop_event.is_set():
+            try:
+                first = cls._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + flush_interval
+            while len(batch) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(cls._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            cls._write(batch)
+
+        cls._drain(batch_size)
+
+    @classmethod
+    def _drain(cls, batch_size: int) -> None:
+        """写入队列中剩余的事件"""
+        batch = []
+        while True:
+            try:
+                batch.append(cls._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= batch_size:
+                cls._write(batch)
+                batch = []
+        if batch:
+            cls._write(batch)
+
+    @classmethod
+    def _write(cls, rows: List[Dict]) -> None:
+        """一条多行INSERT写入一批登录日志（一个事务），多次失败后逐条写入"""
+        for attempt in range(1, cls.MAX_RETRIES + 1):
+            try:
+                cls._insert(rows)
+                return
+            except Exception as e:
+                if attempt == cls.MAX_RETRIES:
+                    logger.warning("批量写入登录日志失败，改为逐条写入 %s 条: %s", len(rows), e)
+                    break
+                logger.warning("写入登录日志失败 (尝试 %s/%s): %s", attempt, cls.MAX_RETRIES, e)
+                time.sleep(0.5 * attempt)
+
+        dropped = 0
+        for row in rows:
+            try:
+                cls._insert([row])
+            except Exception as e:
+                dropped += 1
+                logger.error("写入登录日志失败，丢弃: user_id=%s, ip=%s, %s", row['user_id'], row['ip'], e)
+        if dropped:
+            logger.error("逐条写入登录日志完成，丢弃 %s/%s 条", dropped, len(rows))
+
+    @staticmethod
+    def _insert(rows: List[Dict]) -> None:
+        from shared.database.session import SessionLocal
+
+        db = SessionLocal()
+        try:
+            db.execute(insert(LoginLog.__table__), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @classmethod
+    def stop(cls, timeout: float = 10.0) -> None:
+        """停止后台线程并写入剩余事件（应用关闭时调用）"""
+        with cls._lock:
+            thread, cls._thread = cls._thread, None
+        if thread is None:
+            return
+        cls._stop_event.set()
+        thread.join(timeout)
@@ -0,0 +1,135 @@
+"""
+密码哈希服务
+bcrypt 计算放到有上限的进程池中执行，不占用请求线程和事件循环的CPU；
+加密轮数可配置，登录时发现已存储哈希的轮数与配置不一致会重新加密
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _checkpw(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+class PasswordHashService:
+    """
+    密码哈希服务（bcrypt）
+
+    - 进程数由 PASSWORD_HASH_WORKERS 控制（0 表示在当前线程直接计算）
+    - 加密轮数由 PASSWORD_HASH_ROUNDS 控制，每增加1轮耗时翻倍
+    """
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _executor_lock = threading.Lock()
+
+    @staticmethod
+    def rounds() -> int:
+        from shared.config import settings
+        return settings.PASSWORD_HASH_ROUNDS
+
+    @staticmethod
+    def _workers() -> int:
+        from shared.config import settings
+        if settings.PASSWORD_HASH_WORKERS >= 0:
+            return settings.PASSWORD_HASH_WORKERS
+        return min(4, os.cpu_count() or 1)
+
+    @classmethod
+    def _get_executor(cls) -> Optional[ProcessPoolExecutor]:
+        if cls._executor is None:
+            with cls._executor_lock:
+                workers = cls._workers()
+                if cls._executor is None and workers > 0:
+                    cls._executor = ProcessPoolExecutor(max_workers=workers)
+        return cls._executor
+
+    @classmethod
+    def _reset_executor(cls, broken: ProcessPoolExecutor) -> None:
+        with cls._executor_lock:
+            if cls._executor is broken:
+                cls._executor = None
+        broken.shutdown(wait=False)
+
+    @classmethod
+    def _run(cls, fn, *args):
+        """在进程池中执行并等待结果；进程池异常退出时重建一次，仍失败则在当前线程计算"""
+        for _ in range(2):
+            executor = cls._get_executor()
+            if executor is None:
+                break
+            try:
+                return executor.submit(fn, *args).result()
+            except BrokenProcessPool:
+                logger.warning("密码哈希进程池异常，重建进程池")
+                cls._reset_executor(executor)
+        return fn(*args)
+
+    @classmethod
+    async def _arun(cls, fn, *args):
+        """异步版本：等待进程池结果时不阻塞事件循环"""
+        executor = cls._get_executor()
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            logger.warning("密码哈希进程池异常，重建进程池")
+            cls._reset_executor(executor)
+            return await loop.run_in_executor(cls._get_executor(), fn, *args)
+
+    @classmethod
+    def hash(cls, password: str, rounds: Optional[int] = None) -> str:
+        """生成哈希密码（加盐加密）"""
+        return cls._run(_hashpw, password.encode('utf-8'), rounds or cls.rounds()).decode('utf-8')
+
+    @classmethod
+    def verify(cls, password: str, hashed: str) -> bool:
+        """验证密码，哈希格式无效时返回False"""
+        try:
+            return cls._run(_checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+        except ValueError:
+            return False
+
+    @classmethod
+    async def ahash(cls, password: str, rounds: Optional[int] = None) -> str:
+        return (await cls._arun(_hashpw, password.encode('utf-8'), rounds or cls.rounds())).decode('utf-8')
+
+    @classmethod
+    async def averify(cls, password: str, hashed: str) -> bool:
+        try:
+            return await cls._arun(_checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+        except ValueError:
+            return False
+
+    @classmethod
+    def needs_rehash(cls, hashed: str) -> bool:
+        """已存储哈希的加密轮数与当前配置不一致时返回True（格式：$2b$10$...）"""
+        return cls.get_rounds(hashed) not in (None, cls.rounds())
+
+    @staticmethod
+    def get_rounds(hashed: str) -> Optional[int]:
+        parts = (hashed or '').split('$')
+        if len(parts) < 4 or not parts[2].isdigit():
+            return None
+        return int(parts[2])
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """关闭进程池（应用关闭时调用）"""
+        with cls._executor_lock:
+            executor, cls._executor = cls._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
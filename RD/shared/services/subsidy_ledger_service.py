@@ -0,0 +1,251 @@
+"""
+学生补贴流水服务
+补贴池余额变动以流水形式追加写入，物化器增量汇总到 virtual_order_pool
+"""
+
+import logging
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import case, func, insert, update
+from sqlalchemy.orm import Session
+
+from shared.models.subsidy_ledger import SubsidyLedger
+from shared.models.virtual_order_pool import VirtualOrderPool
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0')
+
+# 流水中记录的余额字段 -> 补贴池字段
+DELTA_FIELDS = {
+    'remaining_delta': 'remaining_amount',
+    'completed_delta': 'completed_amount',
+    'consumed_delta': 'consumed_subsidy',
+}
+
+
+class SubsidyLedgerService:
+    """学生补贴流水服务"""
+
+    EVENT_ALLOCATE = 'allocate'  # 生成任务占用补贴
+    EVENT_COMPLETE = 'complete'  # 任务完成
+    EVENT_RECYCLE = 'recycle'  # 价值回收
+    EVENT_EXPIRE = 'expire'  # 过期任务释放
+    EVENT_ADJUST = 'adjust'  # 手动调整/校正
+
+    EVENT_TYPES = (EVENT_ALLOCATE, EVENT_COMPLETE, EVENT_RECYCLE, EVENT_EXPIRE, EVENT_ADJUST)
+
+    # 会刷新补贴池 last_allocation_at 的事件
+    ALLOCATION_EVENTS = (EVENT_ALLOCATE, EVENT_RECYCLE)
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def append(self, pool_id: int, student_id: int, event_type: str,
+               remaining_delta: Decimal = ZERO, completed_delta: Decimal = ZERO,
+               consumed_delta: Decimal = ZERO, task_id: Optional[int] = None,
+               remark: Optional[str] = None) -> int:
+        """追加一条补贴流水（不提交事务）"""
+        return self.append_many([{
+            'pool_id': pool_id,
+            'student_id': student_id,
+            'event_type': event_type,
+            'remaining_delta': remaining_delta,
+            'completed_delta': completed_delta,
+            'consumed_delta': consumed_delta,
+            'task_id': task_id,
+            'remark': remark,
+        }])
+
+    def append_many(self, entries: List[Dict[str, Any]]) -> int:
+        """
+        批量追加补贴流水（一条多行INSERT，不提交事务）
+
+        Args:
+            entries: 流水列表，字段同 SubsidyLedger
+
+        Returns:
+            int: 写入条数
+        """
+        rows = []
+        now = datetime.now()
+        for entry in entries:
+            if entry['event_type'] not in self.EVENT_TYPES:
+                raise ValueError(f"未知的补贴流水类型: {entry['event_type']}")
+            rows.append({
+                'pool_id': entry['pool_id'],
+                'student_id': entry['student_id'],
+                'event_type': entry['event_type'],
+                'remaining_delta': entry.get('remaining_delta', ZERO),
+                'completed_delta': entry.get('completed_delta', ZERO),
+                'consumed_delta': entry.get('consumed_delta', ZERO),
+                'task_id': entry.get('task_id'),
+                'remark': entry.get('remark'),
+                'is_materialized': False,
+                'created_at': now,
+            })
+
+        if rows:
+            self.db.execute(insert(SubsidyLedger), rows)
+        return len(rows)
+
+    def get_pending_deltas(self, pool_ids: Iterable[int], lock: bool = False) -> Dict[int, Dict[str, Decimal]]:
+        """
+        获取尚未汇总的流水增量（一次分组查询）
+
+        Args:
+            lock: 是否使用锁定读，读取最新已提交的流水并阻止其他事务为这些补贴池追加流水
+
+        Returns:
+            Dict[int, Dict[str, Decimal]]: {pool_id: {补贴池字段: 增量}}
+        """
+        ids = list({pid for pid in pool_ids if pid is not None})
+        if not ids:
+            return {}
+
+        query = self.db.query(
+            SubsidyLedger.pool_id,
+            func.sum(SubsidyLedger.remaining_delta),
+            func.sum(SubsidyLedger.completed_delta),
+            func.sum(SubsidyLedger.consumed_delta)
+        ).filter(
+            SubsidyLedger.pool_id.in_(ids),
+            SubsidyLedger.is_materialized == False
+        ).group_by(SubsidyLedger.pool_id)
+        if lock:
+            query = query.with_for_update()
+
+        return {
+            pool_id: {
+                'remaining_amount': remaining or ZERO,
+                'completed_amount': completed or ZERO,
+                'consumed_subsidy': consumed or ZERO,
+            }
+            for pool_id, remaining, completed, consumed in query.all()
+        }
+
+    def get_balances(self, pools: List[VirtualOrderPool], lock: bool = False) -> Dict[int, Dict[str, Decimal]]:
+        """
+        获取补贴池的实时余额（已汇总余额 + 未汇总流水）
+
+        基于余额计算并追加流水时，补贴池需以 with_for_update() 加载并传入 lock=True
+
+        Returns:
+            Dict[int, Dict[str, Decimal]]: {pool_id: {remaining_amount, completed_amount, consumed_subsidy}}
+        """
+        pending = self.get_pending_deltas((pool.id for pool in pools), lock=lock)
+        balances = {}
+        for pool in pools:
+            deltas = pending.get(pool.id, {})
+            balances[pool.id] = {
+                field: (getattr(pool, field) or ZERO) + deltas.get(field, ZERO)
+                for field in DELTA_FIELDS.values()
+            }
+        return balances
+
+    def materialize(self, batch_size: int = 1000) -> int:
+        """
+        增量汇总一批未处理的流水到补贴池（不提交事务）
+
+        使用 SKIP LOCKED 领取流水，多个进程同时执行时不会重复汇总。
+        每批只对涉及的补贴池执行一条累加UPDATE。
+
+        Returns:
+            int: 本批汇总的流水条数
+        """
+        entries = self.db.query(
+            SubsidyLedger.id,
+            SubsidyLedger.pool_id,
+            SubsidyLedger.event_type,
+            SubsidyLedger.remaining_delta,
+            SubsidyLedger.completed_delta,
+            SubsidyLedger.consumed_delta,
+            SubsidyLedger.created_at
+        ).filter(
+            SubsidyLedger.is_materialized == False
+        ).order_by(SubsidyLedger.id).limit(batch_size).with_for_update(skip_locked=True).all()
+
+        if not entries:
+            return 0
+
+        totals: Dict[int, Dict[str, Decimal]] = {}
+        last_allocation: Dict[int, datetime] = {}
+        for entry in entries:
+            pool_totals = totals.setdefault(entry.pool_id, {field: ZERO for field in DELTA_FIELDS})
+            for field in DELTA_FIELDS:
+                pool_totals[field] += getattr(entry, field) or ZERO
+            if entry.event_type in self.ALLOCATION_EVENTS:
+                last_allocation[entry.pool_id] = entry.created_at
+
+        pool_ids = list(totals)
+
+        def delta_case(field: str):
+            return case(
+                {pool_id: pool_totals[field] for pool_id, pool_totals in totals.items()},
+                value=VirtualOrderPool.id,
+                else_=ZERO
+            )
+
+        values = {
+            VirtualOrderPool.remaining_amount: func.greatest(
+                VirtualOrderPool.remaining_amount + delta_case('remaining_delta'), 0
+            ),
+            VirtualOrderPool.completed_amount: VirtualOrderPool.completed_amount + delta_case('completed_delta'),
+            VirtualOrderPool.consumed_subsidy: VirtualOrderPool.consumed_subsidy + delta_case('consumed_delta'),
+            VirtualOrderPool.updated_at: datetime.now(),
+        }
+        if last_allocation:
+            values[VirtualOrderPool.last_allocation_at] = case(
+                last_allocation,
+                value=VirtualOrderPool.id,
+                else_=VirtualOrderPool.last_allocation_at
+            )
+
+        self.db.execute(
+            update(VirtualOrderPool)
+            .where(VirtualOrderPool.id.in_(pool_ids))
+            .values(values)
+            .execution_options(synchronize_session=False)
+        )
+
+        self.db.execute(
+            update(SubsidyLedger)
+            .where(SubsidyLedger.id.in_([entry.id for entry in entries]))
+            .values(is_materialized=True, materialized_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+
+        logger.info(f"补贴流水汇总: {len(entries)} 条流水，涉及 {len(pool_ids)} 个补贴池")
+        return len(entries)
+
+    def supersede_pending(self, pool_ids: List[int]) -> int:
+        """
+        补贴池余额被整体重置（如每日重置）时，将其未汇总的流水标记为已汇总，不再累加
+
+        Returns:
+            int: 标记的流水条数
+        """
+        if not pool_ids:
+            return 0
+        result = self.db.execute(
+            update(SubsidyLedger)
+            .where(
+                SubsidyLedger.pool_id.in_(pool_ids),
+                SubsidyLedger.is_materialized == False
+            )
+            .values(is_materialized=True, materialized_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
+    def materialize_all(self, batch_size: int = 1000) -> int:
+        """汇总所有未处理的流水，每批提交一次"""
+        total = 0
+        while True:
+            count = self.materialize(batch_size)
+            self.db.commit()
+            total += count
+            if count < batch_size:
+                return total
@@ -0,0 +1,181 @@
+"""
+token黑名单服务
+退出登录的token写入Redis黑名单；检查时优先使用进程内缓存，未命中时只发送一条Redis命令，
+Redis连续失败时熔断，熔断期间不再访问Redis（健康检查发现Redis不可用时同样跳过）
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from shared.cache.redis_client import get_async_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    简单熔断器
+
+    连续失败 failure_threshold 次后打开，reset_timeout 秒内拒绝调用；
+    之后放行一次试探调用（半开），成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """是否允许本次调用"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            # 半开：放行一次试探调用，试探结果返回前的其他调用仍被拒绝
+            self._opened_at = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Redis已恢复，token黑名单检查熔断关闭")
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Redis连续失败 %s 次，token黑名单检查熔断 %s 秒", self._failures, self.reset_timeout)
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+
+class TokenBlacklistService:
+    """
+    token黑名单服务
+
+    - 黑名单key为token的SHA-256摘要，过期时间为token的剩余有效期
+    - 进程内缓存：已确认在黑名单中的token缓存到过期；确认不在黑名单中的token缓存 NEGATIVE_TTL 秒
+      （其他进程退出登录的token最多延迟 NEGATIVE_TTL 秒生效）
+    - Redis不可用时按不在黑名单处理（与原逻辑一致），并由熔断器跳过后续调用
+    """
+
+    KEY_PREFIX = "token_blacklist:"
+    NEGATIVE_TTL = 10  # 不在黑名单的结果缓存10秒
+    MAX_ENTRIES = 20000
+    REDIS_TIMEOUT = 0.5  # 单次Redis命令超时（秒）
+
+    # 进程内缓存：{token摘要: (是否在黑名单, expire_at)}
+    _cache: "OrderedDict[str, tuple]" = OrderedDict()
+    _lock = threading.Lock()
+    breaker = CircuitBreaker()
+
+    @staticmethod
+    def _digest(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    @classmethod
+    async def is_blacklisted(cls, token: str) -> bool:
+        """检查token是否在黑名单中（缓存未命中时一次 EXISTS 查询）"""
+        digest = cls._digest(token)
+        cached = cls._get_cached(digest)
+        if cached is not None:
+            return cached
+
+        if not cls.breaker.allow():
+            return False
+
+        redis = get_async_redis_client()
+        if redis is None:
+            return False
+        try:
+            exists = await asyncio.wait_for(redis.exists(f"{cls.KEY_PREFIX}{digest}"), cls.REDIS_TIMEOUT)
+        except Exception as e:
+            cls.breaker.record_failure()
+            logger.warning("检查token黑名单失败: %s", e)
+            return False
+
+        cls.breaker.record_success()
+        blacklisted = bool(exists)
+        cls._set_cached(digest, blacklisted, cls._token_ttl(token) if blacklisted else cls.NEGATIVE_TTL)
+        return blacklisted
+
+    @classmethod
+    async def add(cls, token: str, expire_seconds: Optional[int] = None) -> bool:
+        """
+        将token加入黑名单
+
+        Args:
+            token: JWT令牌
+            expire_seconds: 过期时间（秒），默认为token的剩余有效期
+
+        Returns:
+            bool: 是否成功写入Redis（本进程始终立即生效）
+        """
+        from shared.utils.jwt import TokenClaimsCache
+
+        digest = cls._digest(token)
+        ttl = expire_seconds if expire_seconds is not None else cls._token_ttl(token)
+        cls._set_cached(digest, True, ttl)
+        TokenClaimsCache.invalidate(token)
+
+        redis = get_async_redis_client() if cls.breaker.allow() else None
+        if redis is None:
+            logger.warning("Redis不可用，token黑名单仅在本进程生效")
+            return False
+        try:
+            await asyncio.wait_for(redis.set(f"{cls.KEY_PREFIX}{digest}", "1", ex=max(int(ttl), 1)), cls.REDIS_TIMEOUT)
+        except Exception as e:
+            cls.breaker.record_failure()
+            logger.error("将token加入黑名单失败: %s", e)
+            return False
+
+        cls.breaker.record_success()
+        return True
+
+    @staticmethod
+    def _token_ttl(token: str) -> int:
+        """token剩余有效期（秒），无法解析时使用默认有效期"""
+        from shared.config import settings
+        from shared.utils.jwt import decode_jwt_token_cached
+        try:
+            remaining = int(decode_jwt_token_cached(token).exp.timestamp() - time.time())
+            return max(remaining, 1)
+        except Exception:
+            return settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+    @classmethod
+    def _get_cached(cls, digest: str) -> Optional[bool]:
+        now = time.monotonic()
+        with cls._lock:
+            entry = cls._cache.get(digest)
+            if entry is None:
+                return None
+            blacklisted, expire_at = entry
+            if expire_at <= now:
+                del cls._cache[digest]
+                return None
+            cls._cache.move_to_end(digest)
+            return blacklisted
+
+    @classmethod
+    def _set_cached(cls, digest: str, blacklisted: bool, ttl: float) -> None:
+        with cls._lock:
+            cls._cache[digest] = (blacklisted, time.monotonic() + ttl)
+            cls._cache.move_to_end(digest)
+            while len(cls._cache) > cls.MAX_ENTRIES:
+                cls._cache.popitem(last=False)
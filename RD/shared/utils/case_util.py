@@ -0,0 +1,16 @@
+"""
+命名格式转换工具
+"""
+
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4096)
+def to_camel_case(snake_str: str) -> str:
+    """
+    将下划线格式转换为驼峰格式
+
+    响应中反复出现的是少量固定的 key，转换结果按 LRU 缓存（有上限，避免动态 key 无限增长）
+    """
+    components = snake_str.split('_')
+    return components[0] + ''.join(x.title() for x in components[1:])
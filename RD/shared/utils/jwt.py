@@ -1,6 +1,10 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
+import hashlib
 import os
+import threading
+import time
 from dotenv import load_dotenv
 import logging
 
@@ -11,8 +15,6 @@ from pydantic import BaseModel
 from shared.exceptions import BusinessException
 from shared.schemas.common import ResponseSchema
 
-# 配置日志
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 # 加载环境变量
@@ -86,13 +88,8 @@ def decode_jwt_token(token: str) -> TokenData:
         BusinessException: token无效或已过期时抛出
     """
     try:
-        logger.debug(f"开始解析token: {token}")
-        logger.debug(f"使用的SECRET_KEY: {SECRET_KEY}")
-        logger.debug(f"使用的ALGORITHM: {ALGORITHM}")
-        
         # 解码token
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        logger.debug(f"解码后的payload: {payload}")
         
         # 提取必要字段
         user_id = payload.get("user_id")
@@ -100,11 +97,9 @@ def decode_jwt_token(token: str) -> TokenData:
         user_type = payload.get("user_type")
         exp = payload.get("exp")
         
-        logger.debug(f"提取的字段: user_id={user_id}, account={account}, user_type={user_type}, exp={exp}")
-        
         # 检查必要字段
         if not all([isinstance(user_id, int), isinstance(account, str), isinstance(user_type, int), isinstance(exp, int)]):
-            logger.error("缺少必要字段或字段类型错误")
+            logger.warning("Token缺少必要字段或字段类型错误")
             raise BusinessException(
                 code=401,
                 message="无效的认证凭据",
@@ -114,10 +109,8 @@ def decode_jwt_token(token: str) -> TokenData:
         # 检查token是否过期
         exp_datetime = datetime.fromtimestamp(exp)
         now = datetime.now()
-        logger.debug(f"Token过期时间: {exp_datetime}, 当前时间: {now}")
-        
         if exp_datetime < now:
-            logger.error("Token已过期")
+            logger.info("Token已过期: user_id=%s", user_id)
             raise BusinessException(
                 code=401,
                 message="登录已过期，请重新登录",
@@ -133,11 +126,10 @@ def decode_jwt_token(token: str) -> TokenData:
             enterprise_id=payload.get("enterprise_id"),
             exp=exp_datetime
         )
-        logger.debug(f"创建的TokenData对象: {token_data}")
         return token_data
         
     except JWTError as e:
-        logger.error(f"JWT解析错误: {str(e)}")
+        logger.info("JWT解析失败: %s", e)
         # 检查是否是过期错误
         if "expired" in str(e).lower():
             raise BusinessException(
@@ -152,9 +144,75 @@ def decode_jwt_token(token: str) -> TokenData:
                 data="token_invalid"
             )
     except Exception as e:
-        logger.error(f"其他错误: {str(e)}")
+        logger.warning("Token解析异常: %s", e)
         raise BusinessException(
             code=401,
             message="认证失败，请重新登录",
             data="auth_failed"
-        )
\ No newline at end of file
+        )
+
+
+class TokenClaimsCache:
+    """已验证token的解析结果缓存（LRU）
+
+    以token的SHA-256摘要为key，缓存签名校验通过后的TokenData；
+    缓存项在token的exp到期后失效，同一会话的重复请求无需再次校验签名。
+    只缓存校验成功的结果，无效token每次都会重新校验。
+    """
+
+    MAX_ENTRIES = 10000
+
+    _entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    @classmethod
+    def get(cls, token: str) -> Optional[TokenData]:
+        """获取缓存的解析结果，不存在或已过期返回None"""
+        key = cls._key(token)
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, token_data = entry
+            if expires_at <= time.time():
+                del cls._entries[key]
+                return None
+            cls._entries.move_to_end(key)
+            return token_data
+
+    @classmethod
+    def put(cls, token: str, token_data: TokenData) -> None:
+        """缓存解析结果，超出容量时淘汰最久未使用的项"""
+        expires_at = token_data.exp.timestamp()
+        if expires_at <= time.time():
+            return
+        key = cls._key(token)
+        with cls._lock:
+            cls._entries[key] = (expires_at, token_data)
+            cls._entries.move_to_end(key)
+            while len(cls._entries) > cls.MAX_ENTRIES:
+                cls._entries.popitem(last=False)
+
+    @classmethod
+    def invalidate(cls, token: str) -> None:
+        """移除token的缓存（如退出登录后）"""
+        with cls._lock:
+            cls._entries.pop(cls._key(token), None)
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._entries.clear()
+
+
+def decode_jwt_token_cached(token: str) -> TokenData:
+    """解码JWT token，优先使用已验证结果的缓存（校验失败时抛出同 decode_jwt_token）"""
+    token_data = TokenClaimsCache.get(token)
+    if token_data is None:
+        token_data = decode_jwt_token(token)
+        TokenClaimsCache.put(token, token_data)
+    return token_data
@@ -0,0 +1,154 @@
+"""
+日志配置
+统一的分级结构化日志：业务线程只把日志记录放入队列，由后台线程输出，避免同步写 stdout 阻塞请求；
+支持按模块设置日志级别（运行时可调整）和高频调试日志采样。
+"""
+
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+# LogRecord 自带的属性，其余属性视为通过 extra 传入的结构化字段
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+class StructuredFormatter(logging.Formatter):
+    """结构化日志格式：text 为 key=value，json 为单行JSON；extra 传入的字段一并输出"""
+
+    def __init__(self, fmt_type: str = 'text'):
+        super().__init__()
+        self.fmt_type = fmt_type
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {
+            'time': datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        fields.update({k: v for k, v in record.__dict__.items() if k not in _RECORD_ATTRS and not k.startswith('_')})
+        if record.exc_info:
+            fields['exc_info'] = self.formatException(record.exc_info)
+
+        if self.fmt_type == 'json':
+            return json.dumps(fields, ensure_ascii=False, default=str)
+
+        extras = ' '.join(f"{k}={v}" for k, v in fields.items() if k not in ('time', 'level', 'logger', 'message', 'exc_info'))
+        line = f"{fields['time']} {fields['level']:<7} {fields['logger']} - {fields['message']}"
+        if extras:
+            line = f"{line} | {extras}"
+        if 'exc_info' in fields:
+            line = f"{line}\n{fields['exc_info']}"
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """
+    高频调试日志采样：DEBUG 级别的日志按调用位置每 N 条保留 1 条
+
+    同一行代码产生的日志共享计数，不同位置互不影响；INFO 及以上级别不采样。
+    """
+
+    def __init__(self, sample_every: int = 1):
+        super().__init__()
+        self.sample_every = max(int(sample_every), 1)
+        self._counters: Dict[Tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.sample_every == 1:
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._counters.get(key, 0)
+            self._counters[key] = count + 1
+        if count % self.sample_every:
+            return False
+        record.sampled = f"1/{self.sample_every}"
+        return True
+
+
+def parse_module_levels(value: str) -> Dict[str, str]:
+    """解析模块级别配置，如 "shared.middlewares=WARNING,services.virtual_order_service=DEBUG" """
+    levels = {}
+    for item in (value or '').split(','):
+        name, sep, level = item.partition('=')
+        if sep and name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level: Optional[str] = None, module_levels: Optional[Dict[str, str]] = None,
+                  fmt_type: Optional[str] = None, debug_sample_every: Optional[int] = None) -> None:
+    """
+    初始化日志（重复调用时只调整级别）
+
+    未传入的参数读取配置：LOG_LEVEL、LOG_MODULE_LEVELS、LOG_FORMAT、LOG_DEBUG_SAMPLE_EVERY
+    """
+    global _listener
+    if None in (level, module_levels, fmt_type, debug_sample_every):
+        # 参数全部传入时不加载配置（如 api_gateway 不依赖数据库配置）
+        from shared.config import settings
+        level = level or settings.LOG_LEVEL
+        if module_levels is None:
+            module_levels = parse_module_levels(settings.LOG_MODULE_LEVELS)
+        fmt_type = fmt_type or settings.LOG_FORMAT
+        if debug_sample_every is None:
+            debug_sample_every = settings.LOG_DEBUG_SAMPLE_EVERY
+    level = level.upper()
+
+    with _setup_lock:
+        root = logging.getLogger()
+        root.setLevel(level)
+
+        if _listener is None:
+            stream_handler = logging.StreamHandler(sys.stdout)
+            stream_handler.setFormatter(StructuredFormatter(fmt_type))
+
+            # 日志记录放入无界队列后立即返回，由监听线程格式化并输出
+            queue_handler = QueueHandler(queue.SimpleQueue())
+            queue_handler.addFilter(SamplingFilter(debug_sample_every))
+
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            root.addHandler(queue_handler)
+
+            _listener = QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+            _listener.start()
+            atexit.register(shutdown_logging)
+
+    set_module_levels(module_levels)
+
+
+def shutdown_logging() -> None:
+    """停止后台输出线程（输出队列中剩余的日志）"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def set_module_levels(module_levels: Dict[str, str]) -> Dict[str, str]:
+    """运行时调整模块日志级别（如 {"shared.middlewares.auth_middleware": "DEBUG"}），返回调整后的级别"""
+    for name, level in module_levels.items():
+        logging.getLogger(name).setLevel(level.upper())
+    return get_module_levels()
+
+
+def get_module_levels() -> Dict[str, str]:
+    """获取根日志级别和已单独设置级别的模块"""
+    levels = {'root': logging.getLevelName(logging.getLogger().level)}
+    for name, logger in sorted(logging.Logger.manager.loggerDict.items()):
+        if isinstance(logger, logging.Logger) and logger.level != logging.NOTSET:
+            levels[name] = logging.getLevelName(logger.level)
+    return levels
@@ -1,23 +1,12 @@
-from redis.asyncio import Redis, ConnectionPool
-from shared.config import settings
+from typing import Optional
+from redis.asyncio import Redis
+from shared.cache.redis_client import get_async_redis_client
 from shared.exceptions import BusinessException
-import time
 import uuid
 import asyncio
+import logging
 
-# 创建Redis连接池
-redis_pool = ConnectionPool(
-    host=settings.REDIS_HOST,
-    port=settings.REDIS_PORT,
-    db=settings.REDIS_DB,
-    password=settings.REDIS_PASSWORD,
-    decode_responses=True,
-    socket_timeout=5.0,
-    socket_connect_timeout=5.0,
-    retry_on_timeout=True,
-    encoding='utf8',
-    max_connections=10  # 限制最大连接数
-)
+logger = logging.getLogger(__name__)
 
 class RedisUtil:
     # 统一的键前缀
@@ -26,8 +15,15 @@ class RedisUtil:
     
     @staticmethod
     async def get_redis() -> Redis:
-        """获取Redis客户端实例"""
-        return Redis(connection_pool=redis_pool)
+        """获取Redis客户端实例（统一的异步连接池，见 shared.cache.redis_client）"""
+        client = get_async_redis_client()
+        if client is None:
+            raise BusinessException(
+                code=500,
+                message="Redis服务暂时不可用，请检查Redis配置或稍后重试",
+                data=None
+            )
+        return client
     
     @staticmethod
     async def test_connection() -> bool:
@@ -40,7 +36,7 @@ class RedisUtil:
                 redis = await RedisUtil.get_redis()
                 return await redis.ping()
             except Exception as e:
-                print(f"Redis连接测试失败 (尝试 {retry_count + 1}/{max_retries}): {str(e)}")
+                logger.warning("Redis连接测试失败 (尝试 %s/%s): %s", retry_count + 1, max_retries, e)
                 retry_count += 1
                 if retry_count < max_retries:
                     await asyncio.sleep(1)  # 等待1秒后重试
@@ -67,9 +63,9 @@ class RedisUtil:
                 # 只有当写入和读取都成功时才返回True
                 if value == "1":
                     return True
-                print(f"Redis写入测试失败: 写入验证未通过")
+                logger.warning("Redis写入测试失败: 写入验证未通过")
             except Exception as e:
-                print(f"Redis写入测试失败 (尝试 {retry_count + 1}/{max_retries}): {str(e)}")
+                logger.warning("Redis写入测试失败 (尝试 %s/%s): %s", retry_count + 1, max_retries, e)
             
             retry_count += 1
             if retry_count < max_retries:
@@ -87,30 +83,22 @@ class RedisUtil:
 
 
     @staticmethod
-    async def add_token_to_blacklist(token: str, expire_seconds: int = 3600) -> bool:
-        """将token加入黑名单
+    async def add_token_to_blacklist(token: str, expire_seconds: Optional[int] = None) -> bool:
+        """将token加入黑名单（见 TokenBlacklistService.add）
         
         Args:
             token: JWT令牌
-            expire_seconds: 过期时间（秒）
+            expire_seconds: 过期时间（秒），默认为token的剩余有效期
             
         Returns:
             bool: 操作是否成功
         """
-        if not await RedisUtil.test_connection():
-            return False
-            
-        try:
-            redis = await RedisUtil.get_redis()
-            key = f"{RedisUtil.TOKEN_BLACKLIST_PREFIX}{token}"
-            return await redis.setex(key, expire_seconds, "1")
-        except Exception as e:
-            print(f"将token加入黑名单失败: {str(e)}")
-            return False
+        from shared.services.token_blacklist_service import TokenBlacklistService
+        return await TokenBlacklistService.add(token, expire_seconds)
 
     @staticmethod
     async def is_token_blacklisted(token: str) -> bool:
-        """检查token是否在黑名单中
+        """检查token是否在黑名单中（见 TokenBlacklistService.is_blacklisted）
         
         Args:
             token: JWT令牌
@@ -118,13 +106,5 @@ class RedisUtil:
         Returns:
             bool: 如果token在黑名单中返回True，否则返回False
         """
-        if not await RedisUtil.test_connection():
-            return False
-            
-        try:
-            redis = await RedisUtil.get_redis()
-            key = f"{RedisUtil.TOKEN_BLACKLIST_PREFIX}{token}"
-            return bool(await redis.get(key))
-        except Exception as e:
-            print(f"检查token黑名单失败: {str(e)}")
-            return False
\ No newline at end of file
+        from shared.services.token_blacklist_service import TokenBlacklistService
+        return await TokenBlacklistService.is_blacklisted(token)
@@ -12,8 +12,6 @@ import logging
 from shared.config import settings
 from shared.schemas.token import TokenPayload
 
-# 配置日志
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 # 配置密码上下文
@@ -42,29 +40,17 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
     try:
-        logger.debug(f"Verifying password - Plain password length: {len(plain_password)}")
-        logger.debug(f"Hashed password: {hashed_password}")
-        
-        # 生成测试哈希，看看格式是否一致
-        test_hash = pwd_context.hash(plain_password)
-        logger.debug(f"Test hash for same password: {test_hash}")
-        
-        # 验证密码
-        result = pwd_context.verify(plain_password, hashed_password)
-        logger.debug(f"Password verification result: {result}")
-        return result
+        return pwd_context.verify(plain_password, hashed_password)
     except Exception as e:
-        logger.error(f"Error in password verification: {str(e)}")
+        logger.error("Error in password verification: %s", e)
         return False
 
 def get_password_hash(password: str) -> str:
     """获取密码哈希值"""
     try:
-        hashed = pwd_context.hash(password)
-        logger.debug(f"Generated hash for new password: {hashed}")
-        return hashed
+        return pwd_context.hash(password)
     except Exception as e:
-        logger.error(f"Error generating password hash: {str(e)}")
+        logger.error("Error generating password hash: %s", e)
         raise
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User: